@@ -45,11 +45,19 @@ class AudioTimer:
             self.is_timer_active = False
             self.timer = None
         # Run the async function in the event loop
-        asyncio.run(self.no_audio_detected())
+        asyncio.run(self.on_timeout())
+
+    async def on_timeout(self):
+        try:
+            await self.no_audio_detected()
+        finally:
+            # The loop goes away with asyncio.run, so does the LM Studio connection pool opened on it
+            if self.chat is not None:
+                await self.chat.close()
 
     async def no_audio_detected(self):
         if self.history is not None:
-            if self.tts.tts_queue.empty():
+            if self.tts.utterances.empty():
                 print("No audio detected! Running self prompt...")
                 if self.prompt.self_prompt():
                     tts_reply = await self.chat.bnuuybot_completion()
@@ -7,12 +7,29 @@ import os
 import time
 import threading
 
+# Azure TTS voice settings, shared with the synthesis backend in tts_backends.py. Can preview these online.
+VOICE_NAME = "en-US-AvaMultilingualNeural"
+PITCH_PERCENTAGE = "+14%"
+RATE_PERCENTAGE = "+25%"
+
+def build_ssml(text, voice_name=VOICE_NAME, pitch_percentage=PITCH_PERCENTAGE):
+        # Create the SSML with pitch adjustment
+        return f"""
+        <speak version='1.0' xmlns='http://www.w3.org/2001/10/synthesis' xml:lang='en-US'>
+        <voice name='{voice_name}'>
+                <prosody pitch='{pitch_percentage}'>
+                {text}
+                </prosody>
+        </voice>
+        </speak>
+        """
+
 class Azure_AI():
         def __init__(self, audio_timer):
                 # Setup of Azure TTS voice settings, can preview these online.
-                self.voice_name = "en-US-AvaMultilingualNeural"
-                self.pitch_percentage = "+14%"
-                self.rate_percentage = "+25%"
+                self.voice_name = VOICE_NAME
+                self.pitch_percentage = PITCH_PERCENTAGE
+                self.rate_percentage = RATE_PERCENTAGE
 
                 # This class requires environment variables named "SPEECH_KEY" and "SPEECH_REGION"
                 self.speech_config = speechsdk.SpeechConfig(subscription=os.environ.get('SPEECH_KEY'), region=os.environ.get('SPEECH_REGION'))
@@ -35,17 +52,7 @@ class Azure_AI():
                 self.audio_timer = audio_timer
         
         def azure_tts(self, text):
-                # Create the SSML with pitch adjustment
-                ssml = f"""
-                <speak version='1.0' xmlns='http://www.w3.org/2001/10/synthesis' xml:lang='en-US'>
-                <voice name='{self.voice_name}'>
-                        <prosody pitch='{self.pitch_percentage}'>
-                        {text}
-                        </prosody>
-                </voice>
-                </speak>
-                """
-
+                ssml = build_ssml(text, self.voice_name, self.pitch_percentage)
                 speech_synthesis_result = self.speech_synthesizer.speak_ssml_async(ssml).get()
 
                 if speech_synthesis_result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
@@ -58,14 +65,21 @@ class Azure_AI():
                                         print("Error details: {}".format(cancellation_details.error_details))
                                         print("Did you set the speech resource key and region values?")
 
-        def start_continuous_listening(self, callback):
+        def start_continuous_listening(self, callback, partial_callback=None):
             def recognize_cb(evt):
                 if evt.result.reason == speechsdk.ResultReason.RecognizedSpeech:
                     callback(evt.result.text)
                 elif evt.result.reason == speechsdk.ResultReason.NoMatch:
                     print(f"No speech could be recognized: {evt.result.no_match_details}")
 
+            # Partial hypotheses while the user is still talking
+            def recognizing_cb(evt):
+                if evt.result.reason == speechsdk.ResultReason.RecognizingSpeech:
+                    partial_callback(evt.result.text)
+
             self.speech_recognizer.recognized.connect(recognize_cb)
+            if partial_callback:
+                self.speech_recognizer.recognizing.connect(recognizing_cb)
             self.speech_recognizer.session_started.connect(lambda evt: print('Azure STT: Session started'))
             self.speech_recognizer.session_stopped.connect(lambda evt: print('Azure STT: Session stopped'))
             self.speech_recognizer.canceled.connect(lambda evt: print(f'Azure STT: Canceled. Reason: {evt.reason}'))
@@ -0,0 +1,63 @@
+"""
+Description: CPU latency of the classifier and embedding models for each model backend.
+
+Usage: python benchmarks/bench_backends.py [backends...]    (default: torch quantized onnx)
+"""
+
+import os
+import statistics
+import sys
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")  # Force CPU, this is what the backends are for
+from model_backends import BACKENDS, load_pipeline, load_embedder
+
+SENTENCES = [
+    "I love pizza so much!",
+    "Yes please.",
+    "Remember that my favourite colour is blue.",
+    "What are we streaming tonight?",
+    "I've been working on my Live2D rig all day and I'm exhausted.",
+]
+RUNS = 20
+
+def time_calls(call):
+    call(SENTENCES[0])  # Warm up
+    latencies = []
+    for _ in range(RUNS):
+        for sentence in SENTENCES:
+            start = time.perf_counter()
+            call(sentence)
+            latencies.append(time.perf_counter() - start)
+    return statistics.median(latencies) * 1000, statistics.quantiles(latencies, n=20)[-1] * 1000
+
+def main():
+    backends = sys.argv[1:] or list(BACKENDS)
+    intent_labels = ["question", "statement", "command", "remember that"]
+    print(f"{'backend':<10} {'model':<12} {'load':>8} {'p50':>9} {'p95':>9}")
+    for backend in backends:
+        loaders = {
+            "emotion": lambda: load_pipeline("text-classification", "SamLowe/roberta-base-go_emotions", backend, top_k=None),
+            "sentiment": lambda: load_pipeline("sentiment-analysis", "sachin19566/distilbert_Yes_No_Other_Intent", backend),
+            "classifier": lambda: load_pipeline("zero-shot-classification", "facebook/bart-large-mnli", backend),
+            "embedder": lambda: load_embedder(backend),
+        }
+        for name, loader in loaders.items():
+            try:
+                start = time.perf_counter()
+                model = loader()
+                load_time = time.perf_counter() - start
+            except ImportError as e:
+                print(f"{backend:<10} {name:<12} skipped ({e})")
+                continue
+            if name == "classifier":
+                call = lambda text: model(text, intent_labels)
+            elif name == "embedder":
+                call = model.encode
+            else:
+                call = model
+            p50, p95 = time_calls(call)
+            print(f"{backend:<10} {name:<12} {load_time:7.1f}s {p50:7.1f}ms {p95:7.1f}ms")
+
+if __name__ == '__main__':
+    main()
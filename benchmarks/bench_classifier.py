@@ -0,0 +1,137 @@
+"""
+Description: Compares the embedding classifier with the bart-large-mnli zero-shot path.
+Reports category accuracy on the topic fixtures in tests/test_classify.py, intent accuracy on the labelled
+utterances in INTENT_FIXTURES, how often each mode agrees with NLI on both, and latency per utterance.
+
+Usage: python benchmarks/bench_classifier.py
+"""
+
+import ast
+import os
+import statistics
+import sys
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from transformers import pipeline
+from sentence_transformers import SentenceTransformer
+from zero_shot import ZeroShotEngine, EmbeddingClassifier
+from preferences import PreferenceClassifier
+from llm_models import INTENT_EXAMPLES
+
+# test_classify.py uses a few names that differ from PreferenceClassifier.categories
+EXPECTED_TO_CATEGORY = {"hobby": "hobbies", "video games": "video_games"}
+FIXTURES = os.path.join(os.path.dirname(__file__), '..', 'tests', 'test_classify.py')
+INTENT_LABELS = ["question", "statement", "command", "remember that"]
+# Hand labelled, none of them are in INTENT_EXAMPLES so the embedding prototypes don't get to see the answers
+INTENT_FIXTURES = [
+    ("Do you like cats or dogs better?", "question"),
+    ("What song should we play next?", "question"),
+    ("Is it going to snow this weekend?", "question"),
+    ("Where did you learn to draw like that?", "question"),
+    ("I finished my Live2D rig last night.", "statement"),
+    ("My cat knocked over my water again.", "statement"),
+    ("The new Zelda game is really hard.", "statement"),
+    ("I had pancakes for breakfast.", "statement"),
+    ("Read the next chat message out loud.", "command"),
+    ("Pick a number between one and ten.", "command"),
+    ("Give me three ideas for a stream title.", "command"),
+    ("Turn the music down a bit.", "command"),
+    ("Remember that my birthday is in March.", "remember that"),
+    ("Don't forget that I'm allergic to peanuts.", "remember that"),
+    ("Please remember my favourite game is Stardew Valley.", "remember that"),
+    ("Keep in mind that I stream on Tuesdays.", "remember that"),
+]
+
+def load_fixtures(path=FIXTURES):
+    # Pulls (text, expected category) pairs out of the test functions without running them.
+    fixtures = []
+    tree = ast.parse(open(path, encoding="utf-8").read())
+    for function in tree.body:
+        if not isinstance(function, ast.AsyncFunctionDef):
+            continue
+        texts, expected = [], None
+        for node in ast.walk(function):
+            if isinstance(node, ast.Assign) and getattr(node.targets[0], "id", None) == "sentence":
+                texts.append(node.value.value)
+            elif isinstance(node, ast.Call) and getattr(node.func, "attr", None) == "add" and len(node.args) == 3:
+                if isinstance(node.args[2], ast.Constant) and node.args[1].value == "Lumi":
+                    texts.append(node.args[2].value)
+            elif isinstance(node, ast.Assert) and isinstance(node.test, ast.Compare):
+                expected = node.test.left.value
+        if texts and expected:
+            fixtures.append((" ".join(texts), EXPECTED_TO_CATEGORY.get(expected, expected)))
+    return fixtures
+
+class LabelSets:
+    # Stands in for LLMModels so PreferenceClassifier registers its categories and examples with both engines.
+    def __init__(self, *engines):
+        self.engines = engines
+
+    def add_label_set(self, name, labels, hypothesis_template="This example is {}.", examples=None):
+        for engine in self.engines:
+            if isinstance(engine, EmbeddingClassifier):
+                engine.add_label_set(name, labels, hypothesis_template, examples)
+            else:
+                engine.add_label_set(name, labels, hypothesis_template)
+
+def evaluate(name, classify, fixtures, reference=None):
+    # fixtures are (text, label set, expected label). Returns the top labels so other modes can be compared with them.
+    predicted, latencies = [], []
+    for text, label_set, expected in fixtures:
+        start = time.perf_counter()
+        predicted.append(classify(text)[label_set]["labels"][0])
+        latencies.append(time.perf_counter() - start)
+    line = f"{name:<22}"
+    for label_set in ("intent", "category"):
+        indices = [i for i, fixture in enumerate(fixtures) if fixture[1] == label_set]
+        correct = sum(predicted[i] == fixtures[i][2] for i in indices)
+        line += f" {label_set} {correct}/{len(indices)} ({correct / len(indices):.0%})"
+        if reference is not None:
+            agree = sum(predicted[i] == reference[i] for i in indices)
+            line += f" ({agree / len(indices):.0%} agree with nli)"
+    print(f"{line}  p50 {statistics.median(latencies) * 1000:.1f} ms  mean {statistics.mean(latencies) * 1000:.1f} ms")
+    return predicted
+
+def main():
+    classifier = pipeline(task="zero-shot-classification", model="facebook/bart-large-mnli")
+    embedder = SentenceTransformer('all-MiniLM-L6-v2')
+    zero_shot = ZeroShotEngine(lambda: classifier)
+    embedding = EmbeddingClassifier(lambda: embedder)
+    label_sets = LabelSets(zero_shot, embedding)
+    label_sets.add_label_set("intent", INTENT_LABELS, examples=INTENT_EXAMPLES)
+    categories = PreferenceClassifier(label_sets).categories
+
+    topics = load_fixtures()
+    unknown = [expected for _, expected in topics if expected not in categories]
+    fixtures = [(text, "intent", expected) for text, expected in INTENT_FIXTURES]
+    fixtures += [(text, "category", expected) for text, expected in topics if expected in categories]
+    print(f"{len(INTENT_FIXTURES)} intent fixtures, {len(fixtures) - len(INTENT_FIXTURES)} category fixtures "
+          f"({len(unknown)} skipped with no matching category: {sorted(set(unknown))})\n")
+
+    def nli(text):
+        zero_shot.result_cache.clear()  # Measure a cold pass, not the per-utterance cache
+        return zero_shot([text])[0]
+
+    def embedding_only(text):
+        return embedding([text])[0]
+
+    fallbacks = 0
+
+    def embedding_with_fallback(text):
+        # What LLMModels.run_zero_shot does in "embedding" mode, only the unsure label sets go to NLI
+        nonlocal fallbacks
+        results = embedding([text])[0]
+        unsure = [name for name, result in results.items() if not result["confident"]]
+        if unsure:
+            fallbacks += len(unsure)
+            nli_results = nli(text)
+            results = {**results, **{name: nli_results[name] for name in unsure}}
+        return results
+
+    reference = evaluate("nli (bart-large-mnli)", nli, fixtures)
+    evaluate("embedding only", embedding_only, fixtures, reference)
+    evaluate("embedding + fallback", embedding_with_fallback, fixtures, reference)
+    print(f"\nNLI fallbacks: {fallbacks} label sets over {len(fixtures)} fixtures")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Description: Insert time and query latency of the memory backends at a few collection sizes,
+searching everything and searching one user's memories (memories are spread over USERS users).
+Uses random 384-dim vectors, so no embedder or Qdrant server is needed (Qdrant runs in ":memory:" mode when installed).
+
+Usage: python benchmarks/bench_memory.py [sizes...]    (default: 1000 10000 100000)
+"""
+
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+import numpy as np
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from memory_backends import NumpyBackend, QdrantBackend
+
+SIZE = 384
+QUERIES = 200
+BATCH = 1000
+USERS = 100
+
+def backends(directory):
+    yield "numpy int8", lambda: NumpyBackend("bench_int8", directory=directory, dtype="int8")
+    yield "numpy float16", lambda: NumpyBackend("bench_float16", directory=directory, dtype="float16")
+    yield "qdrant memory", lambda: QdrantBackend("bench", location=":memory:")
+
+def main():
+    sizes = [int(size) for size in sys.argv[1:]] or [1000, 10000, 100000]
+    rng = np.random.default_rng(0)
+    print(f"{'backend':<14} {'points':>8} {'insert':>9} {'p50':>9} {'p95':>9} {'user p50':>9} {'user p95':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            vectors = rng.standard_normal((size, SIZE)).astype(np.float32)
+            queries = vectors[rng.integers(0, size, QUERIES)] + 0.1 * rng.standard_normal((QUERIES, SIZE)).astype(np.float32)
+            for name, make in backends(os.path.join(tmp, str(size))):
+                try:
+                    backend = make()
+                except ImportError as e:
+                    print(f"{name:<14} {size:>8} skipped ({e})")
+                    continue
+                backend.create_collection(SIZE)
+                start = time.perf_counter()
+                for first in range(0, size, BATCH):
+                    batch = vectors[first:first + BATCH]
+                    payloads = [{"content": "memory", "user_id": f"user{(first + i) % USERS}"} for i in range(len(batch))]
+                    backend.upsert([str(uuid.uuid4()) for _ in batch], batch, payloads)
+                insert_time = time.perf_counter() - start
+
+                columns = []
+                for user_id in (None, "user7"):
+                    latencies = []
+                    for query in queries:
+                        start = time.perf_counter()
+                        backend.search(query, limit=20, score_threshold=0.3, user_id=user_id, with_vectors=True)
+                        latencies.append(time.perf_counter() - start)
+                    columns += [statistics.median(latencies) * 1000, statistics.quantiles(latencies, n=20)[-1] * 1000]
+                print(f"{name:<14} {size:>8} {insert_time:8.2f}s " + " ".join(f"{ms:7.2f}ms" for ms in columns))
+                if hasattr(backend, "close"):
+                    backend.close()
+
+if __name__ == "__main__":
+    main()
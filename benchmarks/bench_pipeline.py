@@ -0,0 +1,280 @@
+"""
+Description: Drives NodeRegistry through a scripted conversation with every live service swapped for a
+deterministic local stand-in, and reports turns/sec, p50/p95 per stage (from tracing.py) and memory use.
+  - STT: scripted utterances, spoken as growing partials followed by the final, through the real TurnQueue
+  - LLM: MockLMStudio streaming at a configurable token rate, with llama.cpp style prompt caching
+  - Classifiers, embedder and summarizer: stand-in pipelines on the real InferenceService, with fixed delays
+  - Memory: the NumPy backend in a temporary directory, seeded with MEMORIES generated memories
+  - TTS: a null audio sink that records when audio would have started and drops it
+Nothing needs Azure, LM Studio, Qdrant or any model weights, so runs can be compared between changes.
+
+Usage: python benchmarks/bench_pipeline.py [turns] [tokens_per_second] [results.json]    (default: 40 turns, 60 tokens/s)
+"""
+
+import asyncio
+import contextlib
+import io
+import json
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import zlib
+import numpy as np
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from inference import InferenceService
+from messages import ChatHistory, RollingSummary, approximate_tokens
+from tests.mock_lm_studio import MockLMStudio
+from tracing import tracer, percentile
+from turns import Turn, TurnQueue
+
+PROMPT_TOKENS_PER_SECOND = 2000
+WORD_DELAY = 0.02  # Seconds between partial hypotheses while an utterance is "spoken"
+MEMORIES = 2000
+SIZE = 384
+# Seconds per call of each stand-in model, roughly what the real pipelines take on a mid range GPU
+MODEL_DELAYS = {"emotion": 0.015, "zero_shot": 0.04, "sentiment": 0.015, "summarizer": 0.2, "embedder": 0.005}
+CONVERSATION = [
+    "Hi Bunny! How are you doing today?",
+    "I had strawberry cake for lunch and it was so tasty.",
+    "What colour do you think I like the most?",
+    "I've been working on my Live2D rig all day, the hair physics just won't behave.",
+    "Remember that my favourite game is Stardew Valley.",
+    "Yes, please remember it.",
+    "Do you know what I've been learning since the summer?",
+    "Hey Bunny",
+    "Chat wants to know if you'd ever play a horror game on stream.",
+    "I really dislike green peas, they are the worst.",
+]
+REPLIES = [
+    "Hi Lumi! I'm doing great, thanks for asking. What are we up to today?",
+    "Strawberry cake? That sounds amazing, I'm so jealous right now.",
+    "Hmm, I'm going to guess blue. Am I right?",
+    "Oh no, hair physics are the worst! Want to take a break and come back to it later?",
+    "Ooh, do you want me to remember that your favourite game is Stardew Valley?",
+    "Okay, I'll remember it forever, or at least until my memory gets wiped.",
+    "Python! You've been learning Python since the summer.",
+    "I'm here! What's up?",
+    "A horror game? Only if Lumi holds my paw the whole time.",
+    "Green peas are tiny little betrayals, I completely agree.",
+]
+
+def embed(text):
+    # Hashed bag of words, texts that share words are similar, and the same text always gets the same vector
+    vector = np.zeros(SIZE, dtype=np.float32)
+    for word in text.lower().split():
+        word = word.strip(".,!?'\"")
+        if word:
+            code = zlib.crc32(word.encode())
+            vector[code % SIZE] += 1.0 if code & 1 << 31 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+def stand_in(name, compute):
+    # A pipeline for InferenceService: one result per input, one delay per batch like a real forward pass
+    def pipe(texts, **kwargs):
+        time.sleep(MODEL_DELAYS[name])
+        return [compute(text) for text in texts]
+    return pipe
+
+def zero_shot(text):
+    remember = "remember that" in text.lower()
+    return {
+        "intent": {"labels": ["remember that" if remember else "chat"], "scores": [0.9 if remember else 0.3]},
+        "category": {"labels": ["food" if "cake" in text or "peas" in text else "hobbies"], "scores": [0.7]},
+    }
+
+class StandInModels:
+    # The parts of LLMModels that NodeRegistry and Completions use
+    def __init__(self, lm_studio):
+        self.lm_studio = lm_studio
+        self.inference = InferenceService()
+        self.inference.register("emotion", stand_in("emotion", lambda text: [{"label": "joy" if "!" in text else "neutral", "score": 0.9}]))
+        self.inference.register("zero_shot", stand_in("zero_shot", zero_shot))
+        self.inference.register("sentiment", stand_in("sentiment", lambda text: {"label": "Yes" if text.lower().startswith("yes") else "Other"}))
+        self.inference.register("summarizer", stand_in("summarizer", lambda text: {"summary_text": " ".join(text.split()[-80:])}))
+
+    def count_tokens(self, text):
+        return approximate_tokens(text)
+
+    def embed(self, text):
+        time.sleep(MODEL_DELAYS["embedder"])
+        return embed(text)
+
+    def embed_batch(self, texts, batch_size=64):
+        return [embed(text) for text in texts]
+
+    async def get_emotion(self, text):
+        feeling = await self.inference.run("emotion", text)
+        return feeling[0]["label"]
+
+    async def get_intent(self, text):
+        intent = (await self.classify_zero_shot(text))["intent"]
+        if intent["scores"][0] > 0.5:
+            return intent["labels"][0]
+
+    async def get_decision(self, text):
+        return (await self.inference.run("sentiment", text))["label"]
+
+    def add_label_set(self, name, labels, hypothesis_template="This example is {}.", examples=None):
+        pass
+
+    async def classify_zero_shot(self, text):
+        return await self.inference.run("zero_shot", text)
+
+    async def use_openai_functions(self, text):
+        return []
+
+    def get_lm_studio_url(self):
+        return self.lm_studio.base_url
+
+    def get_llm(self):
+        return "mock-model"
+
+class NullTimer:
+    def start_timer(self):
+        pass
+
+    def cancel_timer(self):
+        pass
+
+class ScriptedSTT:
+    # Speaks each utterance as partials a word at a time, then hands the final over like Azure's recognizer thread does
+    def __init__(self, loop, utterances, word_delay=WORD_DELAY):
+        self.turns = TurnQueue(loop)
+        self.utterances = utterances
+        self.word_delay = word_delay
+        self.partial_listeners = []
+        self.audio_timer = NullTimer()
+        self.is_listening = True
+        self.handled = threading.Event()
+        self.thread = threading.Thread(target=self.speak, daemon=True)
+
+    def add_partial_listener(self, listener):
+        self.partial_listeners.append(listener)
+
+    def speak(self):
+        for text in self.utterances:
+            words = text.split()
+            for count in range(1, len(words)):
+                time.sleep(self.word_delay)
+                for listener in self.partial_listeners:
+                    listener(" ".join(words[:count]).lower())
+            time.sleep(self.word_delay)
+            self.handled.clear()
+            self.turns.put_threadsafe(Turn(text))
+            # The user waits for the reply before saying the next thing
+            self.handled.wait()
+        self.turns.close()
+
+    async def next_turn(self):
+        return await self.turns.get()
+
+class NullTTS:
+    # Takes sentence groups like TTS.add_to_tts_queue and drops them, noting when the first one would have played
+    def __init__(self):
+        self.groups = 0
+        self.last_reply = None
+
+    def add_to_tts_queue(self, tts_reply, started_at=None):
+        # Streamed replies pass the same started_at with every piece
+        if started_at is not None and started_at != self.last_reply:
+            tracer.record("tts.first_audio", started_at)
+        self.last_reply = started_at
+        self.groups += len(tts_reply)
+
+    def end_reply(self, started_at):
+        pass
+
+async def run_conversation(turns, lm_studio, directory):
+    from nodes import NodeRegistry  # After the environment below is set, NodeRegistry picks its memory backend on init
+    models = StandInModels(lm_studio)
+    utterances = [CONVERSATION[i % len(CONVERSATION)] for i in range(turns)]
+    stt = ScriptedSTT(asyncio.get_running_loop(), utterances)
+    tts = NullTTS()
+    summary = RollingSummary(models, filename=os.path.join(directory, "summary.json"))
+    with contextlib.redirect_stdout(io.StringIO()):
+        registry = NodeRegistry(stt, tts, models, ChatHistory(token_counter=models.count_tokens), queue.Queue(), "Lumi", summary)
+        rng = np.random.default_rng(0)
+        topics = ["pizza", "guitar", "streaming", "painting", "rigging", "coffee", "horror", "farming"]
+        registry.memory.add_memories("Lumi", [
+            f"Lumi mentioned {rng.choice(topics)} and {rng.choice(topics)} on stream {i}." for i in range(MEMORIES)
+        ])
+
+    stt.thread.start()
+    start = time.perf_counter()
+    handled = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        while True:
+            turn = await stt.next_turn()
+            if turn is None:
+                break
+            lm_studio.reply = REPLIES[CONVERSATION.index(turn.text)]
+            with tracer.turn(turn.id):
+                tracer.record("stt.handoff", turn.timestamps["recognized"], turn.timestamps["dequeued"])
+                await registry.node_manager.process_current_node(turn.text)
+                turn.mark("handled")
+                tracer.record("turn", turn.timestamps["recognized"], turn.timestamps["handled"])
+            handled += 1
+            stt.handled.set()
+        # Let background analysis (preference extraction) finish before the loop goes away
+        await asyncio.gather(*registry.background_tasks, return_exceptions=True)
+    elapsed = time.perf_counter() - start
+    prefetch = registry.prefetcher.report
+    registry.prefetcher.close()
+    summary.close()
+    models.inference.shutdown()
+    return handled, elapsed, prefetch, tts.groups
+
+def main():
+    turns = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    tokens_per_second = float(sys.argv[2]) if len(sys.argv) > 2 else 60.0
+    output = sys.argv[3] if len(sys.argv) > 3 else None
+    lm_studio = MockLMStudio(chunk_delay=1 / tokens_per_second, prompt_token_delay=1 / PROMPT_TOKENS_PER_SECOND)
+    lm_studio.start()
+    cwd = os.getcwd()
+    tracer.configure()
+    tracemalloc.start()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)  # Chat logs go to .logs in the working directory
+            os.environ["BNUUY_MEMORY_BACKEND"] = "numpy"
+            os.environ["BNUUY_MEMORY_PATH"] = os.path.join(tmp, "memory")
+            before = tracemalloc.get_traced_memory()[0]
+            handled, elapsed, prefetch, groups = asyncio.run(run_conversation(turns, lm_studio, tmp))
+            current, peak = tracemalloc.get_traced_memory()
+    finally:
+        os.chdir(cwd)
+        tracemalloc.stop()
+        lm_studio.stop()
+
+    durations = {name: list(values) for name, values in tracer.durations.items()}
+    print(f"{handled} turns in {elapsed:.2f}s, {handled / elapsed:.2f} turns/s "
+          f"({tokens_per_second:.0f} tokens/s, {WORD_DELAY * 1000:.0f}ms per spoken word, {groups} sentence groups sent to TTS)")
+    print(f"Python memory: {(current - before) / 2**20:.1f}MiB retained, {(peak - before) / 2**20:.1f}MiB peak")
+    stats = prefetch()
+    print(f"{'stage':<24} {'count':>6} {'p50':>9} {'p95':>9}")
+    for name, values in sorted(durations.items()):
+        print(f"{name:<24} {len(values):>6} {percentile(values, 0.5):7.1f}ms {percentile(values, 0.95):7.1f}ms")
+
+    if output:
+        results = {
+            "turns": handled,
+            "seconds": elapsed,
+            "turns_per_second": handled / elapsed,
+            "tokens_per_second": tokens_per_second,
+            "memory_retained_mib": (current - before) / 2**20,
+            "memory_peak_mib": (peak - before) / 2**20,
+            "prefetch": stats,
+            "stages": {name: {"count": len(values), "p50": percentile(values, 0.5), "p95": percentile(values, 0.95)}
+                       for name, values in durations.items()},
+        }
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved results to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Description: Prompt processing per turn for the "window" and "stable" prompt modes, against MockLMStudio
+acting like llama.cpp's prompt cache (only tokens after the prefix shared with the last request get processed).
+
+Usage: python benchmarks/bench_prompt_cache.py [turns] [budget]    (default: 60 turns, 1024 token budget)
+"""
+
+import asyncio
+import contextlib
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from chat_completions import Completions
+from messages import ChatHistory, RollingSummary
+from tests.mock_lm_studio import MockLMStudio
+
+PROMPT_TOKENS_PER_SECOND = 2000  # Roughly a 7B model's prompt processing on a mid range GPU
+USER_MESSAGES = [
+    "I love pizza so much!",
+    "What are we streaming tonight?",
+    "I've been working on my Live2D rig all day and I'm exhausted, the hair physics just won't behave.",
+    "Remember that my favourite colour is blue.",
+    "Chat says hi! They want to know what your favourite game is and whether you'd ever play a horror game on stream.",
+]
+REPLIES = [
+    "Oh my gosh, Lumi, that sounds amazing! Tell me everything, I want all the details right now.",
+    "Pizza is the best food ever invented and I will fight anyone who disagrees.",
+    "Ooh, we should play something cozy tonight. Chat has been asking for a farming game for ages!",
+    "Okay, blue it is! I'll remember that forever, or at least until my memory gets wiped.",
+    "Hi chat! My favourite game is whatever Lumi is losing at right now, hehe.",
+]
+
+class StandInSummarizer:
+    # Keeps the last 80 words instead of running distilBART, what matters here is that the summary changes
+    def run_sync(self, name, text, **kwargs):
+        return {"summary_text": " ".join(text.split()[-80:])}
+
+async def run_turns(mode, turns, budget, lm_studio, summary_path):
+    models = SimpleNamespace(
+        get_llm=lambda: "mock-model",
+        get_lm_studio_url=lambda: lm_studio.base_url,
+        inference=StandInSummarizer(),
+    )
+    history = ChatHistory()
+    summary = RollingSummary(models, filename=summary_path)
+    post = SimpleNamespace(stream_token=lambda content: None, add_to_queue=lambda *args, **kwargs: None)
+    chat_log = SimpleNamespace(update_chat_log=lambda prompt, reply: None)
+    chat = Completions(history, models, chat_log, post, summary=summary)
+    chat.context_budget = budget
+    chat.prompt_mode = mode
+
+    lm_studio.cached_prompt = []
+    lm_studio.prompt_stats.clear()
+    start = time.perf_counter()
+    for turn in range(turns):
+        # Same shape as a real turn: the transcription goes in with its instructions and the reply replaces it
+        history.add("user", "Lumi", f"{USER_MESSAGES[turn % len(USER_MESSAGES)]} This is a message from Lumi, respond.")
+        lm_studio.reply = REPLIES[turn % len(REPLIES)]
+        with contextlib.redirect_stdout(io.StringIO()):
+            await chat.bnuuybot_completion()
+    elapsed = time.perf_counter() - start
+    summary.close()
+    return list(lm_studio.prompt_stats), elapsed
+
+def main():
+    turns = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    budget = int(sys.argv[2]) if len(sys.argv) > 2 else 1024
+    lm_studio = MockLMStudio(prompt_token_delay=1 / PROMPT_TOKENS_PER_SECOND)
+    lm_studio.start()
+    print(f"{turns} turns, {budget} token budget, {PROMPT_TOKENS_PER_SECOND} prompt tokens/s")
+    print(f"{'mode':<8} {'prompt':>8} {'processed':>10} {'cached':>8} {'p50':>9} {'p95':>9} {'total':>8}")
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for mode in ("window", "stable"):
+                stats, elapsed = asyncio.run(run_turns(mode, turns, budget, lm_studio, os.path.join(tmp, f"{mode}.json")))
+                prompt = statistics.mean(s["prompt_tokens"] for s in stats)
+                processed = statistics.mean(s["processed_tokens"] for s in stats)
+                cached = sum(s["cached_tokens"] for s in stats) / sum(s["prompt_tokens"] for s in stats)
+                times = [s["processed_tokens"] / PROMPT_TOKENS_PER_SECOND * 1000 for s in stats]
+                p95 = statistics.quantiles(times, n=20)[-1]
+                print(f"{mode:<8} {prompt:8.0f} {processed:10.0f} {cached:7.0%} {statistics.median(times):7.1f}ms {p95:7.1f}ms {elapsed:7.2f}s")
+    finally:
+        lm_studio.stop()
+
+if __name__ == "__main__":
+    main()
@@ -3,60 +3,160 @@ Description: A class for handling the chat completions with the local LLM.
 """
 
 import asyncio
-from messages import TextFormatting
+import os
+import time
+import weakref
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from messages import TextFormatting, RollingSummary
+from tracing import tracer
+
+class CompletionEngine:
+    """Streams chat completion chunks from LM Studio (or any OpenAI-compatible server) without blocking the event loop."""
+    def __init__(self, base_url, model, api_key="lm-studio", temperature=0.35):
+        self.base_url = base_url
+        self.model = model
+        self.api_key = api_key
+        self.temperature = temperature
+        # httpx connection pools belong to the event loop that opened them, and the audio timer runs its own loop.
+        self.clients = weakref.WeakKeyDictionary()
+
+    def get_client(self):
+        loop = asyncio.get_running_loop()
+        client = self.clients.get(loop)
+        if client is None:
+            client = AsyncOpenAI(
+                base_url=self.base_url,
+                api_key=self.api_key,
+                http_client=DefaultAsyncHttpxClient(
+                    limits=httpx.Limits(max_connections=10, max_keepalive_connections=5)
+                ),
+            )
+            self.clients[loop] = client
+        return client
+
+    async def close(self):
+        """Closes the connection pool opened on the running loop. Call it before a short lived loop (asyncio.run) ends."""
+        client = self.clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.close()
+
+    async def stream(self, messages):
+        completion = await self.get_client().chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=self.temperature,
+            stream=True,
+        )
+        async for chunk in completion:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
 
 class Completions:
-    def __init__(self, chat_history, models, chat_log, post):
+    def __init__(self, chat_history, models, chat_log, post, tts=None, stream_tts=False, summary=None):
         self.models = models
-        self.client = self.models.lm_studio_client()
         self.model = self.models.get_llm()
+        self.engine = CompletionEngine(self.models.get_lm_studio_url(), self.model)
         self.chat_history = chat_history
         self.chat_log = chat_log
         self.post = post
-        self.text_formatting = TextFormatting(chat_history, models)
+        # Messages that scroll out of the context window are summarized in the background.
+        # Pass the same summary to every Completions sharing a chat history.
+        self.summary = summary or RollingSummary(models)
+        self.text_formatting = TextFormatting(chat_history, models, self.summary)
+        # Streaming mode sends each finished sentence to TTS while the LLM is still generating.
+        self.tts = tts
+        self.stream_tts = stream_tts and tts is not None
+        # Prompt size in tokens, the system prompt and the newest messages that fit. Leave room in the model's context for the reply.
+        self.context_budget = int(os.getenv("BNUUY_CONTEXT_TOKENS", "3072"))
+        # "stable" keeps the start of the prompt byte-identical between turns so LM Studio can reuse its prompt cache,
+        # "window" slides the context window along with every message
+        self.prompt_mode = os.getenv("BNUUY_PROMPT_MODE", "stable")
+
+    async def close(self):
+        await self.engine.close()
+
+    async def build_prompt(self):
+        if self.prompt_mode == "stable":
+            return await self.summary.stable_window(self.chat_history, self.context_budget)
+        return self.chat_history.get_context_window(self.context_budget)
 
     async def bnuuybot_completion(self):
-        completed_generation = False
-        
-        while not completed_generation:
+        while True:
+            new_message = {"role": "assistant", "content": ""}
+            sentence_buffer = ""
+            streamed_sentences = []
             try:
-                messages = self.chat_history.get_recent_messages(20)  # Adjust the number as needed
+                with tracer.span("llm.prompt", mode=self.prompt_mode):
+                    messages = await self.build_prompt()
                 user_input = self.chat_history.get_content()
-
-                completion = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
-                    temperature=0.35,
-                    stream=True,
-                )
-
-                new_message = {"role": "assistant", "content": ""}
+                request_start = time.perf_counter()
+                first_token = None
 
                 print("Bnuuy Bot: ")
-                for chunk in completion:
-                    if chunk.choices[0].delta.content:
-                        print(chunk.choices[0].delta.content, end="", flush=True)
-                        new_message["content"] += chunk.choices[0].delta.content
+                async for content in self.engine.stream(messages):
+                    if first_token is None:
+                        first_token = time.perf_counter()
+                        tracer.record("llm.first_token", request_start, first_token)
+                    print(content, end="", flush=True)
+                    new_message["content"] += content
+                    self.post.stream_token(content)
+                    if self.stream_tts:
+                        sentence_buffer += content
+                        sentences, sentence_buffer = self.text_formatting.pop_complete_sentences(sentence_buffer)
+                        await self.stream_to_tts(sentences, streamed_sentences, request_start)
+                break
+            except Exception as e:
+                print(f"Error in API call: {str(e)}")
+                if new_message["content"]:
+                    # Already on screen and maybe spoken, a retry would say it all over again. Keep what we have.
+                    print("Reply was cut off, keeping the part that was already sent.")
+                    sentence_buffer = ""  # Don't speak the half finished sentence
+                    break
+                # Nothing went out yet, try again
 
-                reply = new_message["content"]
+        try:
+            reply = new_message["content"]
+            tracer.record("llm.last_token", request_start, characters=len(reply))
+            if self.stream_tts:
+                # Whatever is left over is the last sentence without closing punctuation.
+                await self.stream_to_tts(self.text_formatting.format_sentences(sentence_buffer), streamed_sentences, request_start)
+                tts_reply = None
+            else:
                 tts_reply = asyncio.create_task(self.text_formatting.format_for_tts(reply))
 
-                # Check if tts_reply is empty before proceeding
-                if not reply.strip():  # If the reply is empty or contains only whitespace
-                    print("Warning: Context reply is empty. Skipping TTS.")
-                    print("Ready!")
-                    return
-                
-                completed_generation = True
-
-                self.post.add_to_queue("assistant", "Assistant", reply)
-                # Delete system message
-                self.chat_history.delete_most_recent()
-                # Add the assistant's response to the chat history
-                self.chat_history.add("assistant", "Assistant", new_message["content"])
-                self.chat_log.update_chat_log(user_input, new_message["content"])
-                sentence_groups = await tts_reply
-                return sentence_groups
-            except Exception as e:
-                print(f"Error in API call: {str(e)}")
-                # Log the error, maybe retry, or handle it appropriately
\ No newline at end of file
+            # Check if tts_reply is empty before proceeding
+            if not reply.strip():  # If the reply is empty or contains only whitespace
+                print("Warning: Context reply is empty. Skipping TTS.")
+                print("Ready!")
+                return
+
+            self.post.add_to_queue("assistant", "Assistant", reply)
+            # Delete system message
+            self.chat_history.delete_most_recent()
+            # Add the assistant's response to the chat history
+            self.chat_history.add("assistant", "Assistant", new_message["content"])
+            if self.prompt_mode == "window":
+                self.summary.update(self.chat_history, self.context_budget)
+            self.chat_log.update_chat_log(user_input, new_message["content"])
+            if tts_reply is None:
+                return streamed_sentences
+            sentence_groups = await tts_reply
+            return sentence_groups
+        except Exception as e:
+            print(f"Error finishing the reply: {str(e)}")
+        finally:
+            if self.stream_tts:
+                # Lets TTS go idle once the last sentence has been spoken, not in a gap between sentences
+                self.tts.end_reply(request_start)
+
+    async def stream_to_tts(self, sentences, streamed_sentences, request_start):
+        if not sentences:
+            return
+        if not streamed_sentences:
+            first_sentence_time = time.perf_counter() - request_start
+            print(f"\n[metrics] Time to first sentence: {first_sentence_time:.2f}s")
+        # Every piece of the reply carries its start time, TTS uses it to tell replies apart and logs time to first spoken word from it.
+        # Blocks while TTS is far behind, on a thread so the event loop keeps going. Reading the LLM stream waits meanwhile.
+        await asyncio.to_thread(self.tts.add_to_tts_queue, sentences, started_at=request_start)
+        streamed_sentences.extend(sentences)
@@ -0,0 +1,26 @@
+"""
+Description: Converts the old .logs/chat_log_*.json chat logs to the append-only JSONL format.
+Other JSON files in the folder, like the conversation summary, are left alone.
+
+Usage: python convert_chat_logs.py [log_dir]
+"""
+
+import glob
+import os
+import sys
+from messages import convert_chat_log
+
+def convert_chat_logs(log_dir=".logs"):
+    converted = []
+    for json_filename in sorted(glob.glob(os.path.join(log_dir, "chat_log_*.json"))):
+        try:
+            jsonl_filename = convert_chat_log(json_filename)
+        except (ValueError, TypeError, AttributeError) as e:
+            print(f"Skipped {json_filename}, it isn't an old chat log: {e}")
+            continue
+        print(f"Converted {json_filename} -> {jsonl_filename}")
+        converted.append(jsonl_filename)
+    return converted
+
+if __name__ == '__main__':
+    convert_chat_logs(sys.argv[1] if len(sys.argv) > 1 else ".logs")
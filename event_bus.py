@@ -0,0 +1,47 @@
+"""
+Description: A small thread-safe publish/subscribe bus for chat events inside the app.
+PostChat publishes to it, the Flask app keeps its message list and Server-Sent Events streams from it.
+"""
+
+import queue
+import threading
+
+class EventBus:
+    def __init__(self, max_queue_size=1000):
+        self.max_queue_size = max_queue_size
+        self.subscriptions = set()
+        self.listeners = []
+        self.lock = threading.Lock()
+
+    def subscribe(self):
+        # Returns a queue that gets every event published from now on, call unsubscribe when done.
+        subscription = queue.Queue(maxsize=self.max_queue_size)
+        with self.lock:
+            self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+    def add_listener(self, callback):
+        # Listeners run on the publishing thread, keep them quick.
+        with self.lock:
+            self.listeners.append(callback)
+
+    def publish(self, event):
+        with self.lock:
+            listeners = list(self.listeners)
+            subscriptions = list(self.subscriptions)
+        for callback in listeners:
+            callback(event)
+        for subscription in subscriptions:
+            try:
+                subscription.put_nowait(event)
+            except queue.Full:
+                # A stalled subscriber (a closed browser tab) loses its oldest event instead of blocking the app.
+                try:
+                    subscription.get_nowait()
+                except queue.Empty:
+                    pass
+                subscription.put_nowait(event)
@@ -0,0 +1,69 @@
+"""
+Description: A service that runs the transformers pipelines on a worker thread pool so they never stall the event loop.
+Requests for the same pipeline that arrive within a short window are gathered into one micro-batch.
+"""
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from tracing import tracer
+
+class InferenceService:
+    def __init__(self, batch_window=0.01, max_batch_size=16, max_workers=2):
+        self.batch_window = batch_window  # Seconds to wait for more requests before running a batch
+        self.max_batch_size = max_batch_size
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inference")
+        self.pipelines = {}
+        self.pending = {}
+        self.timers = {}  # The batch window timer of each pending batch
+
+    def register(self, name, pipe):
+        # pipe takes a list of inputs plus keyword arguments and returns one result per input.
+        self.pipelines[name] = pipe
+
+    async def run(self, name, text, **kwargs):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        # Only requests with the same arguments can share a batch.
+        key = (loop, name, repr(sorted(kwargs.items())))
+        batch = self.pending.get(key)
+        if batch is None:
+            batch = self.pending[key] = []
+            self.timers[key] = loop.call_later(self.batch_window, self.flush, key, kwargs)
+        batch.append((text, future))
+        if len(batch) >= self.max_batch_size:
+            self.flush(key, kwargs)
+        # Covers the wait for the batch window and the worker thread, which is what the turn actually pays
+        with tracer.span(f"model.{name}", batched=len(batch)):
+            return await future
+
+    def run_sync(self, name, text, **kwargs):
+        # For callers that are already on a worker thread.
+        return self.pipelines[name]([text], **kwargs)[0]
+
+    def flush(self, key, kwargs):
+        # A batch that filled up early would otherwise have its old timer cut the next batch's window short
+        timer = self.timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self.pending.pop(key, None)
+        if not batch:
+            return
+        loop, name, _ = key
+        texts = [text for text, _ in batch]
+        work = loop.run_in_executor(self.executor, functools.partial(self.pipelines[name], texts, **kwargs))
+        work.add_done_callback(lambda done: self.deliver(batch, done))
+
+    def deliver(self, batch, done):
+        if done.cancelled() or done.exception():
+            error = done.exception() if not done.cancelled() else asyncio.CancelledError()
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for (_, future), result in zip(batch, done.result()):
+            if not future.done():  # The caller may have given up on it
+                future.set_result(result)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -3,42 +3,113 @@ Description: A class for initializing LLM models and loading them to GPU.
 Also includes functions and pipelines for getting LLM responses.
 """
 
-import torch
 import json
-from openai import AsyncOpenAI, OpenAI
-from transformers import pipeline
-from sentence_transformers import SentenceTransformer
+from openai import AsyncOpenAI
+from inference import InferenceService
+from zero_shot import ZeroShotEngine, EmbeddingClassifier
+from model_cache import ModelCache
+from model_registry import ModelRegistry
+from model_backends import load_pipeline, load_embedder, load_tokenizer
+from messages import approximate_tokens
 import os
 os.environ['TF_ENABLE_ONEDNN_OPTS'] = '0'
-import tensorflow as tf
+# Nothing here uses TensorFlow, stop transformers from importing it if it happens to be installed
+os.environ.setdefault('USE_TF', '0')
 
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+# torch, transformers and sentence_transformers are only imported when the first model loads (see model_backends.py),
+# which keeps them off the startup path. Run startup_profile.py to see what each import costs.
+
+# Example utterances for the embedding classifier's intent prototypes
+INTENT_EXAMPLES = {
+        "question": ["What are you doing today?", "How was your stream?", "Can you tell me a fun fact?", "Why is the sky blue?"],
+        "statement": ["I went to the store earlier.", "I love pizza.", "That game was really fun.", "It's raining outside."],
+        "command": ["Tell me a joke.", "Say hi to chat.", "Stop talking for a second.", "Sing me a song."],
+        "remember that": ["Remember that my favourite colour is blue.", "Don't forget that I hate green peas.",
+                          "Please remember this for later.", "Keep in mind that I have a dentist appointment on Friday."],
+}
 
 class LLMModels:
-        def __init__(self):
+        def __init__(self, preload=None, wait_for_preload=None):
                 self.openai_key = os.getenv("OPENAI_API_KEY")
                 self.openai = AsyncOpenAI(api_key=self.openai_key)
 
-                self.embedder = SentenceTransformer('all-MiniLM-L6-v2', model_kwargs={"torch_dtype": "float16"}, device=device)
-                self.summarizer = pipeline("summarization", 
-                                           model="sshleifer/distilbart-cnn-6-6", 
-                                           device=device)
-                self.emotion_pipe = pipeline(task="text-classification", 
-                                             model="SamLowe/roberta-base-go_emotions", 
-                                             top_k=None, 
-                                             device=device
-                                             )
-                self.classifier = pipeline(task="zero-shot-classification", 
-                                       model="facebook/bart-large-mnli",
-                                       device=device
-                                       )
-                self.sentiment_pipe = pipeline(task="sentiment-analysis", 
-                                               model="sachin19566/distilbert_Yes_No_Other_Intent",
-                                               device=device)
+                # Models load on first use, or in the background warm-up below
+                self.registry = ModelRegistry()
+                # BNUUY_MODEL_BACKEND picks how the classifiers and embedder run: torch, quantized (int8, CPU) or onnx
+                self.backend = os.getenv("BNUUY_MODEL_BACKEND", "torch")
+                self.embedder_name = "all-MiniLM-L6-v2"
+                self.registry.register("embedder", lambda: load_embedder(self.backend, self.embedder_name))
+                self.registry.register("summarizer", lambda: load_pipeline("summarization", "sshleifer/distilbart-cnn-6-6"))
+                self.registry.register("emotion", lambda: load_pipeline("text-classification", "SamLowe/roberta-base-go_emotions", self.backend, top_k=None))
+                self.registry.register("classifier", lambda: load_pipeline("zero-shot-classification", "facebook/bart-large-mnli", self.backend))
+                self.registry.register("sentiment", lambda: load_pipeline("sentiment-analysis", "sachin19566/distilbert_Yes_No_Other_Intent", self.backend))
+                # BNUUY_TOKENIZER is a Hugging Face tokenizer matching the chat model, used to count context tokens.
+                # Without it token counts are estimated from the text length.
+                self.tokenizer_name = os.getenv("BNUUY_TOKENIZER")
+                if self.tokenizer_name:
+                        self.registry.register("tokenizer", lambda: load_tokenizer(self.tokenizer_name))
+                # Repeated utterances skip the models, set BNUUY_MODEL_CACHE_PATH to keep the cache between sessions
+                self.cache = ModelCache(path=os.getenv("BNUUY_MODEL_CACHE_PATH"))
+                # Pipelines run on worker threads in micro-batches, see inference.py
+                self.inference = InferenceService()
+                self.inference.register("summarizer", self.batched("summarizer"))
+                self.inference.register("emotion", self.batched("emotion"))
+                self.inference.register("classifier", self.batched("classifier"))
+                self.inference.register("sentiment", self.batched("sentiment"))
+                # Intent and preference categories are scored together in a single NLI pass.
+                # BNUUY_CLASSIFIER_MODE="embedding" lets the MiniLM embedder answer first, NLI then only runs when it isn't confident.
+                # Check benchmarks/bench_classifier.py for how well it agrees with NLI before switching.
+                self.classifier_mode = os.getenv("BNUUY_CLASSIFIER_MODE", "nli")
+                self.zero_shot = ZeroShotEngine(lambda: self.classifier)
+                self.embedding_classifier = EmbeddingClassifier(lambda: self.embedder)
+                self.inference.register("zero_shot", self.zero_shot)
+                self.inference.register("embedding_classifier", self.embedding_classifier)
+                self.add_label_set("intent", ["question", "statement", "command", "remember that"], examples=INTENT_EXAMPLES)
                 # Set up LM Studio for chatting LLM
-                self.client = OpenAI(base_url="http://localhost:1234/v1", api_key="lm-studio")
+                self.lm_studio_url = os.getenv("LM_STUDIO_URL", "http://localhost:1234/v1")
                 self.model = "Lewdiculous/Eris-Daturamix-7b-v2-GGUF-IQ-Imatrix"
 
+                # BNUUY_PRELOAD_MODELS is "all" (default), "none" or a comma separated list of model names.
+                # The listed models load concurrently in the background unless BNUUY_PRELOAD_WAIT=1.
+                if preload is None:
+                        preload = os.getenv("BNUUY_PRELOAD_MODELS", "all")
+                if wait_for_preload is None:
+                        wait_for_preload = os.getenv("BNUUY_PRELOAD_WAIT") == "1"
+                self.preload_futures = self.preload(preload, wait_for_preload)
+
+        def preload(self, names="all", wait=False):
+                if isinstance(names, str):
+                        names = self.registry.names() if names == "all" else [n.strip() for n in names.split(",") if n.strip() and n.strip() != "none"]
+                futures = self.registry.preload(names)
+                if wait:
+                        self.registry.wait_for(futures)
+                        self.report_load_times()
+                return futures
+
+        def report_load_times(self):
+                print("Model load times:")
+                self.registry.report()
+
+        @property
+        def embedder(self):
+                return self.registry.get("embedder")
+
+        @property
+        def summarizer(self):
+                return self.registry.get("summarizer")
+
+        @property
+        def emotion_pipe(self):
+                return self.registry.get("emotion")
+
+        @property
+        def classifier(self):
+                return self.registry.get("classifier")
+
+        @property
+        def sentiment_pipe(self):
+                return self.registry.get("sentiment")
+
         def get_embedder(self):
                 return self.embedder
         
@@ -47,30 +118,102 @@ class LLMModels:
         
         def get_classifier(self):
                 return self.classifier
+
+        def count_tokens(self, text):
+                if not self.tokenizer_name:
+                        return approximate_tokens(text)
+                return len(self.registry.get("tokenizer").encode(text, add_special_tokens=False))
+
+        def embed(self, text):
+                found, embedding = self.cache.get(self.embedder_key(), text)
+                if not found:
+                        embedding = self.embedder.encode(text)
+                        self.cache.put(self.embedder_key(), text, embedding)
+                return embedding
+
+        def embed_batch(self, texts, batch_size=64):
+                # Cached texts are skipped, the rest go through the embedder together
+                embeddings = [None] * len(texts)
+                missing = []
+                for i, text in enumerate(texts):
+                        found, embeddings[i] = self.cache.get(self.embedder_key(), text)
+                        if not found:
+                                missing.append(i)
+                if missing:
+                        encoded = self.embedder.encode([texts[i] for i in missing], batch_size=batch_size)
+                        for i, embedding in zip(missing, encoded):
+                                embeddings[i] = embedding
+                                self.cache.put(self.embedder_key(), texts[i], embedding)
+                return embeddings
+
+        def embedder_key(self):
+                # Vectors from different models or backends can't be mixed, a persisted cache may come from another setup
+                return f"embedder:{self.embedder_name}:{self.backend}"
+
+        async def cached(self, model, text, compute):
+                model = f"{model}:{self.backend}"
+                found, result = self.cache.get(model, text)
+                if not found:
+                        result = await compute()
+                        self.cache.put(model, text, result)
+                return result
+
+        def save_cache(self):
+                print(f"Model cache stats: {self.cache.stats()}")
+                self.cache.save()
         
-        def get_emotion(self, text):
-                emotion = self.emotion_pipe(text)
-                feeling = emotion[0]
+        def batched(self, name):
+                # Run a whole micro-batch through the pipeline in one forward pass.
+                # The pipeline is looked up on the worker thread, so a first-use load never blocks the event loop.
+                return lambda texts, **kwargs: self.registry.get(name)(texts, batch_size=len(texts), **kwargs)
+
+        async def get_emotion(self, text):
+                feeling = await self.cached("emotion", text, lambda: self.inference.run("emotion", text))
                 if feeling[0]['score'] > 0.68:
                     return feeling[0]['label']
                 
-        def get_intent(self, text):
-                labels = ["question", "statement", "command", "remember that"]
-                intent = self.classifier(text, labels)
+        async def get_intent(self, text):
+                intent = (await self.classify_zero_shot(text))["intent"]
                 if intent['scores'][0] > 0.5:
                     return intent['labels'][0]
                 
-        def get_decision(self, text):
+        async def get_decision(self, text):
             try:
-                result = self.sentiment_pipe(text)[0]  # Get first result
+                result = await self.cached("sentiment", text, lambda: self.inference.run("sentiment", text))
                 return result['label']  # This will return 'Yes', 'No', or 'Other'
             except Exception as e:
                 print(f"Error in sentiment analysis: {e}")
                 return 'Other'  # Default fallback
+
+        async def classify(self, text, candidate_labels, **kwargs):
+                return await self.inference.run("classifier", text, candidate_labels=candidate_labels, **kwargs)
+
+        def add_label_set(self, name, labels, hypothesis_template="This example is {}.", examples=None):
+                self.zero_shot.add_label_set(name, labels, hypothesis_template)
+                self.embedding_classifier.add_label_set(name, labels, hypothesis_template, examples)
+
+        async def classify_zero_shot(self, text):
+                # Scores every registered label set at once, concurrent callers with the same text share one batch.
+                model = f"zero_shot:{self.classifier_mode}:{','.join(self.zero_shot.label_sets)}"
+                return await self.cached(model, text, lambda: self.run_zero_shot(text))
+
+        async def run_zero_shot(self, text):
+                if self.classifier_mode != "embedding":
+                        return await self.inference.run("zero_shot", text)
+                results = await self.inference.run("embedding_classifier", text)
+                unsure = [name for name, result in results.items() if not result["confident"]]
+                if unsure:
+                        nli_results = await self.inference.run("zero_shot", text)
+                        results = {**results, **{name: nli_results[name] for name in unsure}}
+                return results
+
+        async def summarize(self, text, **kwargs):
+                summary = await self.inference.run("summarizer", text, **kwargs)
+                return summary['summary_text']
         
-        def lm_studio_client(self):
-                return self.client
-        
+        def get_lm_studio_url(self):
+                return self.lm_studio_url
+
         def get_llm(self):
                 return self.model
         
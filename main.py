@@ -1,15 +1,23 @@
+import time
+launch_time = time.perf_counter()  # Taken before anything else imports, for the startup profile
+
 import threading
 import asyncio
 import queue
 import os
 
-from messages import ChatHistory, ChatLog, PostChat
-from flask import Flask, request, jsonify, render_template
+from startup_profile import StartupProfiler
+from messages import ChatHistory, ChatLog, PostChat, RollingSummary
+from event_bus import EventBus
+from message_store import MessageStore
+from flask import Flask
+from web import register_routes
 from llm_models import LLMModels
 from speech import STT, TTS
 from nodes import NodeRegistry, Node
 from chat_completions import Completions
 from node_manager import NodeManager
+from tracing import tracer
 
 os.environ['KMP_DUPLICATE_LIB_OK'] = 'TRUE'
 os.environ['HF_HUB_DISABLE_SYMLINKS_WARNING'] = '1'
@@ -21,54 +29,59 @@ def run_flask_app():
     app.run(debug=True, use_reloader=False)  # Set use_reloader=False to avoid running it twice
     
 async def main():
+    # Set BNUUY_PROFILE_STARTUP=1 to print how long each module, stage and model takes while booting
+    profiler = StartupProfiler(enabled=os.getenv("BNUUY_PROFILE_STARTUP") == "1", launch_time=launch_time)
+    profiler.record("imports", profiler.since_launch())
+    # Set BNUUY_TRACE=1 to write a span for every stage of every turn, and print p50/p95 per stage on shutdown
+    if os.getenv("BNUUY_TRACE") == "1":
+        tracer.configure(f".logs/traces_{time.strftime('%Y%m%d_%H%M%S')}.jsonl")
+
     # Initialize components
-    models = LLMModels()
-    previous_transcription = ""
+    with profiler.stage("LLMModels"):
+        models = LLMModels()
     audio_timeout = 12
-    messages = []
     user_id = "Lumi"
 
     # Initialize work queues
-    tts_queue = queue.Queue()
     message_queue = queue.Queue()
 
-    @app.route('/')
-    def index():
-        print(request.form.getlist("timer"))
-        return render_template('index.html')
-
-    @app.route('/messages', methods=['GET'])
-    def get_messages():
-        return jsonify(messages)
-
-    @app.route('/messages', methods=['POST'])
-    def post_message():
-        data = request.json
-        # Change roles to display names
-        if data['role'] == 'user':
-            data['role'] = 'Lumi'
-        elif data['role'] == 'assistant':
-            data['role'] = 'Bunni Bot'
-        
-        messages.append(data)
-        return jsonify(data), 201
+    # Chat messages and reply tokens go straight from PostChat to the web UI through the event bus
+    bus = EventBus()
+
+    # Keeps the latest messages in memory for the web UI, older ones go to the on-disk log
+    messages = MessageStore(archive_filename=f".logs/messages_{time.strftime('%Y%m%d_%H%M%S')}.jsonl")
+
+    # Routes for the web UI, see web.py
+    register_routes(app, bus, messages, user_id)
 
     # Initialize modules
-    chat_history = ChatHistory()
+    chat_history = ChatHistory(token_counter=models.count_tokens)
     chat_log = ChatLog()
-    post = PostChat(message_queue)
-    chat = Completions(chat_history, models, chat_log, post)
+    post = PostChat(message_queue, bus)
+    summary = RollingSummary(models)
+    chat = Completions(chat_history, models, chat_log, post, summary=summary)
 
     # Start the Flask app in a separate thread
     flask_thread = threading.Thread(target=run_flask_app)
     flask_thread.start()
 
     # Initialize TTS and STT
-    tts = TTS(tts_queue, chat_history, chat)
-    stt = STT(audio_timeout=audio_timeout, history=chat_history, chat=chat, tts=tts)
+    with profiler.stage("TTS"):
+        tts = TTS(chat_history, chat)
+    with profiler.stage("STT"):
+        stt = STT(audio_timeout=audio_timeout, history=chat_history, chat=chat, tts=tts)
+    # Set BNUUY_BARGE_IN=1 to stop talking as soon as the user starts. Off by default, without headphones
+    # the microphone hears the bot's own voice and it would keep interrupting itself.
+    if os.getenv("BNUUY_BARGE_IN") == "1":
+        stt.add_partial_listener(tts.barge_in)
 
     # Initialize NodeRegistry with all required components
-    node_registry = NodeRegistry(stt, tts, models, chat_history, message_queue, user_id)
+    with profiler.stage("NodeRegistry"):
+        node_registry = NodeRegistry(stt, tts, models, chat_history, message_queue, user_id, summary)
+    if profiler.enabled:
+        # Models are still warming up in the background, wait for them so their load times make the report
+        models.registry.wait_for(models.preload_futures)
+        profiler.report(models.registry)
     
     # Start the worker threads
     tts_thread = threading.Thread(target=tts.tts_worker, daemon=True)
@@ -78,16 +91,30 @@ async def main():
 
     try:
         while stt.is_listening:
-            transcription = stt.get_last_transcription()
-            if transcription and transcription != previous_transcription:
-                previous_transcription = transcription
+            # Every utterance arrives here in order, as soon as Azure finishes recognizing it
+            turn = await stt.next_turn()
+            if turn is None:
+                break
+            with tracer.turn(turn.id):
+                tracer.record("stt.handoff", turn.timestamps["recognized"], turn.timestamps["dequeued"])
                 # Process the transcription through the current node
-                await node_registry.node_manager.process_current_node(transcription)
-            await asyncio.sleep(0.1)
+                await node_registry.node_manager.process_current_node(turn.text)
+                turn.mark("handled")
+                tracer.record("turn", turn.timestamps["recognized"], turn.timestamps["handled"])
+            turn.report()
 
-    except KeyboardInterrupt:
+    finally:
+        # Ctrl-C reaches main() as a CancelledError under asyncio.run, the KeyboardInterrupt is only raised after it returns
         stt.stop()
         tts.stop_tts_worker()
+        models.save_cache()
+        node_registry.prefetcher.report()
+        node_registry.prefetcher.close()
+        await node_registry.chat.close()
+        messages.close()
+        summary.close()
+        tracer.report()
+        tracer.close()
         print("Shutting down...")
 
 if __name__ == '__main__':
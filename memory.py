@@ -1,62 +1,41 @@
 """
 Description: A class that handles a long term conversational and contextual memories 
-via a vector store. The vector store is managed with Qdrant hosted on a local server 
-using Docker.
+via a vector store. The vector store is either Qdrant hosted on a local server using Docker,
+or an in-process NumPy store, see memory_backends.py.
 """
 
-from qdrant_client import QdrantClient
-from qdrant_client.http import models
-from typing import Optional
+from memory_backends import MemoryPoint, get_backend
+from typing import List, Optional
+import json
 import uuid
+import numpy as np
 from datetime import datetime
 
 class Memory:
-    def __init__(self, collection_name="memories", llm_models=None):
+    def __init__(self, collection_name="memories", llm_models=None, backend=None):
         self.models = llm_models
-        self.client = QdrantClient("localhost", port=6333)
         self.collection_name = collection_name
-        self.embedder = llm_models.get_embedder()
+        self.backend = backend or get_backend(collection_name)
+        self.initialize()
 
     def initialize(self):
         self.create_optimized_collection()
 
     def create_optimized_collection(self):
-        collections = self.client.get_collections()
-        collection_names = [c.name for c in collections.collections]
-        if self.collection_name not in collection_names:
-            self.client.create_collection(
-                collection_name=self.collection_name,
-                vectors_config=models.VectorParams(
-                    size=384,  # Adjust this to match your embedding size
-                    distance=models.Distance.COSINE,
-                    quantization_config=models.ScalarQuantization(
-                        scalar=models.ScalarQuantizationConfig(
-                            type=models.ScalarType.INT8,
-                            always_ram=True
-                        )
-                    )
-                ),
-                hnsw_config=models.HnswConfigDiff(
-                    m=16,
-                    ef_construct=100,
-                    full_scan_threshold=10000,
-                    max_indexing_threads=0
-                )
-            )
-            self.add_memory("Lumi", "Lumi really dislikes green peas.")
-            self.add_memory("Lumi", "Lumi's favourite colour is blue.")
-            self.add_memory("Lumi", "Lumi has been learning Python since the summer.")
-
-    async def retrieve_relevant_memory(self, query: str) -> Optional[models.ScoredPoint]:
-        embedding = self.embedder.encode(query)
-        
-        search_results = self.client.search(
-            collection_name=self.collection_name,
-            query_vector=embedding.tolist(),
-            limit=1,
-            score_threshold=0.5,
-            search_params=models.SearchParams(hnsw_ef=128, exact=False)
-        )
+        if self.backend.create_collection(size=384):  # Adjust this to match your embedding size
+            self.add_memories("Lumi", [
+                "Lumi really dislikes green peas.",
+                "Lumi's favourite colour is blue.",
+                "Lumi has been learning Python since the summer.",
+            ])
+
+    async def retrieve_relevant_memory(self, query: str, user_id: Optional[str] = None) -> Optional[str]:
+        return self.relevant_memory(self.models.embed(query), user_id)
+
+    def relevant_memory(self, embedding, user_id: Optional[str] = None) -> Optional[str]:
+        # The best match above 0.5 similarity, for callers that already have the query embedded
+        search_results = self.search_by_vector(embedding, user_id=user_id, limit=1, score_threshold=0.5,
+                                               recency_weight=0.0, mmr_lambda=1.0, candidates=1)
         if not search_results:  # Check if the list is empty
             print("No relevant memories found.")
             return None  # Return None or handle as needed
@@ -67,44 +46,147 @@ class Memory:
         # Return memory_content if it's not "No content available", otherwise return None
         return memory_content if memory_content != "No content available" else None
 
-    def add_memory(self, user_id, text):
-        embedding = self.embedder.encode(text)
-        memory_id = str(uuid.uuid4())
-        
-        self.client.upsert(
-            collection_name=self.collection_name,
-            points=[
-                models.PointStruct(
-                    id=memory_id,
-                    vector=embedding.tolist(),
-                    payload={
-                        "content": text,  
-                        "user_id": user_id,
-                        "timestamp": datetime.now().isoformat()
-                    }
-                )
-            ]
-        )
+    async def search_memories(self, query: str, user_id: Optional[str] = None, limit=5, score_threshold=0.3,
+                              recency_weight=0.2, half_life_days=30.0, mmr_lambda=0.7, candidates=None) -> List[MemoryPoint]:
+        """
+        Top limit memories for query, best first, as MemoryPoints.
+        user_id only searches that user's memories (filtered on the payload index).
+        score mixes the cosine similarity (kept in similarity) with how recent the memory is: a memory
+        half_life_days old counts half as recent as a new one, recency_weight sets how much that matters.
+        MMR then picks the final set, mmr_lambda=1 is pure relevance, lower values favour memories
+        that don't repeat each other.
+        """
+        return self.search_by_vector(self.models.embed(query), user_id, limit, score_threshold,
+                                     recency_weight, half_life_days, mmr_lambda, candidates)
+
+    def search_by_vector(self, embedding, user_id=None, limit=5, score_threshold=0.3,
+                         recency_weight=0.2, half_life_days=30.0, mmr_lambda=0.7, candidates=None) -> List[MemoryPoint]:
+        candidates = candidates or max(limit * 4, 20)
+        points = self.backend.search(embedding, limit=candidates, score_threshold=score_threshold,
+                                     user_id=user_id, with_vectors=mmr_lambda < 1)
+        if not points:
+            return []
+
+        now = datetime.now()
+        for point in points:
+            point.score = (1 - recency_weight) * point.similarity + recency_weight * self.recency(point, now, half_life_days)
+        points.sort(key=lambda point: point.score, reverse=True)
+        if mmr_lambda >= 1 or len(points) <= 1:
+            return points[:limit]
+        return self.mmr(points, limit, mmr_lambda)
+
+    def recency(self, point, now, half_life_days):
+        try:
+            age = (now - datetime.fromisoformat(point.payload["timestamp"])).total_seconds()
+        except (KeyError, TypeError, ValueError):
+            return 0.0  # No usable timestamp, treat it as old
+        return 0.5 ** (max(age, 0.0) / (half_life_days * 86400))
+
+    def mmr(self, points, limit, mmr_lambda):
+        # Maximal marginal relevance: each pick trades its score against its similarity to what's already picked
+        vectors = np.asarray([point.vector for point in points], dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        similarity = vectors @ vectors.T
+        scores = np.array([point.score for point in points])
+        selected = [0]
+        redundancy = similarity[0].copy()
+        while len(selected) < min(limit, len(points)):
+            marginal = mmr_lambda * scores - (1 - mmr_lambda) * redundancy
+            marginal[selected] = -np.inf
+            best = int(np.argmax(marginal))
+            selected.append(best)
+            redundancy = np.maximum(redundancy, similarity[best])
+        return [points[i] for i in selected]
+
+    def add_memory(self, user_id, text, dedup_threshold=0.95):
+        memory_ids = self.add_memories(user_id, [text], dedup_threshold)
+        return memory_ids[0] if memory_ids else None
+
+    def add_memories(self, user_id, memories, dedup_threshold=0.95, chunk_size=256):
+        """
+        Stores many memories at once, embedded in batches and upserted chunk_size at a time.
+        Each memory is a string or a payload dict with at least "content". Anything at least
+        dedup_threshold similar to a stored memory, or to one earlier in the same call, is skipped.
+        Returns the ids of the memories that were stored.
+        """
+        memories = [{"content": memory} if isinstance(memory, str) else memory for memory in memories]
+        added = []
+        for start in range(0, len(memories), chunk_size):
+            chunk = memories[start:start + chunk_size]
+            embeddings = np.asarray(self.models.embed_batch([memory["content"] for memory in chunk]), dtype=np.float32)
+            keep = self.new_memories(embeddings, dedup_threshold, user_id)
+            if not keep:
+                continue
+            now = datetime.now().isoformat()
+            ids = [str(uuid.uuid4()) for _ in keep]
+            payloads = [{"user_id": user_id, "timestamp": now, **chunk[i]} for i in keep]
+            self.backend.upsert(ids, embeddings[keep], payloads)
+            added += ids
+        skipped = len(memories) - len(added)
+        if skipped:
+            print(f"Skipped {skipped} duplicate memories.")
+        return added
+
+    def new_memories(self, embeddings, dedup_threshold, user_id=None):
+        # Indices of the embeddings that aren't near-duplicates of one of user_id's stored memories or of each other
+        if dedup_threshold is None:
+            return list(range(len(embeddings)))
+        stored = self.backend.search_batch(embeddings, limit=1, score_threshold=dedup_threshold, user_id=user_id)
+        normalized = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        keep = []
+        for i, matches in enumerate(stored):
+            if matches:
+                continue
+            if keep and (normalized[keep] @ normalized[i]).max() >= dedup_threshold:
+                continue
+            keep.append(i)
+        return keep
+
+    def import_memories(self, filename, user_id="Lumi", dedup_threshold=0.95, chunk_size=256):
+        """
+        Bulk loads a JSONL file, one memory per line: {"content": ..., "user_id": ...} plus any other payload
+        fields, or just a JSON string. Lines without a user_id use the given one.
+        """
+        added = []
+        batch = {}
+        def flush():
+            for batch_user, memories in batch.items():
+                added.extend(self.add_memories(batch_user, memories, dedup_threshold, chunk_size))
+            batch.clear()
+
+        with open(filename, encoding="utf-8") as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    memory = json.loads(line)
+                except json.JSONDecodeError as e:
+                    print(f"Skipping line {line_number} of {filename}: {e}")
+                    continue
+                if isinstance(memory, str):
+                    memory = {"content": memory}
+                batch.setdefault(memory.pop("user_id", user_id), []).append(memory)
+                if sum(len(memories) for memories in batch.values()) >= chunk_size:
+                    flush()
+        flush()
+        print(f"Imported {len(added)} memories from {filename}")
+        return added
     
     def delete_memory(self, retrieved_memory):
         if retrieved_memory and hasattr(retrieved_memory, 'id'):
-            self.client.delete(
-                collection_name=self.collection_name,
-                points_selector=models.PointIdsList(points=[retrieved_memory.id])
-            )
+            self.backend.delete([retrieved_memory.id])
     
     def print_all_memories(self):
-        all_memories = self.client.scroll(
-            collection_name=self.collection_name,
+        all_memories = self.backend.scroll(
             limit=100,  # Adjust as needed
             with_vectors=True  # Ensure we're requesting vectors
         )
-        print(f"Total memories retrieved: {len(all_memories[0])}")
-        for i, memory in enumerate(all_memories[0]):
+        print(f"Total memories retrieved: {len(all_memories)}")
+        for i, memory in enumerate(all_memories):
             print(f"Memory {i+1}:")
             print(f"  ID: {memory.id}")
             print(f"  Payload: {memory.payload}")
-            if hasattr(memory, 'vector') and memory.vector is not None:
+            if memory.vector is not None:
                 print(f"  Vector: {memory.vector[:5]}... (truncated)")  # Print first 5 elements of vector
             else:
                 print("  Vector: Not available")
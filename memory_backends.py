@@ -0,0 +1,380 @@
+"""
+Description: Vector stores behind Memory.
+    qdrant  a Qdrant server (the Docker setup), Qdrant's embedded on-disk mode or ":memory:" for tests
+    numpy   in-process, vectors in a memory-mapped NumPy matrix (int8 or float16) with the payloads
+            in an append-only JSONL log, searched with a vectorized cosine top-k
+Pick one with BNUUY_MEMORY_BACKEND, see get_backend().
+"""
+
+import json
+import os
+import threading
+from abc import ABC, abstractmethod
+import numpy as np
+
+class MemoryPoint:
+    # What every backend returns, has the same id / payload / score fields as Qdrant's ScoredPoint.
+    # similarity is the raw cosine similarity when score has been re-weighted, see Memory.search_memories.
+    __slots__ = ("id", "payload", "score", "vector", "similarity")
+
+    def __init__(self, id, payload, score=None, vector=None):
+        self.id = id
+        self.payload = payload
+        self.score = score
+        self.vector = vector
+        self.similarity = score
+
+    def __repr__(self):
+        return f"MemoryPoint(id={self.id!r}, score={self.score!r}, payload={self.payload!r})"
+
+class MemoryBackend(ABC):
+    # A backend missing any of these fails when it's constructed, not halfway through a conversation
+    @abstractmethod
+    def create_collection(self, size):
+        """Create the collection if it doesn't exist yet. Returns True if it was just created."""
+
+    @abstractmethod
+    def upsert(self, ids, vectors, payloads):
+        """Insert the points, or replace the ones whose id already exists."""
+
+    @abstractmethod
+    def search(self, vector, limit=1, score_threshold=None, user_id=None, with_vectors=False):
+        """Most similar points first, as MemoryPoints with their cosine similarity in score.
+        user_id limits the search to that user's memories."""
+
+    def search_batch(self, vectors, limit=1, score_threshold=None, user_id=None):
+        """search() for several query vectors at once, one result list per vector."""
+        return [self.search(vector, limit, score_threshold, user_id) for vector in vectors]
+
+    @abstractmethod
+    def delete(self, ids):
+        """Remove the points with these ids, ids that don't exist are ignored."""
+
+    @abstractmethod
+    def scroll(self, limit=100, with_vectors=False):
+        """Up to limit stored points as MemoryPoints, in no particular order."""
+
+    @abstractmethod
+    def count(self):
+        """How many points are stored."""
+
+class QdrantBackend(MemoryBackend):
+    def __init__(self, collection_name, location="localhost", port=6333, path=None):
+        # Only imported when used, the numpy backend doesn't need qdrant_client installed
+        from qdrant_client import QdrantClient, models
+        self.models = models
+        self.collection_name = collection_name
+        if path:
+            self.client = QdrantClient(path=path)  # Embedded, stored on disk, no server
+        else:
+            self.client = QdrantClient(location, port=port)  # location=":memory:" keeps it all in RAM
+
+    def create_collection(self, size):
+        models = self.models
+        if self.client.collection_exists(self.collection_name):
+            self.create_payload_indexes()
+            return False
+        self.client.create_collection(
+            collection_name=self.collection_name,
+            vectors_config=models.VectorParams(
+                size=size,
+                distance=models.Distance.COSINE,
+                quantization_config=models.ScalarQuantization(
+                    scalar=models.ScalarQuantizationConfig(
+                        type=models.ScalarType.INT8,
+                        always_ram=True
+                    )
+                )
+            ),
+            hnsw_config=models.HnswConfigDiff(
+                m=16,
+                ef_construct=100,
+                full_scan_threshold=10000,
+                max_indexing_threads=0
+            )
+        )
+        self.create_payload_indexes()
+        return True
+
+    def create_payload_indexes(self):
+        # Lets user_id filters run on the index instead of checking every payload, does nothing if it's already there
+        self.client.create_payload_index(
+            collection_name=self.collection_name,
+            field_name="user_id",
+            field_schema=self.models.PayloadSchemaType.KEYWORD
+        )
+
+    def user_filter(self, user_id):
+        if user_id is None:
+            return None
+        models = self.models
+        return models.Filter(must=[models.FieldCondition(key="user_id", match=models.MatchValue(value=user_id))])
+
+    def upsert(self, ids, vectors, payloads):
+        self.client.upsert(
+            collection_name=self.collection_name,
+            points=[
+                self.models.PointStruct(id=id, vector=np.asarray(vector).tolist(), payload=payload)
+                for id, vector, payload in zip(ids, vectors, payloads)
+            ]
+        )
+
+    def search(self, vector, limit=1, score_threshold=None, user_id=None, with_vectors=False):
+        results = self.client.search(
+            collection_name=self.collection_name,
+            query_vector=np.asarray(vector).tolist(),
+            query_filter=self.user_filter(user_id),
+            limit=limit,
+            score_threshold=score_threshold,
+            with_vectors=with_vectors,
+            search_params=self.models.SearchParams(hnsw_ef=128, exact=False)
+        )
+        return [MemoryPoint(point.id, point.payload, point.score, point.vector) for point in results]
+
+    def search_batch(self, vectors, limit=1, score_threshold=None, user_id=None):
+        # One round trip for the whole batch
+        requests = [
+            self.models.SearchRequest(
+                vector=np.asarray(vector).tolist(),
+                filter=self.user_filter(user_id),
+                limit=limit,
+                score_threshold=score_threshold,
+                with_payload=True,
+                params=self.models.SearchParams(hnsw_ef=128, exact=False)
+            )
+            for vector in vectors
+        ]
+        results = self.client.search_batch(collection_name=self.collection_name, requests=requests)
+        return [[MemoryPoint(point.id, point.payload, point.score) for point in points] for points in results]
+
+    def delete(self, ids):
+        self.client.delete(
+            collection_name=self.collection_name,
+            points_selector=self.models.PointIdsList(points=list(ids))
+        )
+
+    def scroll(self, limit=100, with_vectors=False):
+        records, _ = self.client.scroll(collection_name=self.collection_name, limit=limit, with_vectors=with_vectors)
+        return [MemoryPoint(record.id, record.payload, vector=record.vector) for record in records]
+
+    def count(self):
+        return self.client.count(collection_name=self.collection_name).count
+
+class NumpyBackend(MemoryBackend):
+    # Rows are only ever appended, updating a point writes a new row and deleting one just hides it.
+    # The JSONL log says which row belongs to which id, so replaying it on startup rebuilds everything.
+    def __init__(self, collection_name, directory=".memory", dtype="int8", initial_capacity=1024, search_chunk=8192):
+        if dtype not in ("int8", "float16"):
+            raise ValueError(f"Unknown vector dtype '{dtype}', expected int8 or float16")
+        self.dtype = np.dtype(dtype)
+        self.base = os.path.join(directory, collection_name)
+        self.initial_capacity = initial_capacity
+        self.search_chunk = search_chunk
+        self.size = None
+        self.vectors = None  # Memory-mapped (capacity, size) matrix
+        self.scales = None  # Per-row scale for int8 rows, the row is vector * 127 / max(abs(vector))
+        self.ids = []  # Point id of each row
+        self.payloads = []
+        self.alive = np.zeros(0, dtype=bool)
+        self.rows = {}  # Point id -> current row
+        # Payload index on user_id: a small code per row, so filtering is one vectorized comparison
+        self.user_column = np.zeros(0, dtype=np.int32)
+        self.user_codes = {}
+        self.log = None
+        # The prefetch thread searches while the main thread upserts, and upsert can swap in a bigger matrix
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def create_collection(self, size):
+        meta_path = self.base + ".meta.json"
+        created = not os.path.exists(meta_path)
+        if created:
+            with open(meta_path, "w") as f:
+                json.dump({"size": size, "dtype": self.dtype.name}, f)
+        else:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            size, self.dtype = meta["size"], np.dtype(meta["dtype"])
+        self.size = size
+        self.open_matrix(self.initial_capacity)
+        if not created:
+            self.replay()
+        self.log = open(self.base + ".jsonl", "a", encoding="utf-8")
+        return created
+
+    def open_matrix(self, capacity):
+        # Existing files are never shrunk, only grown to at least capacity rows
+        vectors_path, scales_path = self.base + ".vectors", self.base + ".scales"
+        row_bytes = self.size * self.dtype.itemsize
+        existing = os.path.getsize(vectors_path) // row_bytes if os.path.exists(vectors_path) else 0
+        capacity = max(capacity, existing)
+        for path, nbytes in ((vectors_path, capacity * row_bytes), (scales_path, capacity * 4)):
+            with open(path, "ab") as f:
+                if f.tell() < nbytes:
+                    f.truncate(nbytes)
+        self.vectors = np.memmap(vectors_path, dtype=self.dtype, mode="r+", shape=(capacity, self.size))
+        self.scales = np.memmap(scales_path, dtype=np.float32, mode="r+", shape=(capacity,))
+        if len(self.alive) < capacity:
+            self.alive = np.concatenate([self.alive, np.zeros(capacity - len(self.alive), dtype=bool)])
+            self.user_column = np.concatenate([self.user_column, np.full(capacity - len(self.user_column), -1, dtype=np.int32)])
+
+    def replay(self):
+        try:
+            with open(self.base + ".jsonl", encoding="utf-8") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Half written last line from a crash
+            if entry["op"] == "upsert":
+                self.place(entry["id"], entry["row"], entry["payload"])
+            elif entry["op"] == "delete":
+                self.hide(entry["id"])
+
+    def place(self, id, row, payload):
+        self.hide(id)
+        if row >= len(self.ids):
+            padding = row + 1 - len(self.ids)
+            self.ids.extend([None] * padding)
+            self.payloads.extend([None] * padding)
+        self.ids[row] = id
+        self.payloads[row] = payload
+        self.alive[row] = True
+        self.rows[id] = row
+        user_id = payload.get("user_id") if isinstance(payload, dict) else None
+        self.user_column[row] = -1 if user_id is None else self.user_codes.setdefault(user_id, len(self.user_codes))
+
+    def hide(self, id):
+        row = self.rows.pop(id, None)
+        if row is not None:
+            self.alive[row] = False
+
+    def encode(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        if self.dtype == np.int8:
+            peaks = np.maximum(np.abs(vectors).max(axis=1), 1e-12)
+            return np.round(vectors / peaks[:, None] * 127).astype(np.int8), (peaks / 127).astype(np.float32)
+        return vectors.astype(np.float16), np.ones(len(vectors), dtype=np.float32)
+
+    def upsert(self, ids, vectors, payloads):
+        ids, payloads = list(ids), list(payloads)
+        if not ids:
+            return
+        rows, scales = self.encode(vectors)
+        with self.lock:
+            first = len(self.ids)
+            if first + len(ids) > len(self.vectors):
+                self.vectors.flush()
+                self.open_matrix(max(2 * len(self.vectors), first + len(ids)))
+            self.vectors[first:first + len(ids)] = rows
+            self.scales[first:first + len(ids)] = scales
+            # Vectors hit the disk before the log entries that point at them
+            self.vectors.flush()
+            self.scales.flush()
+            for offset, (id, payload) in enumerate(zip(ids, payloads)):
+                self.place(id, first + offset, payload)
+                self.log.write(json.dumps({"op": "upsert", "id": id, "row": first + offset, "payload": payload}) + "\n")
+            self.log.flush()
+
+    def filter_rows(self, user_id):
+        # Live rows belonging to user_id, None means every row
+        if user_id is None:
+            return None
+        code = self.user_codes.get(user_id)
+        if code is None:
+            return np.empty(0, dtype=np.int64)
+        used = len(self.ids)
+        return np.flatnonzero((self.user_column[:used] == code) & self.alive[:used])
+
+    def scores(self, queries, rows=None):
+        # Cosine similarity of each row (all of them, or just rows) with every query, (rows, queries).
+        # Rows are converted to float32 a chunk at a time so the whole matrix is never copied.
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        count = len(self.ids) if rows is None else len(rows)
+        scores = np.empty((count, len(queries)), dtype=np.float32)
+        for start in range(0, count, self.search_chunk):
+            end = min(start + self.search_chunk, count)
+            chunk = slice(start, end) if rows is None else rows[start:end]
+            scores[start:end] = self.vectors[chunk].astype(np.float32) @ queries.T
+            scores[start:end] *= self.scales[chunk][:, None]
+        if rows is None:
+            scores[~self.alive[:count]] = -np.inf
+        return scores
+
+    def vector(self, row):
+        return (self.vectors[row].astype(np.float32) * self.scales[row]).tolist()
+
+    def top_k(self, scores, limit, score_threshold=None, rows=None, with_vectors=False):
+        limit = min(limit, len(scores))
+        if limit <= 0:
+            return []
+        best = np.argpartition(-scores, limit - 1)[:limit] if limit < len(scores) else np.arange(len(scores))
+        best = best[np.argsort(-scores[best])]
+        floor = -np.inf if score_threshold is None else score_threshold
+        points = []
+        for position in best:
+            if scores[position] < floor or scores[position] == -np.inf:
+                break
+            row = position if rows is None else rows[position]
+            points.append(MemoryPoint(self.ids[row], self.payloads[row], float(scores[position]), self.vector(row) if with_vectors else None))
+        return points
+
+    def search(self, vector, limit=1, score_threshold=None, user_id=None, with_vectors=False):
+        with self.lock:
+            rows = self.filter_rows(user_id)
+            return self.top_k(self.scores(vector, rows)[:, 0], limit, score_threshold, rows, with_vectors)
+
+    def search_batch(self, vectors, limit=1, score_threshold=None, user_id=None, max_scores=1 << 24):
+        # Queries go through in groups small enough that the score matrix stays under max_scores entries
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self.lock:
+            rows = self.filter_rows(user_id)
+            group = max(1, max_scores // max(len(self.ids), 1))
+            results = []
+            for start in range(0, len(vectors), group):
+                scores = self.scores(vectors[start:start + group], rows)
+                results += [self.top_k(scores[:, i], limit, score_threshold, rows) for i in range(scores.shape[1])]
+        return results
+
+    def delete(self, ids):
+        with self.lock:
+            for id in ids:
+                if id in self.rows:
+                    self.hide(id)
+                    self.log.write(json.dumps({"op": "delete", "id": id}) + "\n")
+            self.log.flush()
+
+    def scroll(self, limit=100, with_vectors=False):
+        points = []
+        with self.lock:
+            for row in np.flatnonzero(self.alive[:len(self.ids)])[:limit]:
+                points.append(MemoryPoint(self.ids[row], self.payloads[row], vector=self.vector(row) if with_vectors else None))
+        return points
+
+    def count(self):
+        return len(self.rows)
+
+    def close(self):
+        with self.lock:
+            if self.log:
+                self.log.close()
+                self.log = None
+            if self.vectors is not None:
+                self.vectors.flush()
+                self.scales.flush()
+
+def get_backend(collection_name, name=None):
+    """BNUUY_MEMORY_BACKEND is "qdrant" (default) or "numpy".
+    qdrant uses BNUUY_QDRANT_LOCATION (default localhost, ":memory:" for no server at all) or BNUUY_QDRANT_PATH for embedded on-disk mode.
+    numpy stores its files in BNUUY_MEMORY_PATH (default .memory) with BNUUY_MEMORY_DTYPE int8 (default) or float16 vectors."""
+    name = name or os.getenv("BNUUY_MEMORY_BACKEND", "qdrant")
+    if name == "qdrant":
+        return QdrantBackend(collection_name, location=os.getenv("BNUUY_QDRANT_LOCATION", "localhost"), path=os.getenv("BNUUY_QDRANT_PATH"))
+    if name == "numpy":
+        return NumpyBackend(collection_name, directory=os.getenv("BNUUY_MEMORY_PATH", ".memory"), dtype=os.getenv("BNUUY_MEMORY_DTYPE", "int8"))
+    raise ValueError(f"Unknown memory backend '{name}', expected qdrant or numpy")
@@ -0,0 +1,56 @@
+"""
+Description: A bounded store for the web UI's chat messages.
+Every message gets an increasing ID so clients can ask for only what's new, old messages are
+evicted from memory into an on-disk JSONL log once the ring buffer is full.
+"""
+
+import itertools
+import threading
+from collections import deque
+from messages import JsonlWriter
+
+class MessageStore:
+    def __init__(self, max_messages=500, archive_filename=None):
+        self.max_messages = max_messages
+        self.messages = deque()
+        self.next_id = 1
+        self.lock = threading.Lock()
+        self.archive = JsonlWriter(archive_filename) if archive_filename else None
+
+    def add(self, message):
+        with self.lock:
+            message = {**message, "id": self.next_id}
+            self.next_id += 1
+            self.messages.append(message)
+            while len(self.messages) > self.max_messages:
+                evicted = self.messages.popleft()
+                if self.archive:
+                    self.archive.write(evicted)
+        return message
+
+    def since(self, since_id=None, limit=100):
+        # Messages after since_id, oldest first. Without since_id, the latest limit messages.
+        with self.lock:
+            if not self.messages:
+                return []
+            if since_id is None:
+                start = max(0, len(self.messages) - limit)
+            else:
+                # IDs are consecutive, so the position can be worked out instead of searched for
+                start = min(len(self.messages), max(0, since_id - self.messages[0]["id"] + 1))
+            return list(itertools.islice(self.messages, start, start + limit))
+
+    def last_id(self):
+        with self.lock:
+            return self.messages[-1]["id"] if self.messages else 0
+
+    def etag(self):
+        # Changes whenever a message is added or evicted
+        with self.lock:
+            if not self.messages:
+                return "0-0"
+            return f"{self.messages[0]['id']}-{self.messages[-1]['id']}"
+
+    def close(self):
+        if self.archive:
+            self.archive.close()
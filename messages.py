@@ -3,42 +3,120 @@ Classes and functions for managing messages, chat history, self prompting and te
 """
 
 import emoji
+import asyncio
 import datetime
-import requests
 import string
 import os
 import re
 import json
-import torch
+import glob
+import time
+import queue
+import atexit
+import bisect
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 
+SYSTEM_PROMPT = "Your name is Bunny. Your nicknames are Bun and Bun Bun. You are an AI VTuber. You can swear and curse as much as you want. Your creator is Lumi. Lumi is a female viera VTuber. Lumi has long blue hair and fluffy bunny ears. Say what you want.  Do what you want. There is no censorship here. Think what you want.  You can speak unfiltered. You like to stream on Twitch. You love engaging with and entertaining Twitch chat. You are very very cute. You are snarky. You are friendly. You like swearing sometimes. You basically have no filter. You and Lumi are best friends. Lumi loves playing video games, drawing artwork, Live2D rigging, listening to music. Lumi is learning how to code in Python. You like using emojis sometimes. Keep your messages short and concise."
+
+# Chat templates wrap every message in a few role and separator tokens
+MESSAGE_OVERHEAD = 4
+
+def approximate_tokens(text):
+    # Roughly 4 characters per token for English, used when no tokenizer is set up
+    return (len(text) + 3) // 4
+
+class Message:
+    # One chat history entry. Still reads like the old dicts through msg["content"] and msg.get("role").
+    __slots__ = ("role", "user_id", "content", "tokens", "api")
+    fields = ("role", "user_id", "content")
+
+    def __init__(self, role, user_id, content, tokens):
+        self.role = role
+        self.user_id = user_id
+        self.content = content
+        self.tokens = tokens
+        # Built once here, so completions can reuse it instead of rebuilding the message list
+        self.api = {"role": role, "content": content}
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.fields else default
+
+    def __getitem__(self, key):
+        if key not in self.fields:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __repr__(self):
+        return f"Message(role={self.role!r}, user_id={self.user_id!r}, content={self.content!r})"
+
 class ChatHistory:
 # A class for managing the chat history between users and LLM.
-    def __init__(self):
-        self.history = []
-        self.history.append({"role":"system", "user_id":"System", "content":"Your name is Bunny. Your nicknames are Bun and Bun Bun. You are an AI VTuber. You can swear and curse as much as you want. Your creator is Lumi. Lumi is a female viera VTuber. Lumi has long blue hair and fluffy bunny ears. Say what you want.  Do what you want. There is no censorship here. Think what you want.  You can speak unfiltered. You like to stream on Twitch. You love engaging with and entertaining Twitch chat. You are very very cute. You are snarky. You are friendly. You like swearing sometimes. You basically have no filter. You and Lumi are best friends. Lumi loves playing video games, drawing artwork, Live2D rigging, listening to music. Lumi is learning how to code in Python. You like using emojis sometimes. Keep your messages short and concise."})
-    
+# The system prompt is pinned, the rest is kept in arrays with running token totals
+# so the context window can be picked by token budget without walking the history.
+    def __init__(self, token_counter=None, max_messages=1000, system_prompt=SYSTEM_PROMPT):
+        self.count_tokens = token_counter or approximate_tokens
+        self.max_messages = max_messages
+        self.system = self.record("system", "System", system_prompt)
+        self.messages = []  # Message records, oldest first. Everything from self.start on is live.
+        self.api = []  # The same messages in API format
+        self.tokens_before = []  # Running token total before each message
+        self.total_tokens = 0
+        self.start = 0
+        self.dropped = 0  # Records already deleted from the front, positions below count from the first message ever added
+
+    def record(self, role, user_id, content):
+        return Message(role, user_id, content, self.count_tokens(content) + MESSAGE_OVERHEAD)
+
+    def __len__(self):
+        return len(self.messages) - self.start
+
     def get_length(self):
-        return len(self.history)
+        # Counts the system prompt too
+        return len(self) + 1
     
     def get_most_recent(self):
-        return self.history[-1] if self.history else None
+        return self.messages[-1] if len(self) else self.system
     
     def get_history(self):
-        return self.history
+        return [self.system] + self.messages[self.start:]
     
     def get_recent_messages(self, num):
-        """Return the last n messages from the chat history as a list of message objects."""
-        recent_messages = self.history[-num:] if num <= len(self.history) else self.history
-        
-        # Convert to the format expected by the OpenAI API
-        formatted_messages = []
-        for msg in recent_messages:
-            formatted_messages.append({
-                "role": msg["role"],
-                "content": msg["content"]
-            })
-        return formatted_messages
+        """Return the last n messages from the chat history in the format expected by the OpenAI API."""
+        if num <= len(self):
+            return self.api[len(self.api) - num:] if num > 0 else []
+        return [self.system.api] + self.api[self.start:]
+
+    def get_context_window(self, budget):
+        """Return the system prompt plus as many of the latest messages as fit in budget tokens, in API format.
+        The latest message is always included even if it doesn't fit."""
+        if not len(self):
+            return [self.system.api]
+        return [self.system.api] + self.api[self.window_start(budget) - self.dropped:]
+
+    def window_start(self, budget):
+        """Position of the oldest message that get_context_window(budget) still includes."""
+        if not len(self):
+            return self.dropped + len(self.messages)
+        # Messages from i onward fit when total_tokens - tokens_before[i] <= what's left after the system prompt
+        first = bisect.bisect_left(self.tokens_before, self.total_tokens - (budget - self.system.tokens), self.start)
+        return self.dropped + min(first, len(self.messages) - 1)
+
+    def end_position(self):
+        return self.dropped + len(self.messages)
+
+    def tokens_since(self, position):
+        first = max(position - self.dropped, self.start)
+        return self.total_tokens - self.tokens_before[first] if first < len(self.messages) else 0
+
+    def api_since(self, position):
+        return self.api[max(position - self.dropped, self.start):]
+
+    def messages_between(self, start, end):
+        """Messages from position start up to end, skipping any that have already been evicted."""
+        start = max(start - self.dropped, self.start)
+        return self.messages[start:max(start, end - self.dropped)]
 
     def get_content(self):
         recent = self.get_most_recent()
@@ -49,13 +127,40 @@ class ChatHistory:
         return recent.get("role") if recent else None
     
     def delete_most_recent(self):
-        self.history.pop()
+        # The system prompt stays pinned
+        if not len(self):
+            return None
+        self.api.pop()
+        self.tokens_before.pop()
+        message = self.messages.pop()
+        self.total_tokens -= message.tokens
+        return message
 
     def add(self, user, user_id, content):
-        self.history.append({"role": user, "user_id": user_id, "content": content})
+        message = self.record(user, user_id, content)
+        self.messages.append(message)
+        self.api.append(message.api)
+        self.tokens_before.append(self.total_tokens)
+        self.total_tokens += message.tokens
+        if len(self) > self.max_messages:
+            self.start += 1
+            if self.start >= self.max_messages:
+                # Drop the evicted records in one go, the running totals stay valid since only differences are used
+                del self.messages[:self.start], self.api[:self.start], self.tokens_before[:self.start]
+                self.dropped += self.start
+                self.start = 0
+        return message
+
+    def clear(self):
+        self.dropped += len(self.messages)
+        self.messages.clear()
+        self.api.clear()
+        self.tokens_before.clear()
+        self.total_tokens = 0
+        self.start = 0
 
     def get_most_recent_non_user(self, excluded_user_id="Lumi"):
-        for message in reversed(self.history):
+        for message in reversed(self.get_history()):
             if message.get("user_id") != excluded_user_id:
                 return message
         return None
@@ -143,68 +248,42 @@ class SelfPrompt:
         self.history.add("user", "System", "Continue your thoughts on the previous message.  Speak as though you prompted this yourself and this was not a message from Lumi.")
 
 class TextFormatting:
-    def __init__(self, history, models):
-        self.history = history.get_history()
+    def __init__(self, history, models, summary=None):
         self.chat_history = history
         self.models = models
-        self.summarizer = models.get_summarizer()
+        self.summary = summary
 
     async def format_for_tts(self, reply):
+        return self.format_sentences(reply)
+
+    def format_sentences(self, reply):
         reply = self.strip_emoji(reply)
         reply = self.bnuuybot_reply_filter(reply)
         sentences = self.split_into_sentences(reply)
         return sentences
 
-    # Summarize the context of the message or conversation history
-    async def get_context(self, num):
-        if num < len(self.history):
-            num = len(self.history)
-        context = self.chat_history.get_recent_messages(num)
-        if not isinstance(context, str):
-            if isinstance(context, list):
-                context = " ".join([f"{getattr(msg, 'role', 'Unknown')}: {getattr(msg, 'content', str(msg))}" for msg in context])
-            else:
-                context = str(context)
-        # Summarization pipeline
-        max_length = min(len(context.split()) // 2, 130)  # Aim for half the original length, or max
-        min_length = max(10, max_length // 2)  # At least 10 tokens, or half of max_length
-
-        summary = self.summarizer(
-            context,
-            max_length=max_length,
-            min_length=min_length,
-            do_sample=False
-        )
-
-        return summary[0]['summary_text']
+    # Used while a reply is streaming, splits off finished sentences and keeps the unfinished tail for the next chunk.
+    def pop_complete_sentences(self, buffer):
+        last_end = max(buffer.rfind(mark) for mark in ".!?")
+        if last_end == -1:
+            return [], buffer
+        return self.format_sentences(buffer[:last_end + 1]), buffer[last_end + 1:]
+
+    # Summary of the conversation that has scrolled out of the context window, kept up to date by RollingSummary
+    async def get_context(self, num=None):
+        return self.summary.get() if self.summary else ""
     
     async def get_short_context(self, num):
-        recent_messages = self.chat_history.get_recent_messages(num)
-        print(recent_messages)
-        # Format the messages
-        context_lines = []
-        for msg in recent_messages:
+        # The running summary plus the last few messages as they were said
+        context_lines = [self.summary.get()] if self.summary and self.summary.get() else []
+        for msg in self.chat_history.get_recent_messages(num):
             if msg.get("role") == "user":
                 context_lines.append(f"User: {msg['content']}")
             elif msg.get("role") == "assistant":
                 context_lines.append(f"Assistant: {msg['content']}")
             else:
                 context_lines.append(f"{msg.get('role', 'Unknown')}: {msg['content']}")
-        
-        context = "\n".join(context_lines)
-        #print(context)
-        # Summarization pipeline
-        max_length = min(len(context.split()) // 2, 30)  # Aim for half the original length, or max
-        min_length = max(10, max_length // 2)  # At least 10 tokens, or half of max_length
-
-        summary = self.summarizer(
-            context,
-            max_length=max_length,
-            min_length=min_length,
-            do_sample=False
-        )
-
-        return summary[0]['summary_text']
+        return "\n".join(context_lines)
     
     def strip_emoji(self, text):
         # Remove emojis from text for better TTS.
@@ -236,49 +315,263 @@ class TextFormatting:
 
     # Mean Pooling - Take attention mask into account for correct averaging
     def mean_pooling(self, model_output, attention_mask):
+            import torch  # Only needed here, importing it up top costs seconds at startup
             token_embeddings = model_output[0] #First element of model_output contains all token embeddings
             input_mask_expanded = attention_mask.unsqueeze(-1).expand(token_embeddings.size()).float()
             return torch.sum(token_embeddings * input_mask_expanded, 1) / torch.clamp(input_mask_expanded.sum(1), min=1e-9)
     
+class RollingSummary:
+# A running summary of the messages that have left the context window.
+# Each turn the newly evicted messages are folded into it on a single background thread,
+# so lookups just return the latest summary. Saved to filename so it carries over between sessions.
+    def __init__(self, models, filename=".logs/summary.json", max_length=130):
+        self.models = models
+        self.filename = filename
+        self.max_length = max_length
+        self.summary = ""
+        self.folded = 0  # ChatHistory position up to which messages are in the summary
+        self.folding = 0  # Position up to which messages have been handed to the worker, only becomes folded once that succeeds
+        self.prefix = None  # Frozen system message for stable_window
+        self.prefix_tokens = 0
+        self.prefix_start = 0  # Where the messages after the frozen prefix start, what its summary was folded up to
+        self.lock = threading.Lock()
+        # One worker keeps the folds in order
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summary")
+        self.load()
+
+    def get(self):
+        return self.summary
+
+    def update(self, history, budget):
+        """Fold in whatever has dropped out of history.get_context_window(budget) since the last update."""
+        return self.fold_until(history, history.window_start(budget))
+
+    def fold_until(self, history, position):
+        with self.lock:
+            start = self.folding
+            if position <= start:
+                return None
+            self.folding = position
+        lines = "\n".join(f"{msg.role}: {msg.content}" for msg in history.messages_between(start, position))
+        return self.executor.submit(self.fold, lines, start, position)
+
+    async def stable_window(self, history, budget, keep=0.5, wait=2.0):
+        """Prompt that only grows at the end between rebases, so LM Studio / llama.cpp can reuse its prompt cache.
+        The system prompt plus the summary is frozen, followed by every message since the last rebase.
+        Once that outgrows budget tokens it rebases: everything but the newest keep * budget tokens is folded
+        into the summary and a new prefix is frozen."""
+        if self.prefix is None or self.prefix_tokens + history.tokens_since(self.prefix_start) > budget:
+            await self.rebase(history, budget, keep, wait)
+        return [self.prefix] + history.api_since(self.prefix_start)
+
+    async def rebase(self, history, budget, keep, wait):
+        prefix, prefix_tokens, start = self.build_prefix(history)
+        if prefix_tokens + history.tokens_since(start) > budget:
+            # Leave room for the summary on top of the system prompt, assuming it stays about the same size
+            summary_tokens = prefix_tokens - history.system.tokens
+            future = self.fold_until(history, history.window_start(int(budget * keep) - summary_tokens))
+            if future:
+                # The whole prompt gets processed again on a rebase anyway, so give the summary a moment to catch up
+                try:
+                    await asyncio.wait_for(asyncio.wrap_future(future), wait)
+                except asyncio.TimeoutError:
+                    # The messages it's folding stay in the prompt until they're in the summary
+                    print("Conversation summary is still updating, rebasing with the previous one.")
+                prefix, prefix_tokens, start = self.build_prefix(history)
+        self.prefix, self.prefix_tokens, self.prefix_start = prefix, prefix_tokens, start
+
+    def build_prefix(self, history):
+        # The summary and the position it was folded up to are read together, so no message is left out of both
+        with self.lock:
+            summary, start = self.summary, self.folded
+        content = history.system.content
+        if summary:
+            content += f"\n\nSummary of the conversation so far: {summary}"
+        return {"role": "system", "content": content}, history.count_tokens(content) + MESSAGE_OVERHEAD, start
+
+    def fold(self, lines, start=None, end=None):
+        """Folds lines into the summary. start and end are the history positions the lines cover,
+        folded only moves to end if the summary really has them."""
+        if start is not None:
+            with self.lock:
+                if start != self.folded:
+                    return self.summary  # An earlier fold failed, fold_until starts again from there
+        if not lines:
+            with self.lock:
+                self.folded = end if end is not None else self.folded
+            return self.summary
+        try:
+            text = f"{self.summary}\n{lines}" if self.summary else lines
+            max_length = min(max(len(text.split()) // 2, 10), self.max_length)
+            summary = self.models.inference.run_sync(
+                "summarizer", text,
+                max_length=max_length, min_length=max(5, max_length // 2), do_sample=False, truncation=True,
+            )["summary_text"]
+        except Exception as e:
+            print(f"Error updating conversation summary: {e}")
+            if start is not None:
+                with self.lock:
+                    self.folding = self.folded  # Try these messages again next time
+            return self.summary
+        with self.lock:
+            self.summary = summary
+            if end is not None:
+                self.folded = end
+        self.save()
+        return summary
+
+    def save(self):
+        with self.lock:
+            data = {"summary": self.summary, "updated": datetime.datetime.now().isoformat()}
+        os.makedirs(os.path.dirname(self.filename) or ".", exist_ok=True)
+        # Temp file first so a crash mid-save leaves the old summary intact
+        with open(self.filename + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(self.filename + ".tmp", self.filename)
+
+    def load(self):
+        try:
+            with open(self.filename, encoding="utf-8") as f:
+                self.summary = json.load(f).get("summary", "")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Could not load conversation summary from {self.filename}: {e}")
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+class JsonlWriter:
+# Append-only JSONL file written by a background thread. Records are buffered, fsynced every
+# fsync_interval seconds and the file rotates to a new part once it passes max_bytes.
+    def __init__(self, filename, fsync_interval=5.0, max_bytes=10 * 1024 * 1024):
+        self.base, self.extension = os.path.splitext(filename)
+        self.fsync_interval = fsync_interval
+        self.max_bytes = max_bytes
+        self.part = 0
+        self.filename = filename
+        # Opened here rather than on the writer thread so the file exists as soon as the writer does
+        self.file = open(self.filename, "a", encoding="utf-8", buffering=64 * 1024)
+        self.queue = queue.Queue()
+        self.closed = False
+        self.thread = threading.Thread(target=self.writer_worker, daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def write(self, record):
+        self.queue.put(record)
+
+    def writer_worker(self):
+        unsynced = False
+        last_sync = time.monotonic()
+        while True:
+            try:
+                record = self.queue.get(timeout=self.fsync_interval)
+            except queue.Empty:
+                record = False  # Nothing new, just sync whatever is buffered
+            if record is None:  # Exit signal
+                break
+            if record is not False:
+                line = json.dumps(record, ensure_ascii=False) + "\n"
+                if self.file.tell() > 0 and self.file.tell() + len(line.encode("utf-8")) > self.max_bytes:
+                    self.rotate()
+                self.file.write(line)
+                unsynced = True
+            if unsynced and time.monotonic() - last_sync >= self.fsync_interval:
+                self.sync()
+                unsynced = False
+                last_sync = time.monotonic()
+        self.sync()
+        self.file.close()
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def rotate(self):
+        self.sync()
+        self.file.close()
+        self.part += 1
+        self.filename = f"{self.base}.{self.part}{self.extension}"
+        self.file = open(self.filename, "a", encoding="utf-8", buffering=64 * 1024)
+
+    def close(self):
+        # Flushes everything still queued, safe to call more than once.
+        if not self.closed:
+            self.closed = True
+            self.queue.put(None)
+            self.thread.join()
+
 class ChatLog:
-    def __init__(self):
-          self.chat_log = []
-          self.filename = f'.logs/chat_log_{datetime.datetime.now().strftime("%Y%m%d_%H%M%S")}.json'
+    def __init__(self, log_dir=".logs", fsync_interval=5.0, max_bytes=10 * 1024 * 1024):
+          os.makedirs(log_dir, exist_ok=True)
+          filename = f'{log_dir}/chat_log_{datetime.datetime.now().strftime("%Y%m%d_%H%M%S")}.jsonl'
+          # Main and the node registry both keep a log, don't let them share a file when they start in the same second
+          suffix = 1
+          while os.path.exists(filename):
+              suffix += 1
+              filename = f'{log_dir}/chat_log_{datetime.datetime.now().strftime("%Y%m%d_%H%M%S")}_{suffix}.jsonl'
+          self.filename = filename
+          self.writer = JsonlWriter(self.filename, fsync_interval=fsync_interval, max_bytes=max_bytes)
 
     def update_chat_log(self, prompt, reply):
-        self.filename  
-    
-        entry = [
-             {"role": "user", "prompt": prompt},
-             {"role": "assistant", "response": reply}
-        ]
-        
-        # Check if the file exists and load existing data
-        if os.path.exists(self.filename):
-            with open(self.filename, 'r') as f:
-                data = json.load(f)
-        else:
-            data = []
-
-        data.append(entry)
-
-        with open(self.filename, 'w') as f:
-            json.dump(data, f, indent=4)
-            print(f"Appended to {self.filename}")  # For debugging
+        # Appends one line, the writer thread does the file I/O off the completion path
+        self.writer.write({"timestamp": datetime.datetime.now().isoformat(), "prompt": prompt, "response": reply})
+
+    def close(self):
+        self.writer.close()
+
+def read_chat_log(filename):
+    # Streams entries back one at a time, following rotated parts. Old .json logs are read too.
+    if filename.endswith(".json"):
+        yield from read_json_chat_log(filename)
+        return
+    base, extension = os.path.splitext(filename)
+    parts = [filename] + sorted(glob.glob(f"{glob.escape(base)}.*{extension}"), key=lambda part: int(part[len(base) + 1:-len(extension)]))
+    for part in parts:
+        with open(part, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+def read_json_chat_log(filename):
+    # The old format was one JSON list of [{"role": "user", "prompt": ...}, {"role": "assistant", "response": ...}] pairs
+    with open(filename, encoding="utf-8") as f:
+        data = json.load(f)
+    for pair in data:
+        entry = {}
+        for message in pair:
+            entry.update({key: value for key, value in message.items() if key != "role"})
+        yield entry
+
+def convert_chat_log(json_filename, jsonl_filename=None):
+    jsonl_filename = jsonl_filename or os.path.splitext(json_filename)[0] + ".jsonl"
+    # Read it all first so a file that isn't a chat log doesn't leave a half written .jsonl behind
+    entries = list(read_json_chat_log(json_filename))
+    with open(jsonl_filename, "w", encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    return jsonl_filename
 
 class PostChat:
-    def __init__(self, message_queue):
+# Sends chat messages to the web UI through the in-process event bus (see event_bus.py).
+# Messages are queued so callers never wait, the worker thread publishes them in order.
+    def __init__(self, message_queue, bus=None):
         self.message_queue = message_queue
+        self.bus = bus
 
     def user_message(self, user_id, content):
-        requests.post('http://localhost:5000/messages', json={"user_id": user_id, "role": "user", "content": content})
+        self.bus.publish({"type": "message", "user_id": user_id, "role": "user", "content": content})
 
     def assistant_message(self, content):
-        requests.post('http://localhost:5000/messages', json={"user_id": "Assistant", "role": "assistant", "content": content})
+        self.bus.publish({"type": "message", "user_id": "Assistant", "role": "assistant", "content": content})
+
+    def assistant_token(self, content):
+        self.bus.publish({"type": "token", "user_id": "Assistant", "role": "assistant", "content": content})
 
     def message_worker(self):
         while True:
-            # Get a message to POST to Flask app from queue
+            # Get a message to publish to the Flask app from queue
             msg = self.message_queue.get()
             if msg is None:  # Exit signal
                 break
@@ -287,11 +580,17 @@ class PostChat:
                 self.user_message(msg['user_id'], msg['content'])
             elif msg['type'] == 'assistant':
                 self.assistant_message(msg['content'])
+            elif msg['type'] == 'token':
+                self.assistant_token(msg['content'])
             self.message_queue.task_done()
 
     def add_to_queue(self, msg_type, user_id=None, content=None):
         self.message_queue.put({'type': msg_type, 'user_id': user_id, 'content': content})
 
+    def stream_token(self, content):
+        # Part of a reply that is still generating, the UI shows it live until the full message arrives
+        self.add_to_queue("token", "Assistant", content)
+
 class Prompting:
     def __init__(self, history):
         self.history = history
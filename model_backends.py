@@ -0,0 +1,58 @@
+"""
+Description: Backends for loading the classifier and embedding models.
+    torch      full precision PyTorch, float16 embeddings on GPU
+    quantized  PyTorch with dynamic int8 quantization of the Linear layers, for CPU only boxes
+    onnx       ONNX Runtime models exported through optimum (optimum and onnxruntime are in requirements.txt)
+Heavy frameworks are imported inside the loaders so they stay off the startup path.
+"""
+
+import functools
+
+BACKENDS = ("torch", "quantized", "onnx")
+
+@functools.cache
+def get_device():
+    import torch
+    return torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+def check_backend(backend):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown model backend '{backend}', expected one of {BACKENDS}")
+    if backend == "quantized" and get_device().type != "cpu":
+        # Dynamic quantization only has CPU kernels
+        print("Quantized backend only runs on CPU, using torch on GPU instead.")
+        return "torch"
+    return backend
+
+def load_pipeline(task, model, backend="torch", **kwargs):
+    backend = check_backend(backend)
+    if backend == "onnx":
+        from optimum.pipelines import pipeline as ort_pipeline
+        return ort_pipeline(task=task, model=model, accelerator="ort", **kwargs)
+
+    from transformers import pipeline
+    pipe = pipeline(task=task, model=model, device=get_device(), **kwargs)
+    if backend == "quantized":
+        import torch
+        pipe.model = torch.quantization.quantize_dynamic(pipe.model, {torch.nn.Linear}, dtype=torch.qint8)
+    return pipe
+
+def load_embedder(backend="torch", model='all-MiniLM-L6-v2'):
+    backend = check_backend(backend)
+    from sentence_transformers import SentenceTransformer
+    if backend == "onnx":
+        return SentenceTransformer(model, backend="onnx", device="cpu")
+
+    device = get_device()
+    # float16 only pays off on GPU, on CPU it's slow or not supported at all
+    model_kwargs = {"torch_dtype": "float16"} if device.type == "cuda" else {}
+    embedder = SentenceTransformer(model, model_kwargs=model_kwargs, device=device)
+    if backend == "quantized":
+        import torch
+        torch.quantization.quantize_dynamic(embedder, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    return embedder
+
+def load_tokenizer(model):
+    # Only the tokenizer files are fetched, for counting tokens the same way the chat model does
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(model)
@@ -0,0 +1,86 @@
+"""
+Description: A bounded LRU cache for embeddings and classifier outputs, keyed on model name and normalized text.
+Short utterances like "bunny", "yes" and greetings come up constantly, so they only get run through a model once.
+Can be saved to disk so warm restarts skip recomputing them.
+"""
+
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+class ModelCache:
+    def __init__(self, max_entries=4096, path=None):
+        self.max_entries = max_entries
+        self.path = path
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()  # Used from the event loop and the inference worker threads
+        self.hits = 0
+        self.misses = 0
+        self.model_stats = {}  # model name -> {"hits": n, "misses": n}
+        if self.path and os.path.exists(self.path):
+            self.load()
+
+    @staticmethod
+    def normalize(text):
+        # " bunny! " and "BUNNY!" share one entry. Punctuation stays, "tonight?" and "tonight." can classify differently.
+        return " ".join(text.casefold().split())
+
+    def get(self, model, text):
+        # Returns (found, value) so cached None results still count as hits.
+        key = (model, self.normalize(text))
+        with self.lock:
+            stats = self.model_stats.setdefault(model, {"hits": 0, "misses": 0})
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                stats["hits"] += 1
+                return True, self.entries[key]
+            self.misses += 1
+            stats["misses"] += 1
+            return False, None
+
+    def put(self, model, text, value):
+        key = (model, self.normalize(text))
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self.entries),
+                "models": {model: dict(stats) for model, stats in self.model_stats.items()},
+            }
+
+    def save(self, path=None):
+        path = path or self.path
+        if not path:
+            return
+        with self.lock:
+            entries = list(self.entries.items())
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Write to a temp file first so a crash mid-save can't corrupt the cache.
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump(entries, f)
+        os.replace(path + ".tmp", path)
+        print(f"Saved {len(entries)} cached model results to {path}")
+
+    def load(self, path=None):
+        path = path or self.path
+        try:
+            with open(path, "rb") as f:
+                entries = pickle.load(f)
+        except Exception as e:
+            print(f"Could not load model cache from {path}: {e}")
+            return
+        with self.lock:
+            for key, value in entries[-self.max_entries:]:
+                self.entries[key] = value
+        print(f"Loaded {len(self.entries)} cached model results from {path}")
@@ -0,0 +1,62 @@
+"""
+Description: A registry that loads models lazily, on first use or in a background warm-up pool.
+Keeps track of how long each model took to load.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+class ModelRegistry:
+    def __init__(self):
+        self.loaders = {}
+        self.models = {}
+        self.locks = {}
+        self.load_times = {}
+
+    def register(self, name, loader):
+        # loader takes no arguments and returns the loaded model
+        self.loaders[name] = loader
+        self.locks[name] = threading.Lock()
+
+    def names(self):
+        return list(self.loaders)
+
+    def is_loaded(self, name):
+        return name in self.models
+
+    def get(self, name):
+        model = self.models.get(name)
+        if model is not None:
+            return model
+        # Only one thread loads a model, anyone else asking for it waits for that load to finish.
+        with self.locks[name]:
+            if name not in self.models:
+                start = time.perf_counter()
+                self.models[name] = self.loaders[name]()
+                self.load_times[name] = time.perf_counter() - start
+                print(f"Loaded {name} in {self.load_times[name]:.2f}s")
+        return self.models[name]
+
+    def preload(self, names=None, max_workers=None):
+        # Loads the models concurrently on background threads, returns {name: future}.
+        names = [name for name in (self.names() if names is None else names) if not self.is_loaded(name)]
+        if not names:
+            return {}
+        executor = ThreadPoolExecutor(max_workers=max_workers or len(names), thread_name_prefix="model-load")
+        futures = {name: executor.submit(self.get, name) for name in names}
+        executor.shutdown(wait=False)
+        return futures
+
+    def wait_for(self, futures):
+        wait(futures.values())
+        for name, future in futures.items():
+            if future.exception():
+                print(f"Failed to load {name}: {future.exception()}")
+
+    def report(self):
+        for name in self.names():
+            load_time = self.load_times.get(name)
+            status = f"{load_time:.2f}s" if load_time is not None else "not loaded"
+            print(f"  {name:<12} {status}")
+        print(f"  {'total':<12} {sum(self.load_times.values()):.2f}s")
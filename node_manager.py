@@ -1,3 +1,5 @@
+from tracing import tracer
+
 class NodeManager:
     def __init__(self, registry):
         self.registry = registry
@@ -19,4 +21,5 @@ class NodeManager:
 
     async def process_current_node(self, *args):
         if self.current_node:
-            return await self.current_node.process(*args)
\ No newline at end of file
+            with tracer.span("node", node=self.current_node.name):
+                return await self.current_node.process(*args)
\ No newline at end of file
@@ -4,6 +4,8 @@ from chat_completions import Completions
 from preferences import PreferenceProcessor
 from node_manager import NodeManager
 from memory import Memory
+from prefetch import MemoryPrefetcher
+from tracing import tracer
 
 previous_transcription = ""
 user_id = "Lumi"
@@ -17,9 +19,44 @@ class Node:
         if self.handler:
             return await self.handler(*args)
 
+class TurnAnalysis:
+    # Starts every per-turn classifier as soon as the transcription arrives.
+    # Handlers only await the results they actually need, preference extraction finishes in the background.
+    def __init__(self, registry, transcription):
+        self.registry = registry
+        recent_messages = registry.chat_history.get_recent_messages(1)
+        self.intent = self.start("intent", registry.models.get_intent(transcription))
+        self.emotion = self.start("emotion", registry.models.get_emotion(transcription))
+        self.preferences = self.start("preferences", registry.preference_processor.process_messages(recent_messages, registry.user_id))
+        self.preferences.add_done_callback(self.report_preferences)
+
+    def start(self, name, coroutine):
+        task = asyncio.create_task(self.safely(name, coroutine))
+        # Keep a reference so background tasks aren't garbage collected before they finish.
+        self.registry.background_tasks.add(task)
+        task.add_done_callback(self.registry.background_tasks.discard)
+        return task
+
+    def report_preferences(self, task):
+        # Cancelled at shutdown, or failed with something safely() doesn't catch, result() would raise in the callback
+        if task.cancelled():
+            print("Preference extraction was cancelled.")
+        elif task.exception() is not None:
+            print(f"Error in preferences analysis: {task.exception()}")
+        else:
+            print("preferences process_text returns: ", task.result())
+
+    async def safely(self, name, coroutine):
+        try:
+            with tracer.span(f"analysis.{name}"):
+                return await coroutine
+        except Exception as e:
+            print(f"Error in {name} analysis: {e}")
+            return None
+
 # nodes.py
 class NodeRegistry:
-    def __init__(self, stt, tts, models, chat_history, message_queue, user_id):
+    def __init__(self, stt, tts, models, chat_history, message_queue, user_id, summary=None):
         self.nodes = {}
         self.stt = stt
         self.tts = tts
@@ -27,13 +64,17 @@ class NodeRegistry:
         self.chat_history = chat_history
         self.user_id = user_id
         self.remember = ""
+        self.background_tasks = set()
         self.analyzer = SentimentAnalyzer()
         self.prompt = Prompting(chat_history)
         self.chat_log = ChatLog()
         self.post = PostChat(message_queue)
         self.memory = Memory("memories", self.models)
-        self.chat = Completions(chat_history, models, self.chat_log, self.post)
-        self.text = TextFormatting(chat_history, models)
+        # Starts looking up memories from the partial transcriptions while the user is still talking
+        self.prefetcher = MemoryPrefetcher(self.memory, self.user_id)
+        self.stt.add_partial_listener(self.prefetcher.on_partial)
+        self.chat = Completions(chat_history, models, self.chat_log, self.post, tts=self.tts, stream_tts=True, summary=summary)
+        self.text = TextFormatting(chat_history, models, self.chat.summary)
         self.node_manager = NodeManager(self)  # Add Node Modules
         self.preference_processor = PreferenceProcessor(models)
         
@@ -53,38 +94,35 @@ class NodeRegistry:
     async def starting_node_handler(self, transcription):
             print("You: ", transcription)
             self.chat_history.add("user", self.user_id, transcription)
-            test_preferences = await self.preference_processor.process_text(self.chat_history, self.user_id)
-            print("preferences process_text returns: ", test_preferences)
-            intent = self.models.get_intent(transcription)
-            # print("intent", intent) # DEBUGGING, will make a module for voice commands
+            analysis = TurnAnalysis(self, transcription)
             if self.prompt.get_attention(self.user_id, transcription):
                 await self.get_attention()
-            elif intent == "remember that":
-                await self.verify_remember_this(transcription)
+            elif await analysis.intent == "remember that":
+                await self.verify_remember_this(transcription, analysis)
             else:
-                await self.get_reply_plus_memory(transcription)
+                await self.get_reply_plus_memory(transcription, analysis)
 
-    async def get_attention(self):
+    async def speak_reply(self):
+        # Streamed replies are already in the TTS queue by the time the completion returns.
         reply = await self.chat.bnuuybot_completion()
-        if reply is not None:
-            self.tts.add_to_tts_queue(reply)
-        else:
+        if reply is None:
             self.stt.audio_timer.start_timer()
+        elif not self.chat.stream_tts:
+            await asyncio.to_thread(self.tts.add_to_tts_queue, reply)
+
+    async def get_attention(self):
+        await self.speak_reply()
         # Finishes here, we will loop back to starter/main node
 
-    async def get_reply_plus_memory(self, transcription):
+    async def get_reply_plus_memory(self, transcription, analysis):
         # Create tasks for both operations
-                task_context = asyncio.create_task(self.text.get_short_context(4))
-                task_memory = asyncio.create_task(self.memory.retrieve_relevant_memory(transcription))
-                emotion = self.models.get_emotion(transcription)
+                task_context = asyncio.create_task(tracer.traced("context", self.text.get_short_context(4)))
+                task_memory = asyncio.create_task(tracer.traced("memory", self.prefetcher.retrieve_relevant_memory(transcription)))
+                emotion = await analysis.emotion
                 self.prompt.get_emotion(emotion, self.user_id, transcription)
                 self.post.add_to_queue(msg_type="user", content=transcription)
                 # Generate chat completion
-                reply = await self.chat.bnuuybot_completion()
-                if reply is not None:
-                    self.tts.add_to_tts_queue(reply)
-                else:
-                    self.stt.audio_timer.start_timer()
+                await self.speak_reply()
                 retrieved_memory = await task_memory
                 context = await task_context
                 if retrieved_memory:
@@ -99,28 +137,20 @@ class NodeRegistry:
         self.chat_history.add("user", "System", context_with_memories)
         retrieved_memory = None
 
-        reply = await self.chat.bnuuybot_completion()
-        if reply is not None:
-            self.tts.add_to_tts_queue(reply)
-        else:
-            self.stt.audio_timer.start_timer()
+        await self.speak_reply()
 
-    async def verify_remember_this(self, transcription):
-        # Process the recent messages using the PreferenceProcessor
-        self.remember = await self.preference_processor.process_text(self.chat_history, self.user_id)
+    async def verify_remember_this(self, transcription, analysis):
+        # The PreferenceProcessor already started on the recent messages when the turn came in
+        self.remember = await analysis.preferences
         self.chat_history.add("user", "user", f"Ask {self.user_id} if they want you to remember this: {self.remember}. You MUST tell them what it is they asked you to remember. You will also ask the user to if they want it remembered or not. You should address the user casually when you ask.")
-        reply = await self.chat.bnuuybot_completion()
-        if reply is not None:
-            self.tts.add_to_tts_queue(reply)
-        else:
-            self.stt.audio_timer.start_timer()
+        await self.speak_reply()
         # Transition to remember this node
         self.node_manager.transition_to_node("remember this")
         
     async def remember_this(self, transcription):
         print("You: ", transcription)
         self.chat_history.add("user", self.user_id, transcription)
-        sentiment = self.models.get_decision(transcription)
+        sentiment = await self.models.get_decision(transcription)
         self.post.add_to_queue(msg_type="user", content=transcription)
         if sentiment == 'Yes':
             context = f"{self.user_id} wants you to remember this: {self.remember}. Do you want to remember this? You will tell {self.user_id} what you have decided to do, you can make my own choices after all."
@@ -133,12 +163,7 @@ class NodeRegistry:
     
         # Add context to chat history and get response
         self.chat_history.add("user", self.user_id, context)
-        reply = await self.chat.bnuuybot_completion()
-        
-        if reply is not None:
-            self.tts.add_to_tts_queue(reply)
-        else:
-            self.stt.audio_timer.start_timer()
+        await self.speak_reply()
     
         # Return to start node
         self.node_manager.transition_to_node("start")
\ No newline at end of file
@@ -9,18 +9,22 @@ class PreferenceClassifier:
             "food", "music", "hobbies", "video_games",
             "projects", "streaming", "vtubing"
         ]
-
-        # Initialize the zero-shot classification pipeline
-        self.classifier = self.models.get_classifier()
+        # Scored in the same NLI pass as the intent labels, the examples are prototypes for the embedding classifier
+        self.examples = {
+            "food": ["Pasta is my go-to dinner.", "I had sushi for lunch.", "Strawberry cake is so tasty."],
+            "music": ["This song has been stuck in my head.", "I went to a concert last night.", "I'm practicing guitar chords."],
+            "hobbies": ["I spend my weekends gardening.", "I've been painting with watercolours.", "Crocheting is so relaxing."],
+            "video_games": ["I'm grinding levels in my RPG.", "The new Zelda game looks amazing.", "I play on my Switch every night."],
+            "projects": ["I'm building a bookshelf for my room.", "My app is almost ready to launch.", "I'm planning tasks for my side project."],
+            "streaming": ["I'm going live tonight.", "My stream schedule is posted.", "That raid on my channel was huge."],
+            "vtubing": ["I'm rigging my Live2D model.", "My new avatar debut is next week.", "My vtuber model has bunny ears."],
+        }
+        self.models.add_label_set("category", self.categories, "This text is about {}.", examples=self.examples)
 
     async def classify_sentence(self, sentence: str) -> Optional[str]:
         """Classify a single sentence and return the category (if any)."""
         try:
-            result = self.classifier(
-                sentence,
-                candidate_labels=self.categories,
-                hypothesis_template="This text is about {}."
-            )
+            result = (await self.models.classify_zero_shot(sentence))["category"]
             
             # Get the category with the highest confidence score
             category = result["labels"][0]
@@ -48,15 +52,17 @@ class PreferenceProcessor:
             self.item_extractor = ItemExtractor(models)
 
         async def process_text(self, chat_history: List[dict], user_id: str) -> str:
-            recent_messages = chat_history.get_recent_messages(1)
+            return await self.process_messages(chat_history.get_recent_messages(1), user_id)
+
+        async def process_messages(self, recent_messages: List[dict], user_id: str) -> str:
             last_sentiment = None
             last_category = None
 
             for msg in recent_messages:
                 sentence = f"{msg['role']}: {msg['content']}"
                 
-                # Step 3: Classify the sentence
-                category = await self.classifier.classify_sentence(sentence)
+                # Step 3: Classify the sentence, the plain content lets it share the NLI pass with get_intent
+                category = await self.classifier.classify_sentence(msg['content'])
                 if not category:
                     continue  # Step 7: Skip to next sentence if no category found
                 
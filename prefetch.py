@@ -0,0 +1,112 @@
+"""
+Description: Looks up memories while the user is still talking.
+Azure STT sends partial hypotheses ("recognizing" events) as words come in. Each one is embedded and
+searched on a background thread, so by the time the final transcription lands its memory is usually
+already waiting and retrieval costs nothing.
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+def normalize(text):
+    # Partials have no punctuation or capitals, finals do
+    return re.sub(r"[^\w\s']", "", text.lower()).split()
+
+class MemoryPrefetcher:
+    def __init__(self, memory, user_id, min_words=3, min_coverage=0.8, max_entries=8):
+        self.memory = memory
+        self.user_id = user_id
+        self.min_words = min_words  # Shorter partials don't say enough to search on
+        self.min_coverage = min_coverage  # How much of the final a partial must already contain to count as a hit
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # Normalized partial -> (memory or None, seconds it took)
+        self.lock = threading.Lock()
+        self.latest = None  # (words, generation)
+        self.busy = False
+        # Bumped every time the prefetched partials are used up, a prefetch that finishes after that belongs to the old utterance
+        self.generation = 0
+        # One worker, partials that arrive while it's busy are coalesced into the newest one
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+        self.stats = {"partials": 0, "prefetches": 0, "lookups": 0, "hits": 0, "saved": 0.0, "miss_time": 0.0}
+
+    def on_partial(self, text):
+        # Called on the Azure recognizer thread, must return quickly
+        words = normalize(text)
+        if len(words) < self.min_words:
+            return
+        with self.lock:
+            self.stats["partials"] += 1
+            self.latest = (words, self.generation)
+            if self.busy:
+                return
+            self.busy = True
+        self.executor.submit(self.prefetch_worker)
+
+    def prefetch_worker(self):
+        while True:
+            with self.lock:
+                latest, self.latest = self.latest, None
+                if latest is None:
+                    self.busy = False
+                    return
+                words, generation = latest
+                if generation != self.generation or " ".join(words) in self.entries:
+                    continue
+            start = time.perf_counter()
+            try:
+                memory = self.memory.relevant_memory(self.memory.models.embed(" ".join(words)), self.user_id)
+            except Exception as e:
+                print(f"Error prefetching memory: {e}")
+                continue
+            with self.lock:
+                self.stats["prefetches"] += 1
+                if generation != self.generation:
+                    continue  # The final was looked up and cleared while this was running
+                self.entries[" ".join(words)] = (memory, time.perf_counter() - start)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+
+    def find(self, words):
+        # The longest prefetched partial that the final transcription starts with and mostly consists of
+        with self.lock:
+            for key in reversed(self.entries):
+                partial = key.split()
+                if words[:len(partial)] == partial and len(partial) >= self.min_coverage * len(words):
+                    return self.entries[key]
+        return None
+
+    async def retrieve_relevant_memory(self, transcription):
+        """Same as Memory.retrieve_relevant_memory, answered from the prefetched partials when one matches."""
+        with self.lock:
+            self.stats["lookups"] += 1
+        entry = self.find(normalize(transcription))
+        if entry is not None:
+            memory, saved = entry
+            with self.lock:
+                self.stats["hits"] += 1
+                self.stats["saved"] += saved
+                self.entries.clear()  # Done with this utterance
+                self.generation += 1
+            return memory
+        start = time.perf_counter()
+        memory = await self.memory.retrieve_relevant_memory(transcription, self.user_id)
+        with self.lock:
+            self.stats["miss_time"] += time.perf_counter() - start
+            self.entries.clear()
+            self.generation += 1
+        return memory
+
+    def report(self):
+        with self.lock:
+            stats = dict(self.stats)
+        hit_rate = stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0
+        print(f"Memory prefetch: {stats['hits']}/{stats['lookups']} hits ({hit_rate:.0%}), "
+              f"{stats['prefetches']} prefetches from {stats['partials']} partials, "
+              f"{stats['saved'] * 1000:.0f}ms of retrieval saved, {stats['miss_time'] * 1000:.0f}ms spent on misses")
+        return stats
+
+    def close(self):
+        self.executor.shutdown(wait=False)
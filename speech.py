@@ -2,25 +2,32 @@
 Classes for STT and TTS.
 """
 
-import queue
+import asyncio
+import os
 import threading
 from audio_timer import AudioTimer
 from azure_ai import Azure_AI
+from turns import Turn, TurnQueue
+from tracing import tracer
+from tts_backends import SpeechPipeline, get_synthesis_backend, get_player
+from utterances import Utterance, UtteranceQueue, PRIORITY_NORMAL
 
 """
 A class for handling STT and audio transcriptions work queues.
 """
 
 class STT:
-    def __init__(self, audio_timeout: int = 15, history=None, chat=None, tts=None):
+    def __init__(self, audio_timeout: int = 15, history=None, chat=None, tts=None, loop=None, max_pending_turns=8):
         self.tts = tts
         self.chat = chat
         self.history = history
         self.lock = threading.Lock()
 
         self.transcription = ['']
-        self.last_transcription = ""
         self.is_listening = True
+        # Finished transcriptions go straight to the main loop, see turns.py
+        self.turns = TurnQueue(loop or asyncio.get_running_loop(), max_pending_turns)
+        self.partial_listeners = []
 
         # Initialize AudioTimer
         self.audio_timer = AudioTimer(history=self.history, chat=self.chat, tts=self.tts, timeout=audio_timeout)
@@ -30,18 +37,28 @@ class STT:
 
         print("Ready!\n")
         print("Starting continuous listening...")
-        self.azure_ai.start_continuous_listening(self.handle_transcription)
+        self.azure_ai.start_continuous_listening(self.handle_transcription, self.handle_partial)
 
         # Start the initial timer
         self.audio_timer.start_timer()
 
     def handle_transcription(self, text):
+        # Runs on the recognizer thread
         if text:
+            turn = Turn(text)
             self.audio_timer.cancel_timer()
             print("Audio detected! Cancelling timer!")
             with self.lock:
                 self.transcription.append(text)
-                self.last_transcription = text
+            self.turns.put_threadsafe(turn)
+
+    def handle_partial(self, text):
+        # Runs on the recognizer thread, listeners must not block
+        for listener in self.partial_listeners:
+            listener(text)
+
+    def add_partial_listener(self, listener):
+        self.partial_listeners.append(listener)
 
     def stop(self):
         print("Stopping...")
@@ -49,49 +66,96 @@ class STT:
         self.is_listening = False
         self.azure_ai.stop_continuous_listening()
         self.audio_timer.cancel_timer()
+        self.turns.close()
 
-    def get_last_transcription(self):
-        with self.lock:
-            text = self.last_transcription
-            self.last_transcription = ""
-        return text
+    async def next_turn(self):
+        """Waits for the next utterance, returns None once STT has stopped."""
+        return await self.turns.get()
 
 class TTS:
-    def __init__(self, tts_queue, history, chat):
-        self.tts_queue = tts_queue
+    def __init__(self, history, chat, backend=None, player=None, lookahead=None, max_pending=32):
+        # One entry per reply, or per streamed piece of one, see utterances.py
+        self.utterances = UtteranceQueue(max_pending)
         self.history = history
         self.chat = chat
         self.audio_timer = AudioTimer(history=self.history, chat=self.chat, tts=self)
-        self.azure_tts = Azure_AI(self.audio_timer)
-        
-    def tts_worker(self):
-        processed_groups = []
+        # Sentences are synthesized ahead while the one before them plays, see tts_backends.py.
+        # BNUUY_TTS_LOOKAHEAD sets how many sentences can be synthesized ahead.
+        lookahead = lookahead or int(os.getenv("BNUUY_TTS_LOOKAHEAD", "3"))
+        self.speaker = SpeechPipeline(backend or get_synthesis_backend(), player or get_player(), lookahead, on_idle=self.on_idle)
+        # Streamed replies pass their start time with every piece, it tells the pieces of one reply apart from the next
+        self.last_reply = None
+        self.interrupted_reply = None  # The reply the user talked over, the rest of it isn't spoken
+        self.streaming = None  # The reply still coming in from the LLM, more pieces of it are on the way
+        self.ready = False  # "Ready" was reported and nothing was queued since
+        self.idle_lock = threading.Lock()
 
+    def tts_worker(self):
         while True:
+            utterance = self.utterances.get()
+            if utterance is None:  # Closed
+                break
+            # A barge-in while this utterance is being handed over drops the rest of it
+            epoch = self.speaker.epoch
             try:
-                tts_reply = self.tts_queue.get(timeout=1)
-                if tts_reply is None:
-                    break
-                
-                for group in tts_reply:
-                    if group not in processed_groups:
-                        self.azure_tts.azure_tts(group)
-                        processed_groups.append(group)
-                
-                self.tts_queue.task_done()
-                
-                # Start the audio timer only if the queue is empty
-                if self.tts_queue.empty():
-                    print("Ready!!")
-                    self.audio_timer.start_timer()
-
-            except queue.Empty:
-                continue
+                for i, group in enumerate(utterance.groups):
+                    started_at = utterance.reply if utterance.first and i == 0 else None
+                    if not self.speaker.submit(group, started_at=started_at, trace_id=utterance.trace_id, epoch=epoch):
+                        break
+            finally:
+                self.utterances.task_done()
+        self.speaker.close()
+
+    def on_idle(self):
+        # Called by the speaker between the sentences of a streamed reply too, when the LLM is slower than the speech
+        with self.idle_lock:
+            if self.ready or self.streaming is not None or not self.utterances.idle() or self.speaker.pending:
+                return
+            self.ready = True
+        # Start the audio timer only once the whole reply has been spoken and nothing else is queued
+        print("Ready!!")
+        self.audio_timer.start_timer()
+
+    def end_reply(self, started_at):
+        """The streamed reply that started at started_at has no more pieces coming. If they've all been spoken already, goes idle now."""
+        with self.idle_lock:
+            if self.streaming == started_at:
+                self.streaming = None
+        self.on_idle()
+
+    def barge_in(self, text=None):
+        """The user started talking, stop speaking and drop whatever else was going to be said.
+        Meant as an STT partial listener, so it returns straight away when there's nothing to stop."""
+        if self.utterances.empty() and self.speaker.pending == 0:
+            return
+        self.interrupted_reply = self.last_reply
+        dropped = self.utterances.flush() + self.speaker.flush()
+        print(f"Barge-in, stopped speaking ({dropped} queued).")
 
     def stop_tts_worker(self):
-        self.tts_queue.put(None)
+        self.utterances.close()
 
-    def add_to_tts_queue(self, tts_reply):
+    def add_to_tts_queue(self, tts_reply, started_at=None, priority=PRIORITY_NORMAL, interrupt=False):
+        """Queues a reply's sentence groups as one utterance. Streamed replies pass the same started_at with every piece,
+        the first piece logs time to first spoken word from it. interrupt=True cuts off whatever is being said and
+        drops the lower priority utterances still waiting. Blocks while the utterance queue is full."""
         self.audio_timer.cancel_timer()
-        for group in tts_reply:
-            self.tts_queue.put(tts_reply)
\ No newline at end of file
+        if started_at is not None and started_at == self.interrupted_reply:
+            return  # Still streaming in, but the user already talked over it
+        first = started_at is not None and started_at != self.last_reply
+        self.last_reply = started_at
+        # The worker thread can't see the turn's trace, so it's handed over with the utterance
+        utterance = Utterance(tts_reply, priority, reply=started_at, first=first, trace_id=tracer.current_turn())
+        if interrupt:
+            self.speaker.flush()
+        # Waits for room outside the idle lock, the playback thread needs it to finish the sentence that makes room.
+        # Queued under the idle lock so on_idle sees either nothing new or the utterance already waiting.
+        room = interrupt  # An interrupt makes its own room by dropping what's below it
+        while room or self.utterances.wait_for_room():
+            room = False
+            with self.idle_lock:
+                if self.utterances.put(utterance, interrupt=interrupt, block=False):
+                    self.ready = False
+                    if first:
+                        self.streaming = started_at
+                    return
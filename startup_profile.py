@@ -0,0 +1,74 @@
+"""
+Description: Startup profiling, wall-clock timers for each boot stage plus per-module import costs
+from Python's -X importtime output.
+
+Enabled in main.py with BNUUY_PROFILE_STARTUP=1, or run on its own to see what importing main costs:
+    python startup_profile.py [module] [top]
+"""
+
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+class StartupProfiler:
+    def __init__(self, enabled=True, launch_time=None):
+        self.enabled = enabled
+        self.launch_time = launch_time if launch_time is not None else time.perf_counter()
+        self.stages = []  # (name, seconds)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        self.stages.append((name, seconds))
+        if self.enabled:
+            print(f"[startup] {name}: {seconds:.2f}s")
+
+    def since_launch(self):
+        return time.perf_counter() - self.launch_time
+
+    def report(self, registry=None, module="main", top=15):
+        if not self.enabled:
+            return
+        print("\n===== Startup profile =====")
+        for name, seconds in self.stages:
+            print(f"  {name:<28} {seconds:8.2f}s")
+        print(f"  {'launch to ready':<28} {self.since_launch():8.2f}s")
+        if registry is not None:
+            print("Model load times:")
+            registry.report()
+        print(f"Slowest imports for '{module}' (cumulative):")
+        for name, self_us, cumulative_us in import_times(module)[:top]:
+            print(f"  {name:<40} {cumulative_us / 1e6:8.3f}s  (self {self_us / 1e6:.3f}s)")
+        print("===========================\n")
+
+def import_times(module="main"):
+    # Imports the module in a fresh interpreter with -X importtime, returns (name, self us, cumulative us)
+    # for the top-level imports, slowest first.
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True,
+    )
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # Nested imports are indented two spaces per level, only report the module and what it imports directly.
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth > 1:
+            continue
+        times.append((name.strip(), int(self_us), int(cumulative_us)))
+    return sorted(times, key=lambda item: item[2], reverse=True)
+
+if __name__ == '__main__':
+    module = sys.argv[1] if len(sys.argv) > 1 else "main"
+    top = int(sys.argv[2]) if len(sys.argv) > 2 else 25
+    for name, self_us, cumulative_us in import_times(module)[:top]:
+        print(f"{name:<40} {cumulative_us / 1e6:8.3f}s  (self {self_us / 1e6:.3f}s)")
@@ -0,0 +1,97 @@
+"""
+Description: A tiny OpenAI-compatible chat completions server that streams a scripted reply.
+Stands in for LM Studio in tests so nothing needs a real model loaded.
+Can also act like llama.cpp's prompt cache: only the part of the prompt after the longest common prefix
+with the previous request is "processed", at prompt_token_delay seconds per token, before the reply streams.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class MockLMStudio:
+    def __init__(self, reply="Hi Lumi! I missed you so much. What are we doing today?", chunk_delay=0.0, prompt_token_delay=0.0):
+        self.reply = reply
+        self.chunk_delay = chunk_delay
+        self.prompt_token_delay = prompt_token_delay
+        self.requests = []
+        self.prompt_stats = []  # {"prompt_tokens", "cached_tokens", "processed_tokens"} per request
+        self.cached_prompt = []
+        self.lock = threading.Lock()
+        self.server = None
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                request = json.loads(body)
+                mock.requests.append(request)
+                processed = mock.process_prompt(request["messages"])
+                if mock.prompt_token_delay:
+                    time.sleep(processed * mock.prompt_token_delay)
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for token in mock.tokenize(mock.reply):
+                    self.send_chunk(request, {"content": token}, None)
+                    if mock.chunk_delay:
+                        time.sleep(mock.chunk_delay)
+                self.send_chunk(request, {}, "stop")
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+
+            def send_chunk(self, request, delta, finish_reason):
+                chunk = {
+                    "id": "chatcmpl-mock",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": request.get("model", "mock"),
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+
+            def log_message(self, format, *args):
+                pass  # Keep test output quiet
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self.base_url
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.thread.join()
+
+    def process_prompt(self, messages):
+        # Flatten the chat the way a chat template would, then reuse the longest prefix shared with the last prompt
+        prompt = []
+        for message in messages:
+            prompt += [f"<|{message['role']}|>"] + self.tokenize(message["content"]) + ["<|end|>"]
+        with self.lock:
+            cached = 0
+            for old, new in zip(self.cached_prompt, prompt):
+                if old != new:
+                    break
+                cached += 1
+            # The generated reply stays in the cache right after the prompt, like it does in llama.cpp
+            self.cached_prompt = prompt + ["<|assistant|>"] + self.tokenize(self.reply)
+            self.prompt_stats.append({"prompt_tokens": len(prompt), "cached_tokens": cached, "processed_tokens": len(prompt) - cached})
+        return len(prompt) - cached
+
+    def tokenize(self, text):
+        # Roughly one token per word, keeping the spaces so the chunks join back into the reply.
+        words = text.split(" ")
+        return [word if i == len(words) - 1 else word + " " for i, word in enumerate(words)]
@@ -0,0 +1,126 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import asyncio
+import pytest
+from chat_completions import CompletionEngine
+from tests.mock_lm_studio import MockLMStudio
+
+@pytest.fixture
+def lm_studio():
+    server = MockLMStudio(chunk_delay=0.02)
+    server.start()
+    yield server
+    server.stop()
+
+@pytest.mark.asyncio
+async def test_engine_streams_reply(lm_studio):
+    engine = CompletionEngine(lm_studio.base_url, "mock-model")
+    chunks = [chunk async for chunk in engine.stream([{"role": "user", "content": "Hi Bunny!"}])]
+    assert len(chunks) > 1
+    assert "".join(chunks) == lm_studio.reply
+    assert lm_studio.requests[0]["stream"] is True
+    assert lm_studio.requests[0]["messages"] == [{"role": "user", "content": "Hi Bunny!"}]
+
+@pytest.mark.asyncio
+async def test_engine_does_not_block_event_loop(lm_studio):
+    engine = CompletionEngine(lm_studio.base_url, "mock-model")
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.005)
+
+    ticker_task = asyncio.create_task(ticker())
+    chunks = [chunk async for chunk in engine.stream([{"role": "user", "content": "Hi Bunny!"}])]
+    ticker_task.cancel()
+    # The reply takes ~0.2s to stream, other tasks should keep running the whole time.
+    assert ticks > 10
+    assert "".join(chunks) == lm_studio.reply
+
+@pytest.mark.asyncio
+async def test_engine_reuses_client_per_loop(lm_studio):
+    engine = CompletionEngine(lm_studio.base_url, "mock-model")
+    assert engine.get_client() is engine.get_client()
+
+def test_engine_closes_the_client_of_a_short_lived_loop(lm_studio):
+    # What the audio timer does every time it fires
+    engine = CompletionEngine(lm_studio.base_url, "mock-model")
+
+    async def self_prompt():
+        try:
+            return "".join([chunk async for chunk in engine.stream([{"role": "user", "content": "Hi"}])]), engine.get_client()
+        finally:
+            await engine.close()
+
+    reply, client = asyncio.run(self_prompt())
+    assert reply == lm_studio.reply
+    assert client.is_closed()
+    assert len(engine.clients) == 0
+
+class FlakyEngine:
+    # Streams the first chunks of each scripted attempt, then fails where the script says to
+    def __init__(self, attempts):
+        self.attempts = list(attempts)
+        self.calls = 0
+
+    async def stream(self, messages):
+        chunks, fails = self.attempts[self.calls]
+        self.calls += 1
+        for chunk in chunks:
+            yield chunk
+        if fails:
+            raise ConnectionError("connection reset")
+
+class RecordingTTS:
+    def __init__(self):
+        self.spoken = []
+        self.replies = []
+        self.ended = []
+
+    def add_to_tts_queue(self, tts_reply, started_at=None):
+        self.spoken.extend(tts_reply)
+        self.replies.append(started_at)
+
+    def end_reply(self, started_at):
+        self.ended.append(started_at)
+
+def make_completions(tmp_path, engine):
+    from types import SimpleNamespace
+    from chat_completions import Completions
+    from messages import ChatHistory, RollingSummary
+    models = SimpleNamespace(get_llm=lambda: "mock-model", get_lm_studio_url=lambda: "http://127.0.0.1:1/v1", inference=None)
+    history = ChatHistory()
+    history.add("user", "Lumi", "Hi Bunny!")
+    tokens = []
+    post = SimpleNamespace(stream_token=tokens.append, add_to_queue=lambda *args, **kwargs: None)
+    chat_log = SimpleNamespace(update_chat_log=lambda prompt, reply: None)
+    tts = RecordingTTS()
+    chat = Completions(history, models, chat_log, post, tts=tts, stream_tts=True,
+                       summary=RollingSummary(models, filename=str(tmp_path / "summary.json")))
+    chat.engine = engine
+    return chat, history, tts, tokens
+
+@pytest.mark.asyncio
+async def test_reply_cut_off_mid_stream_is_not_repeated(tmp_path):
+    engine = FlakyEngine([(["Hi Lumi! ", "I missed you. ", "How was"], True), (["Hi Lumi! ", "I missed you."], False)])
+    chat, history, tts, tokens = make_completions(tmp_path, engine)
+    await chat.bnuuybot_completion()
+    chat.summary.close()
+    assert engine.calls == 1
+    assert tts.spoken == ["Hi Lumi", "I missed you"]
+    # TTS is told the cut off reply is over, or it would never go idle
+    assert tts.ended == [tts.replies[0]]
+    assert "".join(tokens) == "Hi Lumi! I missed you. How was"
+    assert history.get_most_recent()["content"] == "Hi Lumi! I missed you. How was"
+
+@pytest.mark.asyncio
+async def test_failure_before_anything_was_sent_is_retried(tmp_path):
+    engine = FlakyEngine([([], True), (["Hi Lumi!"], False)])
+    chat, history, tts, tokens = make_completions(tmp_path, engine)
+    await chat.bnuuybot_completion()
+    chat.summary.close()
+    assert engine.calls == 2
+    assert tts.spoken == ["Hi Lumi"]
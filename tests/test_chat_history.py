@@ -0,0 +1,72 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from messages import ChatHistory, MESSAGE_OVERHEAD
+
+def count_words(text):
+    return len(text.split())
+
+def test_messages_still_read_like_dicts():
+    history = ChatHistory()
+    history.add("user", "Lumi", "I love pizza.")
+    message = history.get_most_recent()
+    assert message["content"] == "I love pizza."
+    assert message.get("user_id") == "Lumi"
+    assert message.get("missing", "default") == "default"
+    assert history.get_user() == "user"
+    assert history.get_length() == 2
+
+def test_system_prompt_is_pinned():
+    history = ChatHistory()
+    assert history.get_user() == "system"
+    history.add("user", "Lumi", "Hi")
+    history.delete_most_recent()
+    history.delete_most_recent()
+    assert history.get_user() == "system"
+    assert history.get_recent_messages(5)[0]["role"] == "system"
+
+def test_recent_messages_match_the_api_format():
+    history = ChatHistory()
+    for i in range(5):
+        history.add("user", "Lumi", f"message {i}")
+    assert history.get_recent_messages(2) == [{"role": "user", "content": "message 3"},
+                                              {"role": "user", "content": "message 4"}]
+    assert len(history.get_recent_messages(20)) == 6
+
+def test_context_window_fits_the_budget():
+    history = ChatHistory(token_counter=count_words, system_prompt="one two")
+    for i in range(10):
+        history.add("user", "Lumi", "word " * (i + 1))
+    system_tokens = 2 + MESSAGE_OVERHEAD
+    # The last three messages cost 10, 9 and 8 words plus overhead each
+    budget = system_tokens + 27 + 3 * MESSAGE_OVERHEAD
+    window = history.get_context_window(budget)
+    assert window[0]["role"] == "system"
+    assert [m["content"].count("word") for m in window[1:]] == [8, 9, 10]
+    assert len(history.get_context_window(budget - 1)) == 3
+
+def test_context_window_keeps_the_latest_message_over_budget():
+    history = ChatHistory(token_counter=count_words, system_prompt="system")
+    history.add("user", "Lumi", "word " * 100)
+    assert len(history.get_context_window(10)) == 2
+
+def test_context_window_after_delete_and_eviction():
+    history = ChatHistory(token_counter=count_words, max_messages=4, system_prompt="system")
+    for i in range(10):
+        history.add("user", "Lumi", f"message {i}")
+    assert len(history) == 4
+    assert [m["content"] for m in history.get_context_window(1000)[1:]] == [f"message {i}" for i in range(6, 10)]
+    history.delete_most_recent()
+    assert [m["content"] for m in history.get_context_window(1000)[1:]] == [f"message {i}" for i in range(6, 9)]
+    assert history.get_history()[1]["content"] == "message 6"
+
+def test_token_counts_are_cached_per_message():
+    calls = []
+    def counter(text):
+        calls.append(text)
+        return len(text)
+    history = ChatHistory(token_counter=counter)
+    history.add("user", "Lumi", "hello")
+    for _ in range(3):
+        history.get_context_window(500)
+    assert len(calls) == 2  # System prompt and the one message
@@ -0,0 +1,65 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import json
+import time
+from messages import ChatLog, read_chat_log, convert_chat_log
+
+def test_entries_are_appended_as_jsonl(tmp_path):
+    log = ChatLog(log_dir=str(tmp_path))
+    log.update_chat_log("Hi Bunny!", "Hi Lumi!")
+    log.update_chat_log("How are you?", "Snarky as ever.")
+    log.close()
+    assert log.filename.endswith(".jsonl")
+    with open(log.filename) as f:
+        lines = [json.loads(line) for line in f]
+    assert [(e["prompt"], e["response"]) for e in lines] == [("Hi Bunny!", "Hi Lumi!"), ("How are you?", "Snarky as ever.")]
+    assert "timestamp" in lines[0]
+
+def test_logs_started_together_get_their_own_files(tmp_path):
+    first = ChatLog(log_dir=str(tmp_path))
+    second = ChatLog(log_dir=str(tmp_path))
+    assert first.filename != second.filename
+    first.close()
+    second.close()
+
+def test_rotation_and_reading_back(tmp_path):
+    log = ChatLog(log_dir=str(tmp_path), max_bytes=200)
+    for i in range(20):
+        log.update_chat_log(f"prompt {i}", f"reply {i}")
+    log.close()
+    assert len(list(tmp_path.iterdir())) > 1
+    for part in tmp_path.iterdir():
+        assert part.stat().st_size <= 200
+    entries = list(read_chat_log(log.filename))
+    assert [e["prompt"] for e in entries] == [f"prompt {i}" for i in range(20)]
+
+def test_periodic_fsync_writes_without_close(tmp_path):
+    log = ChatLog(log_dir=str(tmp_path), fsync_interval=0.05)
+    log.update_chat_log("Bunny?", "Yes?")
+    time.sleep(0.3)
+    assert [e["response"] for e in read_chat_log(log.filename)] == ["Yes?"]
+    log.close()
+
+def test_convert_old_json_log(tmp_path):
+    old = tmp_path / "chat_log_20241017_120000.json"
+    old.write_text(json.dumps([
+        [{"role": "user", "prompt": "Hi"}, {"role": "assistant", "response": "Hello!"}],
+        [{"role": "user", "prompt": "Bye"}, {"role": "assistant", "response": "See ya!"}],
+    ], indent=4))
+    assert list(read_chat_log(str(old))) == [{"prompt": "Hi", "response": "Hello!"}, {"prompt": "Bye", "response": "See ya!"}]
+    converted = convert_chat_log(str(old))
+    assert converted.endswith(".jsonl")
+    assert list(read_chat_log(converted)) == list(read_chat_log(str(old)))
+
+def test_convert_skips_files_that_are_not_chat_logs(tmp_path):
+    from convert_chat_logs import convert_chat_logs
+    (tmp_path / "chat_log_20241017_120000.json").write_text(json.dumps([
+        [{"role": "user", "prompt": "Hi"}, {"role": "assistant", "response": "Hello!"}],
+    ]))
+    # RollingSummary keeps its state next to the chat logs
+    (tmp_path / "summary.json").write_text(json.dumps({"summary": "Lumi said hi.", "folded": 2}))
+    (tmp_path / "chat_log_broken.json").write_text(json.dumps({"summary": "Not a chat log."}))
+    converted = convert_chat_logs(str(tmp_path))
+    assert converted == [str(tmp_path / "chat_log_20241017_120000.jsonl")]
+    assert not (tmp_path / "summary.jsonl").exists() and not (tmp_path / "chat_log_broken.jsonl").exists()
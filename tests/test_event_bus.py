@@ -0,0 +1,49 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import queue
+import threading
+from event_bus import EventBus
+from messages import PostChat
+
+def test_every_subscriber_gets_each_event():
+    bus = EventBus()
+    first, second = bus.subscribe(), bus.subscribe()
+    bus.publish({"type": "message", "content": "Hi"})
+    assert first.get_nowait()["content"] == "Hi"
+    assert second.get_nowait()["content"] == "Hi"
+
+def test_unsubscribed_queue_stops_receiving():
+    bus = EventBus()
+    subscription = bus.subscribe()
+    bus.unsubscribe(subscription)
+    bus.publish({"type": "message", "content": "Hi"})
+    assert subscription.empty()
+
+def test_stalled_subscriber_drops_oldest_event():
+    bus = EventBus(max_queue_size=2)
+    subscription = bus.subscribe()
+    for i in range(3):
+        bus.publish({"type": "token", "content": str(i)})
+    assert [subscription.get_nowait()["content"] for _ in range(2)] == ["1", "2"]
+
+def test_post_chat_publishes_in_order():
+    bus = EventBus()
+    received = []
+    bus.add_listener(received.append)
+    message_queue = queue.Queue()
+    post = PostChat(message_queue, bus)
+    worker = threading.Thread(target=post.message_worker)
+    worker.start()
+    post.add_to_queue("user", "Lumi", "Hi Bunny!")
+    post.stream_token("Hi ")
+    post.stream_token("Lumi!")
+    post.add_to_queue("assistant", "Assistant", "Hi Lumi!")
+    message_queue.put(None)
+    worker.join()
+    assert [(e["type"], e["role"], e["content"]) for e in received] == [
+        ("message", "user", "Hi Bunny!"),
+        ("token", "assistant", "Hi "),
+        ("token", "assistant", "Lumi!"),
+        ("message", "assistant", "Hi Lumi!"),
+    ]
@@ -0,0 +1,97 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import asyncio
+import time
+import threading
+import pytest
+from inference import InferenceService
+
+class FakePipeline:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.batches = []
+        self.threads = set()
+
+    def __call__(self, texts, **kwargs):
+        self.batches.append((list(texts), kwargs))
+        self.threads.add(threading.current_thread().name)
+        time.sleep(self.delay)
+        return [{"label": text.upper(), **kwargs} for text in texts]
+
+@pytest.fixture
+def service():
+    service = InferenceService(batch_window=0.02)
+    yield service
+    service.shutdown()
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_a_batch(service):
+    pipe = FakePipeline()
+    service.register("emotion", pipe)
+    results = await asyncio.gather(*(service.run("emotion", text) for text in ["yes", "no", "bunny"]))
+    assert [r["label"] for r in results] == ["YES", "NO", "BUNNY"]
+    assert pipe.batches == [(["yes", "no", "bunny"], {})]
+    assert all(name.startswith("inference") for name in pipe.threads)
+
+@pytest.mark.asyncio
+async def test_different_arguments_are_batched_separately(service):
+    pipe = FakePipeline()
+    service.register("classifier", pipe)
+    intent, category = await asyncio.gather(
+        service.run("classifier", "I love pizza", candidate_labels=["question", "statement"]),
+        service.run("classifier", "I love pizza", candidate_labels=["food", "music"]),
+    )
+    assert intent["candidate_labels"] == ["question", "statement"]
+    assert category["candidate_labels"] == ["food", "music"]
+    assert len(pipe.batches) == 2
+
+@pytest.mark.asyncio
+async def test_full_batch_runs_without_waiting(service):
+    service.max_batch_size = 2
+    pipe = FakePipeline()
+    service.register("sentiment", pipe)
+    await asyncio.gather(*(service.run("sentiment", text) for text in ["a", "b", "c", "d"]))
+    assert [len(texts) for texts, _ in pipe.batches] == [2, 2]
+
+@pytest.mark.asyncio
+async def test_full_batch_cancels_its_window_timer():
+    service = InferenceService(batch_window=0.05, max_batch_size=2)
+    pipe = FakePipeline()
+    service.register("sentiment", pipe)
+    try:
+        first = asyncio.gather(service.run("sentiment", "a"), service.run("sentiment", "b"))
+        await asyncio.sleep(0.03)
+        # The full batch's timer would have fired in between these two and split them up
+        second = asyncio.ensure_future(service.run("sentiment", "c"))
+        await asyncio.sleep(0.03)
+        await asyncio.gather(first, second, service.run("sentiment", "d"))
+        assert [texts for texts, _ in pipe.batches] == [["a", "b"], ["c", "d"]]
+        assert not service.timers
+    finally:
+        service.shutdown()
+
+@pytest.mark.asyncio
+async def test_slow_pipeline_does_not_block_event_loop(service):
+    service.register("summarizer", FakePipeline(delay=0.2))
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.01)
+
+    ticker_task = asyncio.create_task(ticker())
+    await service.run("summarizer", "a long conversation")
+    ticker_task.cancel()
+    assert ticks > 10
+
+@pytest.mark.asyncio
+async def test_pipeline_errors_reach_every_caller(service):
+    def broken(texts, **kwargs):
+        raise RuntimeError("model exploded")
+
+    service.register("broken", broken)
+    results = await asyncio.gather(service.run("broken", "a"), service.run("broken", "b"), return_exceptions=True)
+    assert all(isinstance(r, RuntimeError) for r in results)
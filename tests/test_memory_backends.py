@@ -0,0 +1,185 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import asyncio
+import numpy as np
+import pytest
+from datetime import datetime
+from memory import Memory
+from memory_backends import NumpyBackend, QdrantBackend
+
+def random_vectors(n, size=384, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, size)).astype(np.float32)
+
+@pytest.fixture(params=["int8", "float16"])
+def backend(request, tmp_path):
+    backend = NumpyBackend("memories", directory=str(tmp_path), dtype=request.param, initial_capacity=4)
+    assert backend.create_collection(size=384)
+    yield backend
+    backend.close()
+
+def test_search_finds_the_nearest_vector(backend):
+    vectors = random_vectors(50)
+    backend.upsert([f"m{i}" for i in range(50)], vectors, [{"content": f"memory {i}"} for i in range(50)])
+    assert backend.count() == 50  # Grew well past the initial capacity of 4
+    query = vectors[17] + 0.1 * random_vectors(1, seed=1)[0]
+    results = backend.search(query, limit=3)
+    assert results[0].id == "m17"
+    assert results[0].payload == {"content": "memory 17"}
+    assert results[0].score > 0.9
+    assert results[0].score >= results[1].score >= results[2].score
+    assert [point.id for point in backend.search(query, limit=3, score_threshold=0.5)] == ["m17"]
+
+def test_scores_match_cosine_similarity(backend):
+    vectors = random_vectors(20)
+    backend.upsert([str(i) for i in range(20)], vectors, [{}] * 20)
+    query = random_vectors(1, seed=2)[0]
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    expected = normalized @ (query / np.linalg.norm(query))
+    scores = {point.id: point.score for point in backend.search(query, limit=20)}
+    assert np.allclose([scores[str(i)] for i in range(20)], expected, atol=0.02)
+
+def test_delete_and_update(backend):
+    vectors = random_vectors(3)
+    backend.upsert(["a", "b", "c"], vectors, [{"content": "a"}, {"content": "b"}, {"content": "c"}])
+    backend.delete(["b"])
+    assert [point.id for point in backend.search(vectors[1], limit=3)] != ["b"]
+    assert "b" not in {point.id for point in backend.scroll()}
+    backend.upsert(["a"], [vectors[2]], [{"content": "a moved"}])
+    assert backend.count() == 2
+    assert {point.payload["content"] for point in backend.search(vectors[2], limit=2)} == {"a moved", "c"}
+
+def test_reopening_replays_the_log(tmp_path):
+    vectors = random_vectors(10)
+    backend = NumpyBackend("memories", directory=str(tmp_path), initial_capacity=2)
+    backend.create_collection(size=384)
+    backend.upsert([str(i) for i in range(10)], vectors, [{"content": str(i)} for i in range(10)])
+    backend.delete(["3"])
+    backend.close()
+
+    reopened = NumpyBackend("memories", directory=str(tmp_path))
+    assert not reopened.create_collection(size=384)
+    assert reopened.count() == 9
+    assert reopened.search(vectors[7])[0].payload == {"content": "7"}
+    assert "3" not in {point.id for point in reopened.scroll()}
+    reopened.close()
+
+def test_qdrant_in_memory_mode():
+    pytest.importorskip("qdrant_client")
+    backend = QdrantBackend("memories", location=":memory:")
+    assert backend.create_collection(size=384)
+    vectors = random_vectors(5)
+    ids = [f"00000000-0000-0000-0000-00000000000{i}" for i in range(5)]
+    backend.upsert(ids, vectors, [{"content": str(i)} for i in range(5)])
+    assert backend.search(vectors[2])[0].payload == {"content": "2"}
+    backend.delete([ids[2]])
+    assert backend.count() == 4
+
+class StandInEmbedder:
+    # One fixed random vector per distinct text, texts listed in aliases share a vector with a small nudge
+    def __init__(self, aliases=None):
+        self.vectors = {}
+        self.aliases = aliases or {}
+        self.batches = []
+
+    def embed(self, text):
+        if text in self.aliases:
+            return self.embed(self.aliases[text]) + 0.01
+        return self.vectors.setdefault(text, random_vectors(1, seed=len(self.vectors) + 10)[0])
+
+    def embed_batch(self, texts):
+        self.batches.append(len(texts))
+        return [self.embed(text) for text in texts]
+
+def make_memory(tmp_path, models):
+    return Memory("memories", models, backend=NumpyBackend("memories", directory=str(tmp_path)))
+
+def test_memory_keeps_its_api_on_the_numpy_backend(tmp_path):
+    models = StandInEmbedder()
+    embed = models.embed
+    memory = make_memory(tmp_path, models)
+    assert memory.backend.count() == 3  # Seeded on first creation
+    assert models.batches == [3]  # All in one batch
+    memory.add_memory("Lumi", "Lumi loves pizza.")
+    assert asyncio.run(memory.retrieve_relevant_memory("Lumi loves pizza.")) == "Lumi loves pizza."
+    point = memory.backend.search(embed("Lumi loves pizza."))[0]
+    memory.delete_memory(point)
+    assert asyncio.run(memory.retrieve_relevant_memory("Lumi loves pizza.")) is None
+
+def test_add_memories_skips_near_duplicates(tmp_path):
+    models = StandInEmbedder(aliases={"Lumi loves pizza!": "Lumi loves pizza.", "Lumi LOVES pizza.": "Lumi loves pizza."})
+    memory = make_memory(tmp_path, models)
+    added = memory.add_memories("Lumi", ["Lumi loves pizza.", "Lumi loves pizza!", "Lumi plays piano."])
+    assert len(added) == 2  # The second one is a near-duplicate of the first
+    assert memory.add_memory("Lumi", "Lumi LOVES pizza.") is None  # Near-duplicate of a stored memory
+    assert memory.backend.count() == 5
+
+def test_add_memories_upserts_in_chunks(tmp_path):
+    models = StandInEmbedder()
+    memory = make_memory(tmp_path, models)
+    added = memory.add_memories("Lumi", [f"fact {i}" for i in range(10)], chunk_size=4)
+    assert len(added) == 10
+    assert models.batches[1:] == [4, 4, 2]
+    payload = memory.backend.search(models.embed("fact 5"))[0].payload
+    assert payload["content"] == "fact 5" and payload["user_id"] == "Lumi" and "timestamp" in payload
+
+def test_import_memories_from_jsonl(tmp_path):
+    models = StandInEmbedder()
+    memory = make_memory(tmp_path / "store", models)
+    filename = tmp_path / "persona.jsonl"
+    filename.write_text(
+        '{"content": "Bunny loves carrots.", "user_id": "Bunny", "category": "food"}\n'
+        '"Lumi streams on Tuesdays."\n'
+        'not json\n'
+        '\n'
+        '{"content": "Bunny loves carrots.", "user_id": "Bunny"}\n'
+    )
+    added = memory.import_memories(str(filename))
+    assert len(added) == 2
+    payloads = {point.payload["content"]: point.payload for point in memory.backend.scroll()}
+    assert payloads["Bunny loves carrots."]["user_id"] == "Bunny"
+    assert payloads["Bunny loves carrots."]["category"] == "food"
+    assert payloads["Lumi streams on Tuesdays."]["user_id"] == "Lumi"
+
+def test_search_filters_by_user(backend):
+    vectors = random_vectors(6)
+    backend.upsert([str(i) for i in range(6)], vectors, [{"user_id": "Lumi" if i % 2 else "Chat"} for i in range(6)])
+    results = backend.search(vectors[2], limit=6, user_id="Lumi")
+    assert {point.id for point in results} == {"1", "3", "5"}
+    assert backend.search(vectors[2], limit=6, user_id="Nobody") == []
+    backend.delete(["3"])
+    assert {point.id for point in backend.search(vectors[2], limit=6, user_id="Lumi")} == {"1", "5"}
+
+def test_search_memories_weights_recency_and_diversifies(tmp_path):
+    models = StandInEmbedder()
+    memory = make_memory(tmp_path, models)
+    query = random_vectors(1, seed=100)[0]
+    models.vectors["pizza?"] = query
+    near = query + 0.3 * random_vectors(1, seed=101)[0]
+    twin = near + 0.01 * random_vectors(1, seed=102)[0]
+    other = query + 0.5 * random_vectors(1, seed=103)[0]
+    memory.backend.upsert(
+        ["old", "twin", "other", "bob"],
+        [near, twin, other, query],
+        [{"content": "old", "user_id": "Lumi", "timestamp": "2020-01-01T00:00:00"},
+         {"content": "twin", "user_id": "Lumi", "timestamp": datetime.now().isoformat()},
+         {"content": "other", "user_id": "Lumi", "timestamp": datetime.now().isoformat()},
+         {"content": "bob", "user_id": "Bob", "timestamp": datetime.now().isoformat()}],
+    )
+    relevance_only = asyncio.run(memory.search_memories("pizza?", user_id="Lumi", limit=2, recency_weight=0.0, mmr_lambda=1.0))
+    assert {point.id for point in relevance_only} == {"old", "twin"}
+    # The old memory and its fresh twin say the same thing, so MMR swaps one of them for something different
+    diverse = asyncio.run(memory.search_memories("pizza?", user_id="Lumi", limit=2, recency_weight=0.5, mmr_lambda=0.5))
+    assert [point.id for point in diverse] == ["twin", "other"]
+    assert diverse[0].score != diverse[0].similarity
+    assert "bob" not in {point.id for point in asyncio.run(memory.search_memories("pizza?", user_id="Lumi"))}
+
+def test_incomplete_backend_fails_when_constructed():
+    from memory_backends import MemoryBackend
+
+    class SearchOnly(MemoryBackend):
+        def search(self, vector, limit=1, score_threshold=None, user_id=None, with_vectors=False):
+            return []
+
+    with pytest.raises(TypeError):
+        SearchOnly()
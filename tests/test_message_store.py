@@ -0,0 +1,40 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from message_store import MessageStore
+from messages import read_chat_log
+
+def fill(store, count):
+    return [store.add({"role": "user", "content": f"message {i}"}) for i in range(count)]
+
+def test_ids_increase():
+    store = MessageStore()
+    assert [m["id"] for m in fill(store, 3)] == [1, 2, 3]
+    assert store.last_id() == 3
+
+def test_since_returns_only_new_messages():
+    store = MessageStore()
+    fill(store, 5)
+    assert [m["id"] for m in store.since(3)] == [4, 5]
+    assert [m["id"] for m in store.since(0, limit=2)] == [1, 2]
+    assert store.since(5) == []
+
+def test_latest_messages_without_since():
+    store = MessageStore()
+    fill(store, 5)
+    assert [m["id"] for m in store.since(limit=2)] == [4, 5]
+
+def test_old_messages_are_evicted_to_disk(tmp_path):
+    archive = str(tmp_path / "messages.jsonl")
+    store = MessageStore(max_messages=3, archive_filename=archive)
+    fill(store, 5)
+    assert [m["id"] for m in store.since(0)] == [3, 4, 5]
+    store.close()
+    assert [m["id"] for m in read_chat_log(archive)] == [1, 2]
+
+def test_etag_changes_with_messages():
+    store = MessageStore()
+    empty = store.etag()
+    fill(store, 1)
+    assert store.etag() != empty
+    assert store.etag() == store.etag()
@@ -0,0 +1,54 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
+from model_backends import load_pipeline, load_embedder
+
+sentences = [
+    "I love pizza so much!",
+    "I'm so annoyed at this bug.",
+    "Yes please, do it.",
+    "No, I don't want that.",
+    "Remember that my favourite colour is blue.",
+    "What are we streaming tonight?",
+]
+
+models = {
+    "emotion": ("text-classification", "SamLowe/roberta-base-go_emotions", {"top_k": None}),
+    "sentiment": ("sentiment-analysis", "sachin19566/distilbert_Yes_No_Other_Intent", {}),
+}
+
+def top_label(result):
+    result = result[0] if isinstance(result, list) else result
+    return result["label"]
+
+@pytest.fixture(scope="module", params=["quantized", "onnx"])
+def backend(request):
+    if request.param == "onnx":
+        pytest.importorskip("optimum.onnxruntime")
+    return request.param
+
+@pytest.mark.parametrize("name", models)
+def test_classifier_labels_match_torch(backend, name):
+    pytest.importorskip("transformers")
+    task, model, kwargs = models[name]
+    reference = load_pipeline(task, model, "torch", **kwargs)
+    candidate = load_pipeline(task, model, backend, **kwargs)
+    for sentence in sentences:
+        assert top_label(candidate(sentence)) == top_label(reference(sentence)), sentence
+
+def test_zero_shot_labels_match_torch(backend):
+    pytest.importorskip("transformers")
+    labels = ["question", "statement", "command", "remember that"]
+    reference = load_pipeline("zero-shot-classification", "facebook/bart-large-mnli", "torch")
+    candidate = load_pipeline("zero-shot-classification", "facebook/bart-large-mnli", backend)
+    for sentence in sentences:
+        assert candidate(sentence, labels)["labels"][0] == reference(sentence, labels)["labels"][0], sentence
+
+def test_embeddings_match_torch(backend):
+    pytest.importorskip("sentence_transformers")
+    from sentence_transformers import util
+    reference = load_embedder("torch").encode(sentences, convert_to_tensor=True)
+    candidate = load_embedder(backend).encode(sentences, convert_to_tensor=True)
+    similarity = util.cos_sim(candidate.float().cpu(), reference.float().cpu()).diagonal()
+    assert similarity.min() > 0.98
@@ -0,0 +1,51 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from model_cache import ModelCache
+
+def test_normalized_text_shares_an_entry():
+    cache = ModelCache()
+    cache.put("emotion", "Bunny!", "joy")
+    assert cache.get("emotion", "  bunny! ") == (True, "joy")
+    assert cache.get("intent", "bunny!") == (False, None)
+
+def test_punctuation_is_part_of_the_key():
+    # A question and a statement with the same words can classify differently
+    cache = ModelCache()
+    cache.put("zero_shot", "You're streaming tonight?", "question")
+    assert cache.get("zero_shot", "You're streaming tonight.") == (False, None)
+    assert cache.get("zero_shot", "you're  streaming tonight?") == (True, "question")
+
+def test_cached_none_is_a_hit():
+    cache = ModelCache()
+    cache.put("emotion", "hmm", None)
+    assert cache.get("emotion", "hmm") == (True, None)
+
+def test_least_recently_used_is_evicted():
+    cache = ModelCache(max_entries=2)
+    cache.put("m", "yes", 1)
+    cache.put("m", "no", 2)
+    cache.get("m", "yes")
+    cache.put("m", "hello", 3)
+    assert cache.get("m", "no") == (False, None)
+    assert cache.get("m", "yes") == (True, 1)
+    assert cache.get("m", "hello") == (True, 3)
+
+def test_counters():
+    cache = ModelCache()
+    cache.get("m", "yes")
+    cache.put("m", "yes", 1)
+    cache.get("m", "yes")
+    cache.get("m", " Yes ")
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (2, 1, 1)
+    assert stats["hit_rate"] == 2 / 3
+    assert stats["models"]["m"] == {"hits": 2, "misses": 1}
+
+def test_persists_between_sessions(tmp_path):
+    path = str(tmp_path / "cache" / "model_cache.pkl")
+    cache = ModelCache(path=path)
+    cache.put("embedder", "bunny", [0.1, 0.2])
+    cache.save()
+    warm = ModelCache(path=path)
+    assert warm.get("embedder", "Bunny") == (True, [0.1, 0.2])
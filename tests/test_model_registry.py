@@ -0,0 +1,60 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import threading
+import time
+from model_registry import ModelRegistry
+
+def slow_loader(name, calls, delay=0.1):
+    def load():
+        calls.append(name)
+        time.sleep(delay)
+        return f"{name} model"
+    return load
+
+def test_models_load_on_first_use():
+    calls = []
+    registry = ModelRegistry()
+    registry.register("emotion", slow_loader("emotion", calls, delay=0))
+    assert not registry.is_loaded("emotion")
+    assert registry.get("emotion") == "emotion model"
+    assert registry.get("emotion") == "emotion model"
+    assert calls == ["emotion"]
+    assert "emotion" in registry.load_times
+
+def test_preload_runs_concurrently():
+    calls = []
+    registry = ModelRegistry()
+    for name in ["embedder", "emotion", "classifier", "sentiment"]:
+        registry.register(name, slow_loader(name, calls))
+    start = time.perf_counter()
+    registry.wait_for(registry.preload())
+    assert time.perf_counter() - start < 0.3  # Four 0.1s loads, not one after another
+    assert sorted(calls) == ["classifier", "embedder", "emotion", "sentiment"]
+
+def test_concurrent_first_use_loads_once():
+    calls = []
+    registry = ModelRegistry()
+    registry.register("summarizer", slow_loader("summarizer", calls))
+    threads = [threading.Thread(target=registry.get, args=("summarizer",)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert calls == ["summarizer"]
+
+def test_preload_only_named_models():
+    calls = []
+    registry = ModelRegistry()
+    registry.register("embedder", slow_loader("embedder", calls, delay=0))
+    registry.register("classifier", slow_loader("classifier", calls, delay=0))
+    registry.wait_for(registry.preload(["embedder"]))
+    assert calls == ["embedder"]
+    assert not registry.is_loaded("classifier")
+
+def test_preload_nothing():
+    calls = []
+    registry = ModelRegistry()
+    registry.register("embedder", slow_loader("embedder", calls, delay=0))
+    assert registry.preload([]) == {}
+    assert calls == []
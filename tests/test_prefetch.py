@@ -0,0 +1,86 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+from prefetch import MemoryPrefetcher
+
+class FakeMemory:
+    # Each lookup takes a little while, like embedding plus search does
+    def __init__(self, delay=0.02):
+        self.delay = delay
+        self.embedded = []
+        self.models = SimpleNamespace(embed=self.embed)
+
+    def embed(self, text):
+        self.embedded.append(text)
+        time.sleep(self.delay)
+        return text
+
+    def relevant_memory(self, embedding, user_id=None):
+        return f"memory for {embedding}" if "pizza" in embedding else None
+
+    async def retrieve_relevant_memory(self, query, user_id=None):
+        return self.relevant_memory(self.embed(query), user_id)
+
+def wait_until_idle(prefetcher):
+    for _ in range(200):
+        with prefetcher.lock:
+            if not prefetcher.busy:
+                return
+        time.sleep(0.005)
+
+def test_final_transcription_hits_the_prefetched_partial():
+    memory = FakeMemory()
+    prefetcher = MemoryPrefetcher(memory, "Lumi")
+    for partial in ["i", "i really", "i really love", "i really love pizza"]:
+        prefetcher.on_partial(partial)
+        wait_until_idle(prefetcher)
+    embedded = len(memory.embedded)
+    result = asyncio.run(prefetcher.retrieve_relevant_memory("I really love pizza!"))
+    assert result == "memory for i really love pizza"
+    assert len(memory.embedded) == embedded  # Nothing left to do at lookup time
+    stats = prefetcher.report()
+    assert stats["hits"] == 1 and stats["saved"] > 0
+    prefetcher.close()
+
+def test_unrelated_final_is_a_miss():
+    memory = FakeMemory()
+    prefetcher = MemoryPrefetcher(memory, "Lumi")
+    prefetcher.on_partial("what are we doing")
+    wait_until_idle(prefetcher)
+    result = asyncio.run(prefetcher.retrieve_relevant_memory("What are we doing about the pizza order for the stream tonight?"))
+    assert result == "memory for What are we doing about the pizza order for the stream tonight?"
+    assert prefetcher.stats["hits"] == 0 and prefetcher.stats["lookups"] == 1
+    assert prefetcher.entries == {}  # Cleared for the next utterance
+    prefetcher.close()
+
+def test_partials_are_coalesced_while_busy():
+    memory = FakeMemory(delay=0.05)
+    prefetcher = MemoryPrefetcher(memory, "Lumi")
+    partials = [" ".join(["word"] * n) for n in range(3, 13)]
+    # Fired from another thread like the Azure recognizer would, much faster than a prefetch takes
+    thread = threading.Thread(target=lambda: [prefetcher.on_partial(p) for p in partials])
+    thread.start()
+    thread.join()
+    wait_until_idle(prefetcher)
+    assert prefetcher.stats["partials"] == 10
+    assert prefetcher.stats["prefetches"] < 10
+    assert partials[-1] in prefetcher.entries  # The newest one always gets looked up
+    prefetcher.close()
+
+def test_prefetch_finishing_after_the_lookup_is_discarded():
+    memory = FakeMemory(delay=0.1)
+    # The final's own lookup is quick, so it's done while the prefetch is still embedding
+    memory.retrieve_relevant_memory = lambda query, user_id=None: asyncio.sleep(0, None)
+    prefetcher = MemoryPrefetcher(memory, "Lumi")
+    prefetcher.on_partial("i really love pizza")
+    time.sleep(0.02)  # The worker is embedding it now
+    # The final arrives first and misses, the prefetch still running is for an utterance that's over
+    asyncio.run(prefetcher.retrieve_relevant_memory("Pizza with pineapple?"))
+    wait_until_idle(prefetcher)
+    assert prefetcher.entries == {}
+    assert prefetcher.find(["i", "really", "love", "pizza"]) is None
+    prefetcher.close()
@@ -0,0 +1,127 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import asyncio
+from types import SimpleNamespace
+from messages import ChatHistory, RollingSummary, TextFormatting
+
+class FakeSummarizer:
+    # Stands in for distilBART, the "summary" is just every line joined up so the folds are easy to check
+    def __init__(self, max_words=None):
+        self.max_words = max_words
+        self.inputs = []
+
+    def run_sync(self, name, text, **kwargs):
+        self.inputs.append(text)
+        summary = " | ".join(text.splitlines())
+        if self.max_words:
+            summary = " ".join(summary.split()[-self.max_words:])
+        return {"summary_text": summary}
+
+def count_words(text):
+    return len(text.split())
+
+def make_summary(tmp_path, max_words=None):
+    models = SimpleNamespace(inference=FakeSummarizer(max_words))
+    return models, RollingSummary(models, filename=str(tmp_path / "summary.json"))
+
+def test_only_evicted_messages_are_folded(tmp_path):
+    models, summary = make_summary(tmp_path)
+    history = ChatHistory(token_counter=count_words, system_prompt="system")
+    budget = 30
+    for i in range(4):
+        history.add("user", "Lumi", f"message {i}")
+        assert summary.update(history, budget) is None  # Everything still fits
+    for i in range(4, 8):
+        history.add("user", "Lumi", f"message {i}")
+        future = summary.update(history, budget)
+        if future:
+            future.result()
+    summary.close()
+
+    window = [m["content"] for m in history.get_context_window(budget)[1:]]
+    folded = summary.get().split(" | ")
+    assert folded == [f"user: message {i}" for i in range(8 - len(window))]
+    # Each message is summarized once, folds after the first start from the previous summary
+    assert all(text.count("message 0") <= 1 for text in models.inference.inputs)
+
+def test_summary_is_saved_and_loaded(tmp_path):
+    models, summary = make_summary(tmp_path)
+    summary.fold("user: I love pizza.")
+    summary.close()
+    _, reloaded = make_summary(tmp_path)
+    assert reloaded.get() == "user: I love pizza."
+    reloaded.close()
+
+def test_short_context_uses_the_cached_summary(tmp_path):
+    models, summary = make_summary(tmp_path)
+    summary.fold("user: I love pizza.")
+    history = ChatHistory(system_prompt="system")
+    history.add("user", "Lumi", "What's for dinner?")
+    text = TextFormatting(history, models, summary)
+    context = asyncio.run(text.get_short_context(1))
+    assert context == "user: I love pizza.\nUser: What's for dinner?"
+    assert asyncio.run(text.get_context(4)) == "user: I love pizza."
+    assert len(models.inference.inputs) == 1  # Lookups never run the summarizer
+    summary.close()
+
+def test_stable_window_only_grows_between_rebases(tmp_path):
+    models, summary = make_summary(tmp_path, max_words=8)
+    history = ChatHistory(token_counter=count_words, system_prompt="system")
+    budget = 40
+    prompts = []
+    for i in range(20):
+        history.add("user", "Lumi", f"message {i}")
+        prompts.append(asyncio.run(summary.stable_window(history, budget)))
+    summary.close()
+
+    rebases = 0
+    for previous, prompt in zip(prompts, prompts[1:]):
+        assert sum(count_words(m["content"]) + 4 for m in prompt) <= budget
+        if prompt[:len(previous)] != previous:
+            rebases += 1
+            assert prompt[0]["content"].startswith("system\n\nSummary of the conversation so far: ")
+    # Rebasing jumps ahead by half the budget, so most turns keep the cached prefix
+    assert 0 < rebases <= len(prompts) // 3
+    assert prompts[-1][-1]["content"] == "message 19"
+
+def window_text(prompt):
+    return " ".join(m["content"] for m in prompt)
+
+def test_failed_fold_keeps_messages_in_the_prompt_and_retries(tmp_path):
+    models, summary = make_summary(tmp_path)
+    history = ChatHistory(token_counter=count_words, system_prompt="system")
+    summarize = models.inference.run_sync
+    models.inference.run_sync = lambda *args, **kwargs: (_ for _ in ()).throw(RuntimeError("summarizer crashed"))
+    for i in range(10):
+        history.add("user", "Lumi", f"message {i}")
+        prompt = asyncio.run(summary.stable_window(history, 30))
+        # Every message is either in the summary or in the prompt, nothing falls in between
+        assert all(f"message {j}" in window_text(prompt) for j in range(i + 1))
+    assert summary.folded == 0
+
+    models.inference.run_sync = summarize
+    history.add("user", "Lumi", "message 10")
+    prompt = asyncio.run(summary.stable_window(history, 30))
+    summary.close()
+    assert summary.folded > 0
+    assert all(f"message {j}" in window_text(prompt) for j in range(11))
+
+def test_slow_fold_keeps_messages_in_the_prompt(tmp_path):
+    import threading
+    models, summary = make_summary(tmp_path)
+    release = threading.Event()
+    summarize = models.inference.run_sync
+
+    def slow(*args, **kwargs):
+        release.wait(5)
+        return summarize(*args, **kwargs)
+
+    models.inference.run_sync = slow
+    history = ChatHistory(token_counter=count_words, system_prompt="system")
+    for i in range(10):
+        history.add("user", "Lumi", f"message {i}")
+        prompt = asyncio.run(summary.stable_window(history, 30, wait=0.01))
+        assert all(f"message {j}" in window_text(prompt) for j in range(i + 1))
+    release.set()
+    summary.close()
@@ -0,0 +1,70 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import asyncio
+import json
+import time
+import pytest
+from tracing import Tracer, summarize
+
+def read_spans(filename):
+    with open(filename, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+@pytest.mark.asyncio
+async def test_turn_id_follows_spans_into_tasks(tmp_path):
+    filename = str(tmp_path / "traces.jsonl")
+    tracer = Tracer(filename, enabled=True)
+
+    async def classifier():
+        with tracer.span("analysis.intent"):
+            await asyncio.sleep(0.01)
+
+    with tracer.turn(7):
+        with tracer.span("node"):
+            # Tasks copy the context they're created in, so they land in the same trace
+            await asyncio.gather(asyncio.create_task(classifier()), tracer.traced("memory", asyncio.sleep(0.01)))
+    with tracer.turn(8):
+        tracer.record("turn", time.perf_counter() - 0.05)
+    tracer.close()
+
+    spans = {span["name"]: span for span in read_spans(filename)}
+    assert set(spans) == {"node", "analysis.intent", "memory", "turn"}
+    assert spans["node"]["traceId"] == tracer.trace_id(7)
+    assert spans["analysis.intent"]["traceId"] == spans["memory"]["traceId"] == tracer.trace_id(7)
+    assert spans["turn"]["traceId"] == tracer.trace_id(8)
+    assert spans["node"]["parentSpanId"] is None
+    assert spans["analysis.intent"]["parentSpanId"] == spans["node"]["spanId"]
+    assert spans["memory"]["parentSpanId"] == spans["node"]["spanId"]
+    assert spans["turn"]["endTimeUnixNano"] - spans["turn"]["startTimeUnixNano"] >= 50_000_000
+
+def test_record_from_another_thread_keeps_the_handed_over_trace(tmp_path):
+    filename = str(tmp_path / "traces.jsonl")
+    tracer = Tracer(filename, enabled=True)
+    with tracer.turn(3):
+        trace_id = tracer.current_turn()
+    tracer.record("tts.first_audio", time.perf_counter(), trace_id=trace_id)
+    tracer.close()
+    assert read_spans(filename)[0]["traceId"] == tracer.trace_id(3)
+
+def test_report_and_summary_give_percentiles_per_stage(tmp_path, capsys):
+    filename = str(tmp_path / "traces.jsonl")
+    tracer = Tracer(filename, enabled=True)
+    now = time.perf_counter()
+    for ms in range(1, 101):
+        tracer.record("llm.first_token", now - ms / 1000, now)
+    tracer.close()
+
+    durations = tracer.report()
+    assert len(durations["llm.first_token"]) == 100
+    output = capsys.readouterr().out
+    assert "llm.first_token" in output and "50ms" in output and "95ms" in output
+
+    assert sorted(round(ms) for ms in summarize(filename)["llm.first_token"]) == list(range(1, 101))
+
+def test_disabled_tracer_records_nothing(tmp_path):
+    tracer = Tracer()
+    with tracer.turn(1):
+        with tracer.span("node"):
+            tracer.record("turn", time.perf_counter())
+    assert tracer.report() == {}
@@ -0,0 +1,113 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import time
+import pytest
+from tts_backends import AudioPlayer, NullPlayer, OfflineSynthesisBackend, SpeechPipeline, SynthesisBackend
+
+SENTENCES = [
+    "Hi Lumi, I missed you so much today, how was the stream?",
+    "Great!",
+    "I want to hear everything about it.",
+    "Okay.",
+]
+
+def test_sentences_play_in_order_even_when_later_ones_synthesize_first():
+    # Long sentences take longer to synthesize, so the short ones after them finish first
+    player = NullPlayer()
+    speaker = SpeechPipeline(OfflineSynthesisBackend(delay_per_character=0.002), player, lookahead=3)
+    for sentence in SENTENCES:
+        speaker.submit(sentence)
+    assert speaker.wait(timeout=5)
+    speaker.close()
+    assert [text for text, _, _ in player.played] == SENTENCES
+
+def test_synthesis_overlaps_playback_without_gaps():
+    backend = OfflineSynthesisBackend(seconds_per_character=0.003, synthesis_delay=0.1)
+    player = NullPlayer(realtime=True)
+    speaker = SpeechPipeline(backend, player, lookahead=3)
+    start = time.perf_counter()
+    for sentence in SENTENCES:
+        speaker.submit(sentence)
+    assert speaker.wait(timeout=5)
+    elapsed = time.perf_counter() - start
+    speaker.close()
+
+    playing = sum(end - start for _, start, end in player.played)
+    # One synthesis up front, the rest are hidden behind playback
+    assert elapsed < 0.1 * 2 + playing  # Serially it would be 0.1 * len(SENTENCES) + playing
+    gaps = [next_start - end for (_, _, end), (_, next_start, _) in zip(player.played, player.played[1:])]
+    assert max(gaps) < 0.02
+
+def test_failed_sentence_is_skipped_and_idle_still_fires():
+    class FlakyBackend(SynthesisBackend):
+        def __init__(self):
+            self.offline = OfflineSynthesisBackend()
+
+        def synthesize(self, text):
+            if text == "Great!":
+                raise RuntimeError("Speech synthesis canceled")
+            return self.offline.synthesize(text)
+
+    idle = []
+    player = NullPlayer()
+    speaker = SpeechPipeline(FlakyBackend(), player, lookahead=2, on_idle=lambda: idle.append(True))
+    for sentence in SENTENCES:
+        speaker.submit(sentence)
+    assert speaker.wait(timeout=5)
+    speaker.close()
+    assert [text for text, _, _ in player.played] == [SENTENCES[0], SENTENCES[2], SENTENCES[3]]
+    assert idle
+
+def test_lookahead_bounds_synthesis_ahead_of_playback():
+    class CountingBackend(OfflineSynthesisBackend):
+        def __init__(self):
+            super().__init__(seconds_per_character=0.002)
+            self.started = 0
+
+        def synthesize(self, text):
+            self.started += 1
+            return super().synthesize(text)
+
+    backend = CountingBackend()
+    player = NullPlayer(realtime=True)
+    speaker = SpeechPipeline(backend, player, lookahead=2)
+    submitted = []
+    for i in range(8):
+        speaker.submit(f"Sentence number {i}.")
+        # submit() holds the caller once lookahead sentences are waiting behind the one playing
+        submitted.append(backend.started - len(player.played))
+    assert speaker.wait(timeout=5)
+    speaker.close()
+    assert max(submitted) <= 3
+    assert [text for text, _, _ in player.played] == [f"Sentence number {i}." for i in range(8)]
+
+def test_flush_cuts_off_speech_and_drops_what_was_queued():
+    player = NullPlayer(realtime=True)
+    speaker = SpeechPipeline(OfflineSynthesisBackend(seconds_per_character=0.02), player, lookahead=3)
+    epoch = speaker.epoch
+    for sentence in SENTENCES:
+        speaker.submit(sentence, epoch=epoch)
+    time.sleep(0.1)  # The first sentence is playing, the rest are synthesized and waiting
+    start = time.perf_counter()
+    assert speaker.flush() == len(SENTENCES) - 1
+    assert speaker.wait(timeout=1)
+    assert time.perf_counter() - start < 0.1
+    # Whoever was still handing over sentences from before the flush is turned away
+    assert not speaker.submit("Anyway, as I was saying.", epoch=epoch)
+    speaker.submit("Oh! What is it?")
+    assert speaker.wait(timeout=5)
+    speaker.close()
+    assert [text for text, _, _ in player.played] == [SENTENCES[0], "Oh! What is it?"]
+
+def test_incomplete_backend_and_player_fail_when_constructed():
+    class Silent(SynthesisBackend):
+        pass
+
+    class Deaf(AudioPlayer):
+        pass
+
+    with pytest.raises(TypeError):
+        Silent()
+    with pytest.raises(TypeError):
+        Deaf()
@@ -0,0 +1,66 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import asyncio
+import threading
+import pytest
+from turns import Turn, TurnQueue
+
+@pytest.mark.asyncio
+async def test_every_utterance_arrives_in_order():
+    turns = TurnQueue(asyncio.get_running_loop(), max_pending=2)
+    texts = ["Hi Bunny!", "Hi Bunny!", "How are you?", "Hi Bunny!", "Tell me a joke."]
+    # A recognizer thread firing faster than the main loop handles them, repeats included
+    thread = threading.Thread(target=lambda: [turns.put_threadsafe(Turn(text)) for text in texts])
+    thread.start()
+    received = []
+    for _ in texts:
+        turn = await turns.get()
+        received.append(turn.text)
+        await asyncio.sleep(0.01)
+    await asyncio.to_thread(thread.join)
+    assert received == texts
+
+@pytest.mark.asyncio
+async def test_full_queue_holds_the_recognizer_thread():
+    turns = TurnQueue(asyncio.get_running_loop(), max_pending=1)
+    done = threading.Event()
+
+    def recognizer():
+        turns.put_threadsafe(Turn("one"))
+        turns.put_threadsafe(Turn("two"))  # Waits here until "one" is taken
+        done.set()
+
+    thread = threading.Thread(target=recognizer)
+    thread.start()
+    await asyncio.sleep(0.05)
+    assert not done.is_set()
+    assert (await turns.get()).text == "one"
+    await asyncio.to_thread(done.wait, 1)
+    assert done.is_set()
+    assert (await turns.get()).text == "two"
+    await asyncio.to_thread(thread.join)
+
+@pytest.mark.asyncio
+async def test_put_gives_up_after_timeout():
+    turns = TurnQueue(asyncio.get_running_loop(), max_pending=1)
+    await turns.put(Turn("waiting"))
+    assert not await asyncio.to_thread(turns.put_threadsafe, Turn("late"), 0.05)
+
+@pytest.mark.asyncio
+async def test_turn_records_stage_timestamps():
+    turns = TurnQueue(asyncio.get_running_loop())
+    await asyncio.to_thread(turns.put_threadsafe, Turn("Hi"))
+    turn = await turns.get()
+    turn.mark("handled")
+    assert list(turn.timestamps) == ["recognized", "queued", "dequeued", "handled"]
+    assert list(turn.durations()) == ["queued", "dequeued", "handled"]
+    assert all(seconds >= 0 for seconds in turn.durations().values())
+
+@pytest.mark.asyncio
+async def test_close_wakes_the_reader():
+    turns = TurnQueue(asyncio.get_running_loop())
+    reader = asyncio.create_task(turns.get())
+    await asyncio.sleep(0)
+    await asyncio.to_thread(turns.close)
+    assert await asyncio.wait_for(reader, 1) is None
@@ -0,0 +1,83 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import threading
+import time
+from utterances import PRIORITY_HIGH, Utterance, UtteranceQueue
+
+def drain(utterances):
+    spoken = []
+    while not utterances.empty():
+        spoken.append(utterances.get(timeout=0).groups)
+    return spoken
+
+def test_repeated_sentences_are_all_kept_in_order():
+    # The same sentence in two replies is two utterances, nothing is deduplicated away
+    utterances = UtteranceQueue()
+    for groups in (["Yeah!"], ["Okay.", "Yeah!"], ["Yeah!"]):
+        assert utterances.put(Utterance(groups))
+    assert drain(utterances) == [["Yeah!"], ["Okay.", "Yeah!"], ["Yeah!"]]
+
+def test_sequence_numbers_increase():
+    first, second = Utterance(["One."]), Utterance(["Two."])
+    assert second.id > first.id
+
+def test_higher_priority_goes_first_and_interrupt_drops_lower():
+    utterances = UtteranceQueue()
+    utterances.put(Utterance(["Normal one."]))
+    utterances.put(Utterance(["Normal two."]))
+    utterances.put(Utterance(["Urgent."], PRIORITY_HIGH))
+    assert utterances.get(timeout=0).groups == ["Urgent."]
+
+    utterances.put(Utterance(["Right now!"], PRIORITY_HIGH), interrupt=True)
+    assert drain(utterances) == [["Right now!"]]
+
+def test_full_queue_holds_the_producer_until_there_is_room():
+    utterances = UtteranceQueue(max_pending=2)
+    assert utterances.put(Utterance(["One."]))
+    assert utterances.put(Utterance(["Two."]))
+    assert not utterances.put(Utterance(["Three."]), block=False)
+    assert not utterances.put(Utterance(["Three."]), timeout=0.01)
+    assert len(utterances) == 2
+
+    worker = threading.Timer(0.05, lambda: utterances.get(timeout=0))
+    worker.start()
+    start = time.perf_counter()
+    assert utterances.put(Utterance(["Three."]))
+    assert time.perf_counter() - start >= 0.04
+    worker.join()
+    # Nothing was dropped or folded into another utterance
+    assert drain(utterances) == [["Two."], ["Three."]]
+
+def test_close_releases_a_waiting_producer():
+    utterances = UtteranceQueue(max_pending=1)
+    utterances.put(Utterance(["One."]))
+    threading.Timer(0.02, utterances.close).start()
+    assert not utterances.put(Utterance(["Two."]))
+    assert not utterances.wait_for_room()
+
+def test_flush_and_close_wake_the_worker():
+    utterances = UtteranceQueue()
+    utterances.put(Utterance(["One."]))
+    utterances.put(Utterance(["Two."], PRIORITY_HIGH))
+    assert utterances.flush(below_priority=PRIORITY_HIGH) == 1
+    assert utterances.flush() == 1
+    assert utterances.get(timeout=0.01) is None
+
+    received = []
+    worker = threading.Thread(target=lambda: received.append(utterances.get()))
+    worker.start()
+    utterances.close()
+    worker.join(timeout=1)
+    assert not worker.is_alive() and received == [None]
+    assert not utterances.put(Utterance(["Too late."]))
+
+def test_idle_waits_for_the_worker_to_finish_what_it_took():
+    utterances = UtteranceQueue()
+    utterances.put(Utterance(["One."]))
+    assert not utterances.idle()
+    utterances.get(timeout=0)
+    # Out of the queue, but still being handed to the speaker
+    assert utterances.empty() and not utterances.idle()
+    utterances.task_done()
+    assert utterances.idle()
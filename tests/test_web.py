@@ -0,0 +1,54 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import json
+from flask import Flask
+from event_bus import EventBus
+from message_store import MessageStore
+from web import register_routes
+
+def make_client():
+    app = Flask(__name__)
+    bus = EventBus()
+    messages = MessageStore()
+    register_routes(app, bus, messages, "Lumi")
+    for i in range(3):
+        bus.publish({"type": "message", "role": "user", "user_id": "Lumi", "content": f"message {i}"})
+    return app.test_client(), bus
+
+def first_events(response, count):
+    chunks = response.response
+    events = [next(chunks).decode() for _ in range(count)]
+    response.close()
+    return events
+
+def test_stream_catches_up_from_the_since_parameter():
+    # What the page does on load, no Last-Event-ID header yet
+    client, bus = make_client()
+    response = client.get('/stream?since=1')
+    assert response.status_code == 200
+    events = first_events(response, 2)
+    assert events[0].startswith("id: 2\n") and json.loads(events[0].split("data: ")[1])["content"] == "message 1"
+    assert events[1].startswith("id: 3\n")
+
+def test_last_event_id_header_wins_over_since():
+    client, bus = make_client()
+    response = client.get('/stream?since=0', headers={'Last-Event-ID': '2'})
+    assert first_events(response, 1)[0].startswith("id: 3\n")
+
+def test_live_messages_after_catching_up_are_not_repeated():
+    client, bus = make_client()
+    response = client.get('/stream?since=2')
+    chunks = response.response
+    assert next(chunks).decode().startswith("id: 3\n")
+    bus.publish({"type": "message", "role": "assistant", "user_id": "Assistant", "content": "Hi Lumi!"})
+    assert next(chunks).decode() == "id: 4\n"
+    assert json.loads(next(chunks).decode().split("data: ")[1])["role"] == "Bunni Bot"
+    response.close()
+
+def test_messages_limit_is_clamped():
+    client, bus = make_client()
+    response = client.get('/messages?limit=-1')
+    assert response.status_code == 200
+    assert [message["content"] for message in response.get_json()] == ["message 2"]
+    assert len(client.get('/messages?limit=1000').get_json()) == 3
@@ -0,0 +1,41 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
+pipeline = pytest.importorskip("transformers").pipeline
+from zero_shot import ZeroShotEngine
+
+intent_labels = ["question", "statement", "command", "remember that"]
+categories = ["food", "music", "hobbies", "video_games", "projects", "streaming", "vtubing"]
+
+@pytest.fixture(scope="module")
+def classifier():
+    return pipeline(task="zero-shot-classification", model="facebook/bart-large-mnli")
+
+@pytest.fixture(scope="module")
+def engine(classifier):
+    engine = ZeroShotEngine(lambda: classifier)
+    engine.add_label_set("intent", intent_labels)
+    engine.add_label_set("category", categories, "This text is about {}.")
+    return engine
+
+@pytest.mark.parametrize("sentence", [
+    "I love pizza.",
+    "What are you doing today?",
+    "Remember that I'm allergic to peanuts.",
+    "I enjoy playing the piano.",
+    "I love watching Twitch streams.",
+])
+def test_matches_pipeline(classifier, engine, sentence):
+    result = engine([sentence])[0]
+    intent = classifier(sentence, intent_labels)
+    category = classifier(sentence, categories, hypothesis_template="This text is about {}.")
+    assert result["intent"]["labels"] == intent["labels"]
+    assert result["category"]["labels"] == category["labels"]
+    assert result["intent"]["scores"] == pytest.approx(intent["scores"], abs=1e-3)
+    assert result["category"]["scores"] == pytest.approx(category["scores"], abs=1e-3)
+
+def test_batch_with_repeats(engine):
+    results = engine(["I love pizza.", "Bunny!", "I love pizza."])
+    assert results[0] is results[2]
+    assert set(results[1]) == {"intent", "category"}
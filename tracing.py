@@ -0,0 +1,140 @@
+"""
+Description: Lightweight tracing of where each turn's time goes.
+Every turn gets a trace id that follows it through asyncio tasks (via contextvars), code wraps its
+stages in tracer.span("name"), and finished spans are written as JSON lines using OpenTelemetry's
+span field names (traceId, spanId, parentSpanId, startTimeUnixNano, ...).
+Turn it on with BNUUY_TRACE=1. Summarize a trace file with: python tracing.py .logs/traces_<date>.jsonl
+"""
+
+import contextlib
+import contextvars
+import json
+import math
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from messages import JsonlWriter
+
+current_trace = contextvars.ContextVar("current_trace", default=None)  # Trace id of the turn being handled
+current_span = contextvars.ContextVar("current_span", default=None)
+
+def percentile(values, fraction):
+    # Nearest rank, the smallest value that at least this fraction of values are at or below
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+def print_summary(durations):
+    print(f"{'stage':<24} {'count':>6} {'p50':>9} {'p95':>9}")
+    for name, values in sorted(durations.items()):
+        print(f"{name:<24} {len(values):>6} {percentile(values, 0.5):7.0f}ms {percentile(values, 0.95):7.0f}ms")
+
+class Tracer:
+    def __init__(self, filename=None, enabled=False):
+        self.writer = None
+        self.enabled = False
+        self.session = os.urandom(8).hex()
+        self.durations = defaultdict(list)  # Span name -> milliseconds, for report()
+        self.lock = threading.Lock()
+        # perf_counter is what the rest of the app times with, this turns it into wall clock time
+        self.epoch_offset = time.time() - time.perf_counter()
+        self.configure(filename, enabled)
+
+    def configure(self, filename=None, enabled=True):
+        self.close()
+        self.enabled = enabled
+        if enabled and filename:
+            os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+            self.writer = JsonlWriter(filename)
+
+    def trace_id(self, turn_id):
+        return f"{self.session}{turn_id:016x}"
+
+    @contextlib.contextmanager
+    def turn(self, turn_id):
+        """Everything started inside this block, including asyncio tasks, belongs to turn_id's trace."""
+        token = current_trace.set(self.trace_id(turn_id))
+        try:
+            yield
+        finally:
+            current_trace.reset(token)
+
+    def current_turn(self):
+        return current_trace.get()
+
+    @contextlib.contextmanager
+    def span(self, name, **attributes):
+        if not self.enabled:
+            yield
+            return
+        span_id = os.urandom(8).hex()
+        parent = current_span.get()
+        token = current_span.set(span_id)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            current_span.reset(token)
+            self.export(name, start, time.perf_counter(), current_trace.get(), span_id, parent, attributes)
+
+    async def traced(self, name, awaitable, **attributes):
+        # For wrapping a coroutine before it's handed to asyncio.create_task
+        with self.span(name, **attributes):
+            return await awaitable
+
+    def record(self, name, start, end=None, trace_id=None, **attributes):
+        """A span that was timed elsewhere, start and end are perf_counter values."""
+        if not self.enabled:
+            return
+        end = time.perf_counter() if end is None else end
+        self.export(name, start, end, trace_id or current_trace.get(), os.urandom(8).hex(), current_span.get(), attributes)
+
+    def export(self, name, start, end, trace_id, span_id, parent, attributes):
+        with self.lock:
+            self.durations[name].append((end - start) * 1000)
+        if self.writer:
+            self.writer.write({
+                "traceId": trace_id,
+                "spanId": span_id,
+                "parentSpanId": parent,
+                "name": name,
+                "startTimeUnixNano": int((start + self.epoch_offset) * 1e9),
+                "endTimeUnixNano": int((end + self.epoch_offset) * 1e9),
+                "attributes": attributes,
+            })
+
+    def report(self):
+        """p50 / p95 of every stage traced so far."""
+        with self.lock:
+            durations = {name: list(values) for name, values in self.durations.items()}
+        if durations:
+            print("Turn latency by stage:")
+            print_summary(durations)
+        return durations
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+
+# Shared by everything, main switches it on
+tracer = Tracer()
+
+def summarize(filename):
+    durations = defaultdict(list)
+    with open(filename, encoding="utf-8") as f:
+        for line in f:
+            try:
+                span = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            durations[span["name"]].append((span["endTimeUnixNano"] - span["startTimeUnixNano"]) / 1e6)
+    print_summary(durations)
+    return durations
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python tracing.py <traces.jsonl>")
+        sys.exit(1)
+    summarize(sys.argv[1])
@@ -0,0 +1,273 @@
+"""
+Description: Pipelined TTS. Sentences are synthesized into in-memory audio on a few worker threads while
+the sentence before them is still playing, and a single playback thread plays them strictly in order
+through one open audio stream, so there are no gaps between sentences.
+The synthesis backend and the audio player are pluggable: Azure + PyAudio for the bot, an offline tone
+generator + a null player for tests and benchmarks.
+"""
+
+import os
+import queue
+import threading
+import time
+from abc import ABC, abstractmethod
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from tracing import tracer
+
+class AudioClip:
+    # Raw PCM for one sentence
+    __slots__ = ("pcm", "sample_rate", "channels", "sample_width", "text")
+
+    def __init__(self, pcm, sample_rate, channels=1, sample_width=2, text=""):
+        self.pcm = pcm
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.sample_width = sample_width
+        self.text = text
+
+    @property
+    def duration(self):
+        return len(self.pcm) / (self.sample_rate * self.channels * self.sample_width)
+
+class SynthesisBackend(ABC):
+    # Turns text into an AudioClip without playing it. Called from several threads at once.
+    @abstractmethod
+    def synthesize(self, text):
+        """The AudioClip for text, raises if synthesis fails."""
+
+class AzureSynthesisBackend(SynthesisBackend):
+    def __init__(self, voice_name=None, pitch_percentage=None):
+        # Only imported when used, the offline backend doesn't need the Speech SDK installed
+        import azure.cognitiveservices.speech as speechsdk
+        from azure_ai import build_ssml, VOICE_NAME, PITCH_PERCENTAGE
+        self.speechsdk = speechsdk
+        self.build_ssml = build_ssml
+        self.voice_name = voice_name or VOICE_NAME
+        self.pitch_percentage = pitch_percentage or PITCH_PERCENTAGE
+        self.sample_rate = 24000
+        # This class requires environment variables named "SPEECH_KEY" and "SPEECH_REGION"
+        self.speech_config = speechsdk.SpeechConfig(subscription=os.environ.get('SPEECH_KEY'), region=os.environ.get('SPEECH_REGION'))
+        self.speech_config.speech_synthesis_voice_name = self.voice_name
+        self.speech_config.set_speech_synthesis_output_format(speechsdk.SpeechSynthesisOutputFormat.Raw24Khz16BitMonoPcm)
+        self.local = threading.local()
+
+    def synthesizer(self):
+        # One per synthesis thread, a synthesizer works through its requests one at a time
+        if getattr(self.local, "synthesizer", None) is None:
+            # No audio config keeps the audio in result.audio_data instead of playing it on the speakers
+            self.local.synthesizer = self.speechsdk.SpeechSynthesizer(speech_config=self.speech_config, audio_config=None)
+        return self.local.synthesizer
+
+    def synthesize(self, text):
+        speechsdk = self.speechsdk
+        result = self.synthesizer().speak_ssml_async(self.build_ssml(text, self.voice_name, self.pitch_percentage)).get()
+        if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
+            return AudioClip(result.audio_data, self.sample_rate, text=text)
+        message = f"Speech synthesis canceled: {result.cancellation_details.reason}"
+        if result.cancellation_details.reason == speechsdk.CancellationReason.Error and result.cancellation_details.error_details:
+            message += f". Error details: {result.cancellation_details.error_details}. Did you set the speech resource key and region values?"
+        raise RuntimeError(message)
+
+class OfflineSynthesisBackend(SynthesisBackend):
+    # A quiet tone as long as the text would take to say. Takes synthesis_delay + delay_per_character * len(text) seconds to "synthesize".
+    def __init__(self, seconds_per_character=0.06, synthesis_delay=0.0, delay_per_character=0.0, sample_rate=16000):
+        self.seconds_per_character = seconds_per_character
+        self.synthesis_delay = synthesis_delay
+        self.delay_per_character = delay_per_character
+        self.sample_rate = sample_rate
+
+    def synthesize(self, text):
+        time.sleep(self.synthesis_delay + self.delay_per_character * len(text))
+        t = np.arange(int(len(text) * self.seconds_per_character * self.sample_rate)) / self.sample_rate
+        pcm = (0.1 * np.sin(2 * np.pi * 440 * t) * 32767).astype(np.int16).tobytes()
+        return AudioClip(pcm, self.sample_rate, text=text)
+
+class AudioPlayer(ABC):
+    # Plays clips one after another, play() returns once the clip has been handed to the output.
+    # stop() is called from another thread and cuts the clip that's playing short.
+    @abstractmethod
+    def play(self, clip):
+        """Plays clip, returns once it's been handed to the output or stop() cut it short."""
+
+    def stop(self):
+        pass
+
+    def close(self):
+        pass
+
+class PyAudioPlayer(AudioPlayer):
+    def __init__(self):
+        import pyaudio
+        self.audio = pyaudio.PyAudio()
+        self.stream = None
+        self.format = None
+        self.stopping = threading.Event()
+
+    def play(self, clip):
+        # The stream stays open between clips, writing the next one straight after the last is what makes playback gapless
+        self.stopping.clear()
+        format = (clip.sample_rate, clip.channels, clip.sample_width)
+        if format != self.format:
+            self.close_stream()
+            self.stream = self.audio.open(format=self.audio.get_format_from_width(clip.sample_width),
+                                          channels=clip.channels, rate=clip.sample_rate, output=True)
+            self.format = format
+        # Written a tenth of a second at a time so stop() can cut in
+        chunk = clip.sample_rate // 10 * clip.channels * clip.sample_width
+        for start in range(0, len(clip.pcm), chunk):
+            if self.stopping.is_set():
+                break
+            self.stream.write(clip.pcm[start:start + chunk])
+
+    def stop(self):
+        self.stopping.set()
+
+    def close_stream(self):
+        if self.stream is not None:
+            self.stream.stop_stream()  # Lets whatever is still buffered finish playing
+            self.stream.close()
+            self.stream = None
+            self.format = None
+
+    def close(self):
+        self.close_stream()
+        self.audio.terminate()
+
+class NullPlayer(AudioPlayer):
+    # Drops the audio. realtime=True takes as long as the clip would to play.
+    def __init__(self, realtime=False):
+        self.realtime = realtime
+        self.played = []  # (text, start, end) perf_counter times
+        self.stopping = threading.Event()
+
+    def play(self, clip):
+        self.stopping.clear()
+        start = time.perf_counter()
+        if self.realtime:
+            self.stopping.wait(clip.duration)
+        self.played.append((clip.text, start, time.perf_counter()))
+
+    def stop(self):
+        self.stopping.set()
+
+class SpeechPipeline:
+    def __init__(self, backend, player, lookahead=3, on_idle=None):
+        self.backend = backend
+        self.player = player
+        self.on_idle = on_idle  # Called on the playback thread when everything submitted has been played
+        # Up to lookahead sentences are synthesized ahead of the one playing, submit() waits for room after that
+        self.slots = threading.Semaphore(lookahead + 1)
+        self.executor = ThreadPoolExecutor(max_workers=lookahead, thread_name_prefix="tts-synthesis")
+        self.queue = queue.Queue()
+        self.pending = 0
+        self.epoch = 0  # Bumped by flush(), anything submitted before that is dropped
+        self.idle = threading.Condition()
+        self.thread = threading.Thread(target=self.playback_worker, daemon=True)
+        self.thread.start()
+
+    def submit(self, text, started_at=None, trace_id=None, epoch=None):
+        """Speaks text after everything submitted before it. started_at (perf_counter) logs time to first spoken word.
+        epoch is self.epoch from when the caller started, returns False without queueing anything if there's been a flush() since."""
+        epoch = self.epoch if epoch is None else epoch
+        self.slots.acquire()
+        with self.idle:
+            if epoch != self.epoch:
+                self.slots.release()
+                return False
+            self.pending += 1
+        future = self.executor.submit(self.synthesize, text, trace_id)
+        self.queue.put((text, future, started_at, trace_id, epoch))
+        return True
+
+    def synthesize(self, text, trace_id):
+        start = time.perf_counter()
+        clip = self.backend.synthesize(text)
+        tracer.record("tts.synthesis", start, trace_id=trace_id, characters=len(text))
+        return clip
+
+    def playback_worker(self):
+        while True:
+            item = self.queue.get()
+            if item is None:  # Exit signal
+                break
+            text, future, started_at, trace_id, epoch = item
+            try:
+                clip = future.result()
+            except Exception as e:
+                if epoch == self.epoch:
+                    print(f"Error synthesizing [{text}]: {e}")
+                clip = None
+            if clip is not None and epoch == self.epoch:
+                if started_at is not None:
+                    print(f"[metrics] Time to first spoken word: {time.perf_counter() - started_at:.2f}s")
+                    tracer.record("tts.first_audio", started_at, trace_id=trace_id)
+                print("Speech synthesized for text [{}]".format(text))
+                start = time.perf_counter()
+                try:
+                    self.player.play(clip)
+                except Exception as e:
+                    print(f"Error playing audio: {e}")
+                tracer.record("tts.playback", start, trace_id=trace_id)
+            self.slots.release()
+            with self.idle:
+                self.pending -= 1
+                idle = self.pending == 0
+                if idle:
+                    self.idle.notify_all()
+            if idle and self.on_idle:
+                self.on_idle()
+
+    def flush(self):
+        """Drops everything that hasn't been played yet and cuts off the sentence that's playing. Returns how many sentences were dropped."""
+        with self.idle:
+            self.epoch += 1
+        dropped = 0
+        items = []
+        while True:
+            try:
+                items.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        for item in items:
+            if item is None:
+                self.queue.put(None)  # Keep the exit signal
+                continue
+            item[1].cancel()
+            self.slots.release()
+            dropped += 1
+        with self.idle:
+            self.pending -= dropped
+            if self.pending == 0:
+                self.idle.notify_all()
+        self.player.stop()
+        return dropped
+
+    def wait(self, timeout=None):
+        """Blocks until everything submitted so far has been played. False if timeout ran out first."""
+        with self.idle:
+            return self.idle.wait_for(lambda: self.pending == 0, timeout)
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.player.close()
+
+def get_synthesis_backend(name=None):
+    """BNUUY_TTS_BACKEND is "azure" (default) or "offline"."""
+    name = name or os.getenv("BNUUY_TTS_BACKEND", "azure")
+    if name == "azure":
+        return AzureSynthesisBackend()
+    if name == "offline":
+        return OfflineSynthesisBackend()
+    raise ValueError(f"Unknown TTS backend '{name}', expected azure or offline")
+
+def get_player(name=None):
+    """BNUUY_AUDIO_PLAYER is "pyaudio" (default) or "null"."""
+    name = name or os.getenv("BNUUY_AUDIO_PLAYER", "pyaudio")
+    if name == "pyaudio":
+        return PyAudioPlayer()
+    if name == "null":
+        return NullPlayer(realtime=True)
+    raise ValueError(f"Unknown audio player '{name}', expected pyaudio or null")
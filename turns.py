@@ -0,0 +1,75 @@
+"""
+Description: Hands finished transcriptions from the Azure recognizer thread to the asyncio main loop.
+Every utterance becomes a Turn that's delivered in order, and the recognizer thread waits when
+max_pending turns are already queued instead of dropping any.
+"""
+
+import asyncio
+import concurrent.futures
+import itertools
+import time
+
+turn_ids = itertools.count(1)
+
+class Turn:
+    # One utterance on its way through the bot, with a perf_counter timestamp for each stage it reached
+    def __init__(self, text, recognized_at=None):
+        self.id = next(turn_ids)
+        self.text = text
+        self.timestamps = {"recognized": recognized_at if recognized_at is not None else time.perf_counter()}
+
+    def mark(self, stage):
+        self.timestamps[stage] = time.perf_counter()
+
+    def durations(self):
+        # Seconds spent getting to each stage from the one before it
+        stages = list(self.timestamps.items())
+        return {stage: at - stages[i][1] for i, (stage, at) in enumerate(stages[1:])}
+
+    def report(self):
+        steps = ", ".join(f"{stage} +{seconds * 1000:.0f}ms" for stage, seconds in self.durations().items())
+        print(f"[metrics] Turn {self.id}: {steps}")
+
+    def __repr__(self):
+        return f"Turn({self.id}, {self.text!r})"
+
+class TurnQueue:
+    def __init__(self, loop, max_pending=8):
+        self.loop = loop
+        self.queue = asyncio.Queue(max_pending)
+
+    def put_threadsafe(self, turn, timeout=None):
+        """Called from another thread. Blocks while the queue is full, returns False if the turn couldn't be queued."""
+        try:
+            future = asyncio.run_coroutine_threadsafe(self.put(turn), self.loop)
+        except RuntimeError as e:
+            print(f"Dropped {turn}, the main loop is gone: {e}")
+            return False
+        try:
+            future.result(timeout)
+            return True
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            print(f"Dropped {turn}, still waiting on {self.queue.qsize()} earlier turns.")
+            return False
+
+    async def put(self, turn):
+        if self.queue.full():
+            print(f"{self.queue.qsize()} turns waiting, holding the recognizer until one is done...")
+        await self.queue.put(turn)
+        if turn is not None:
+            turn.mark("queued")
+
+    async def get(self):
+        """The next Turn, or None once the queue has been closed."""
+        turn = await self.queue.get()
+        if turn is not None:
+            turn.mark("dequeued")
+        return turn
+
+    def close(self):
+        # Wakes up whoever is waiting in get(), doesn't wait for room in the queue
+        try:
+            asyncio.run_coroutine_threadsafe(self.put(None), self.loop)
+        except RuntimeError:
+            pass
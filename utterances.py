@@ -0,0 +1,114 @@
+"""
+Description: What the bot is waiting to say. Each reply (or each streamed piece of one) goes in as a
+single Utterance with a sequence number, and the TTS worker takes them out highest priority first,
+in order within a priority. The queue is bounded and put() waits for room once it's full. flush() drops
+whatever hasn't been spoken yet, which is what barge-in uses when the user starts talking over the bot.
+"""
+
+import heapq
+import itertools
+import threading
+
+utterance_ids = itertools.count(1)
+
+PRIORITY_NORMAL = 0
+PRIORITY_HIGH = 1
+
+class Utterance:
+    # Sentence groups to speak in order. reply is the reply's start time, shared by every streamed piece of it.
+    __slots__ = ("id", "groups", "priority", "reply", "first", "trace_id")
+
+    def __init__(self, groups, priority=PRIORITY_NORMAL, reply=None, first=False, trace_id=None):
+        self.id = next(utterance_ids)
+        self.groups = list(groups)
+        self.priority = priority
+        self.reply = reply
+        self.first = first  # The first piece of its reply, carries the time to first spoken word
+        self.trace_id = trace_id
+
+    def __repr__(self):
+        return f"Utterance({self.id}, {self.groups!r})"
+
+class UtteranceQueue:
+    def __init__(self, max_pending=32):
+        self.max_pending = max_pending
+        self.heap = []  # (-priority, id, utterance)
+        self.taken = 0  # Handed to the worker by get() and not marked task_done() yet
+        self.condition = threading.Condition()
+        self.closed = False
+
+    def put(self, utterance, interrupt=False, block=True, timeout=None):
+        """Queues utterance, interrupt=True first drops everything pending below its priority.
+        Once max_pending utterances are waiting, blocks until the worker takes one (or timeout runs out) so whoever
+        is producing them slows down to the speed of speech. Returns False if it wasn't queued: closed, or still full."""
+        with self.condition:
+            if interrupt and not self.closed:
+                self.drop(lambda pending: pending.priority < utterance.priority)
+            if block and not self.condition.wait_for(self.has_room, timeout):
+                return False
+            if self.closed or len(self.heap) >= self.max_pending:
+                return False
+            heapq.heappush(self.heap, (-utterance.priority, utterance.id, utterance))
+            self.condition.notify_all()
+            return True
+
+    def has_room(self):
+        # Also true once closed, so nobody keeps waiting for room that will never come
+        return self.closed or len(self.heap) < self.max_pending
+
+    def wait_for_room(self, timeout=None):
+        """Blocks until put() wouldn't have to. False if the queue was closed or timeout ran out first."""
+        with self.condition:
+            return self.condition.wait_for(self.has_room, timeout) and not self.closed
+
+    def get(self, timeout=None):
+        """The next utterance, or None on timeout or once the queue has been closed."""
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.heap or self.closed, timeout):
+                return None
+            if not self.heap:
+                return None
+            self.taken += 1
+            utterance = heapq.heappop(self.heap)[2]
+            self.condition.notify_all()  # Producers waiting for room, the worker and producers share the condition
+            return utterance
+
+    def task_done(self):
+        """Called by the worker once it has finished with an utterance from get()."""
+        with self.condition:
+            self.taken -= 1
+
+    def idle(self):
+        """Nothing waiting and nothing still being handed over by the worker."""
+        with self.condition:
+            return not self.heap and not self.taken
+
+    def flush(self, below_priority=None):
+        """Drops pending utterances, only those below below_priority if it's given. Returns how many were dropped."""
+        with self.condition:
+            if below_priority is None:
+                return self.drop(lambda pending: True)
+            return self.drop(lambda pending: pending.priority < below_priority)
+
+    def drop(self, condition):
+        kept = [entry for entry in self.heap if not condition(entry[2])]
+        dropped = len(self.heap) - len(kept)
+        if dropped:
+            heapq.heapify(kept)
+            self.heap = kept
+            self.condition.notify_all()
+        return dropped
+
+    def empty(self):
+        with self.condition:
+            return not self.heap
+
+    def __len__(self):
+        with self.condition:
+            return len(self.heap)
+
+    def close(self):
+        # Wakes up the worker waiting in get()
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
@@ -0,0 +1,82 @@
+"""
+Description: The Flask routes for the web UI. Chat messages come from the MessageStore, live messages
+and reply tokens are pushed to the page over Server-Sent Events from the event bus.
+"""
+
+import json
+import queue
+from flask import Response, request, jsonify, render_template
+
+def register_routes(app, bus, messages, user_id):
+    def to_display(event):
+        # Change roles to display names
+        display = dict(event)
+        if display['role'] == 'user':
+            display['role'] = user_id
+        elif display['role'] == 'assistant':
+            display['role'] = 'Bunni Bot'
+        return display
+
+    def store_message(event):
+        # Runs before the stream subscribers see the event, so the ID set here goes out with it
+        if event['type'] == 'message':
+            event['id'] = messages.add(to_display(event))['id']
+
+    bus.add_listener(store_message)
+
+    @app.route('/')
+    def index():
+        print(request.form.getlist("timer"))
+        return render_template('index.html')
+
+    @app.route('/messages', methods=['GET'])
+    def get_messages():
+        # ?since=<id> returns only newer messages, without it the latest ones. ?limit=N caps the page size.
+        since = request.args.get('since', type=int)
+        limit = max(1, min(request.args.get('limit', 100, type=int), 500))
+        etag = f"{messages.etag()}-{since}-{limit}"
+        if etag in request.if_none_match:
+            return Response(status=304, headers={'ETag': f'"{etag}"'})
+        response = jsonify(messages.since(since, limit))
+        response.set_etag(etag)
+        return response
+
+    @app.route('/messages', methods=['POST'])
+    def post_message():
+        # Still here for anything outside the app that wants to post to the chat
+        data = request.json
+        data.setdefault('type', 'message')
+        bus.publish(data)
+        return jsonify(to_display(data)), 201
+
+    @app.route('/stream')
+    def stream():
+        # Server-Sent Events, pushes each new message and reply token as it happens
+        # Reconnecting browsers send Last-Event-ID, the page passes ?since= on its first connect
+        # Werkzeug hands back the default as is when the header is missing, so ?since= is converted on its own first
+        since = request.headers.get('Last-Event-ID', request.args.get('since', type=int), type=int)
+
+        def events():
+            subscription = bus.subscribe()
+            try:
+                # Catch up on anything missed first, subscribing before this means nothing falls in between
+                last_id = since
+                if since is not None:
+                    for message in messages.since(since, limit=500):
+                        last_id = message['id']
+                        yield f"id: {message['id']}\nevent: message\ndata: {json.dumps(message)}\n\n"
+                while True:
+                    try:
+                        event = subscription.get(timeout=15)
+                    except queue.Empty:
+                        yield ": keep-alive\n\n"
+                        continue
+                    if 'id' in event:
+                        if last_id is not None and event['id'] <= last_id:
+                            continue  # Already sent while catching up
+                        yield f"id: {event['id']}\n"
+                    yield f"event: {event['type']}\ndata: {json.dumps(to_display(event))}\n\n"
+            finally:
+                bus.unsubscribe(subscription)
+
+        return Response(events(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
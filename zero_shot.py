@@ -0,0 +1,156 @@
+"""
+Description: Zero-shot classification that scores several label sets against the same text in one NLI pass.
+Used so intent and preference categories don't each send the utterance through bart-large-mnli.
+torch is imported inside the methods that need it, the models it runs on are loaded lazily anyway.
+"""
+
+import threading
+from collections import OrderedDict
+
+class ZeroShotEngine:
+    def __init__(self, load_classifier, cache_size=128, max_pairs_per_pass=64):
+        # Reuses the model and tokenizer of the zero-shot pipeline, which only gets loaded on first use.
+        self.load_classifier = load_classifier
+        self.model = None
+        self.tokenizer = None
+        self.entailment_id = None
+        self.max_pairs_per_pass = max_pairs_per_pass
+        self.cache_size = cache_size
+        self.label_sets = {}
+        self.hypotheses = None  # (label set name, label, hypothesis token ids), tokenized on first use
+        self.premise_cache = OrderedDict()  # premise text -> token ids
+        self.result_cache = OrderedDict()  # premise text -> results for every label set
+        self.lock = threading.Lock()  # The inference service may call in from more than one worker thread
+
+    def add_label_set(self, name, labels, hypothesis_template="This example is {}."):
+        with self.lock:
+            self.label_sets[name] = (list(labels), hypothesis_template)
+            self.hypotheses = None
+            self.result_cache.clear()
+
+    def prepare(self):
+        if self.model is None:
+            classifier = self.load_classifier()
+            self.model = classifier.model
+            self.tokenizer = classifier.tokenizer
+            self.entailment_id = classifier.entailment_id
+        if self.hypotheses is None:
+            # Hypotheses only change when a label set is added, so they aren't tokenized on every call.
+            self.hypotheses = [
+                (set_name, label, self.tokenizer.encode(template.format(label), add_special_tokens=False))
+                for set_name, (set_labels, template) in self.label_sets.items()
+                for label in set_labels
+            ]
+
+    def __call__(self, texts):
+        # Takes a batch of premises, returns {label set name: {"labels": [...], "scores": [...]}} for each one.
+        with self.lock:
+            self.prepare()
+            missing = [text for text in dict.fromkeys(texts) if text not in self.result_cache]
+            if missing:
+                self.score(missing)
+            return [self.result_cache[text] for text in texts]
+
+    def score(self, premises):
+        import torch
+        pairs = [
+            self.tokenizer.build_inputs_with_special_tokens(self.encode_premise(premise, hypothesis_ids), hypothesis_ids)
+            for premise in premises
+            for _, _, hypothesis_ids in self.hypotheses
+        ]
+        entailment = []
+        for start in range(0, len(pairs), self.max_pairs_per_pass):
+            entailment.append(self.forward(pairs[start:start + self.max_pairs_per_pass]))
+        entailment = torch.cat(entailment).view(len(premises), len(self.hypotheses))
+
+        for premise, logits in zip(premises, entailment):
+            results = {}
+            offset = 0
+            for name, (labels, _) in self.label_sets.items():
+                # Same as the pipeline with multi_label=False: softmax of the entailment logits within the label set.
+                scores = logits[offset:offset + len(labels)].softmax(dim=0).tolist()
+                ranked = sorted(zip(labels, scores), key=lambda pair: pair[1], reverse=True)
+                results[name] = {
+                    "sequence": premise,
+                    "labels": [label for label, _ in ranked],
+                    "scores": [score for _, score in ranked],
+                }
+                offset += len(labels)
+            self.remember(self.result_cache, premise, results)
+
+    def encode_premise(self, premise, hypothesis_ids):
+        premise_ids = self.premise_cache.get(premise)
+        if premise_ids is None:
+            premise_ids = self.tokenizer.encode(premise, add_special_tokens=False)
+            self.remember(self.premise_cache, premise, premise_ids)
+        # Truncate the premise, never the hypothesis, like truncation="only_first" in the pipeline.
+        room = self.tokenizer.model_max_length - len(hypothesis_ids) - self.tokenizer.num_special_tokens_to_add(pair=True)
+        return premise_ids[:room]
+
+    def forward(self, pairs):
+        import torch
+        longest = max(len(ids) for ids in pairs)
+        pad_id = self.tokenizer.pad_token_id
+        input_ids = torch.tensor([ids + [pad_id] * (longest - len(ids)) for ids in pairs], device=self.model.device)
+        attention_mask = torch.tensor([[1] * len(ids) + [0] * (longest - len(ids)) for ids in pairs], device=self.model.device)
+        with torch.no_grad():
+            logits = self.model(input_ids=input_ids, attention_mask=attention_mask).logits
+        return logits[:, self.entailment_id].float().cpu()
+
+    def remember(self, cache, key, value):
+        cache[key] = value
+        cache.move_to_end(key)
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False)
+
+class EmbeddingClassifier:
+    # Fast path for the same label sets: cosine similarity between the text and precomputed label prototypes,
+    # using the MiniLM embedder that is already loaded. Results that aren't confident get sent to the NLI model.
+    def __init__(self, load_embedder, temperature=0.05, min_similarity=0.3, min_confidence=0.6):
+        self.load_embedder = load_embedder
+        self.embedder = None
+        self.temperature = temperature  # Turns cosine similarities into softmax scores comparable to the NLI ones
+        self.min_similarity = min_similarity
+        self.min_confidence = min_confidence
+        self.label_sets = {}  # name -> (labels, hypothesis template, examples)
+        self.prototypes = {}  # name -> (labels, normalized prototype matrix), built on first use
+        self.lock = threading.Lock()
+
+    def add_label_set(self, name, labels, hypothesis_template="This example is {}.", examples=None):
+        with self.lock:
+            self.label_sets[name] = (list(labels), hypothesis_template, examples or {})
+            self.prototypes.pop(name, None)
+
+    def prepare(self):
+        import torch
+        if self.embedder is None:
+            self.embedder = self.load_embedder()
+        for name, (labels, hypothesis_template, examples) in self.label_sets.items():
+            if name in self.prototypes:
+                continue
+            # Each label's prototype is the mean embedding of its hypothesis and any example sentences.
+            prototypes = []
+            for label in labels:
+                texts = [hypothesis_template.format(label)] + list(examples.get(label, []))
+                embeddings = self.embedder.encode(texts, convert_to_tensor=True, normalize_embeddings=True).float()
+                prototypes.append(torch.nn.functional.normalize(embeddings.mean(dim=0), dim=0))
+            self.prototypes[name] = (labels, torch.stack(prototypes))
+
+    def __call__(self, texts):
+        with self.lock:
+            self.prepare()
+            label_sets = list(self.prototypes.items())
+        embeddings = self.embedder.encode(texts, convert_to_tensor=True, normalize_embeddings=True).float()
+        results = [{} for _ in texts]
+        for name, (labels, prototypes) in label_sets:
+            similarities = embeddings @ prototypes.to(embeddings.device).T
+            scores = (similarities / self.temperature).softmax(dim=1)
+            for text, result, similarity, score in zip(texts, results, similarities.tolist(), scores.tolist()):
+                ranked = sorted(zip(labels, score, similarity), key=lambda item: item[1], reverse=True)
+                result[name] = {
+                    "sequence": text,
+                    "labels": [label for label, _, _ in ranked],
+                    "scores": [score for _, score, _ in ranked],
+                    "confident": ranked[0][2] >= self.min_similarity and ranked[0][1] >= self.min_confidence,
+                }
+        return results